@@ -1,23 +1,11 @@
 import os
 from langchain_community.vectorstores.neo4j_vector import Neo4jVector
 from langchain.document_loaders import WikipediaLoader
-from langchain_openai import AzureOpenAIEmbeddings
 from langchain.text_splitter import CharacterTextSplitter
 from langchain.docstore.document import Document
-from langchain_community.graphs import Neo4jGraph
-
-def clean_graph(graph):
-    graph = Neo4jGraph(
-        url=os.getenv("NEO4J_URL"),
-        username=os.getenv("NEO4J_USERNAME"),
-        password=os.getenv("NEO4J_PASSWORD"),
-        refresh_schema=False
-    )
-    query = """
-    MATCH (n)
-    DETACH DELETE n
-    """
-    graph.query(query)
+from graphdemo.common import get_embeddings, get_graph
+from graphdemo.dedup import deduplicate, link_duplicates
+from graphdemo.incremental import fingerprint_documents, plan_sync, remove_stale
 
 # Read the wikipedia article
 raw_documents = WikipediaLoader(query="The Witcher").load()
@@ -30,28 +18,32 @@ text_splitter = CharacterTextSplitter.from_tiktoken_encoder(
 documents = text_splitter.split_documents(raw_documents)
 for d in documents:
     del d.metadata["summary"]
+documents = fingerprint_documents(documents)
+
+# Vectors are cached locally by text, so rebuilding over unchanged text needs no API calls
+embeddings = get_embeddings()
 
-url=os.getenv("NEO4J_URL")
-username=os.getenv("NEO4J_USERNAME")
-password=os.getenv("NEO4J_PASSWORD")
-azure_endpoint: str = os.getenv("AZURE_OPENAI_BASE")
-api_key = os.getenv("AZURE_OPENAI_API_KEY")
-api_version: str = os.getenv("AZURE_OPENAI_API_VERSION")
-azure_embedding_deployment : str = os.getenv("AZURE_OPENAI_EMBEDDING_MODEL")
+# Only chunks that are not already stored get embedded, chunks gone from the article are removed
+graph = get_graph()
+plan = plan_sync(graph, documents, label="WikipediaArticle")
+print(plan)
+remove_stale(graph, plan.stale, label="WikipediaArticle")
+# Near-identical chunks are embedded once and share the vector
+representatives, duplicates = deduplicate(plan.new)
 
+# Every store below reuses the pooled driver of graph instead of opening its own
 neo4j_db = Neo4jVector.from_documents(
-    documents,
-    AzureOpenAIEmbeddings(azure_endpoint=azure_endpoint, api_key=api_key, azure_deployment=azure_embedding_deployment),
-    url=url,
-    username=username,
-    password=password,
-    database="neo4j",  # neo4j by default
+    representatives,
+    embeddings,
+    graph=graph,
     index_name="wikipedia",  # vector by default
     node_label="WikipediaArticle",  # Chunk by default
     text_node_property="info",  # text by default
     embedding_node_property="vector",  # embedding by default
     create_id_index=True,  # True by default
+    ids=[d.metadata["id"] for d in representatives],
 )
+link_duplicates(graph, duplicates, label="WikipediaArticle", text_node_property="info", embedding_node_property="vector")
 
 neo4j_db.query("SHOW CONSTRAINTS")
 
@@ -73,10 +65,8 @@ neo4j_db.add_documents(
 )
 
 existing_index = Neo4jVector.from_existing_index(
-    AzureOpenAIEmbeddings(azure_endpoint=azure_endpoint, api_key=api_key, azure_deployment=azure_embedding_deployment),
-    url=url,
-    username=username,
-    password=password,
+    embeddings,
+    graph=graph,
     index_name="wikipedia",
     text_node_property="info",  # Need to define if it is not default
 )
@@ -1,24 +1,17 @@
-from langchain_openai import AzureChatOpenAI
 from langchain_community.chains.graph_qa.cypher import GraphCypherQAChain
-from langchain.graphs import Neo4jGraph
+from graphdemo.common import get_llm
+from graphdemo.cypher_cache import CachedCypherQAChain, get_snapshot_graph
 import os
 
-def get_llm():
-    azure_endpoint: str = os.getenv("AZURE_OPENAI_BASE") or ""
-    api_key = os.getenv("AZURE_OPENAI_API_KEY") or ""
-    api_version: str = os.getenv("AZURE_OPENAI_API_VERSION") or ""
-    azure_openai_deployment : str = os.getenv("AZURE_OPENAI_MODEL") or ""
-    llm = AzureChatOpenAI(azure_deployment=azure_openai_deployment, temperature=0, streaming=False, 
-                          azure_endpoint=azure_endpoint, api_key=api_key, api_version=api_version)
-    return llm
-
 url=os.getenv("ICIJ_NEO4J_URL")
 username=os.getenv("ICIJ_NEO4J_USERNAME")
 password=os.getenv("ICIJ_NEO4J_PASSWORD")
 
-graph = Neo4jGraph(url=url, username=username, password=password)
+# Schema is reloaded from a local snapshot unless the database labels, types or keys changed
+graph = get_snapshot_graph(url=url, username=username, password=password)
 llm = get_llm()
-chain = GraphCypherQAChain.from_llm(llm, graph=graph, verbose=True)
+# Repeated questions, and questions of an already seen shape, reuse the generated Cypher
+chain = CachedCypherQAChain(GraphCypherQAChain.from_llm(llm, graph=graph, verbose=True))
 
 chain.invoke({'query': "Which intermediary is connected to most entites?"})
 input("Press Enter to continue...")
@@ -7,238 +7,116 @@
 # blog https://blog.langchain.dev/graph-based-metadata-filtering-for-improving-vector-search-in-rag-applications/
 # notebook https://github.com/tomasonjo/blogs/blob/master/llm/graph_based_prefiltering.ipynb
 
+import asyncio
 import os
-from langchain_core.runnables import (
-    RunnableBranch,
-    RunnableLambda,
-    RunnableParallel,
-    RunnablePassthrough,
-)
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.prompts.prompt import PromptTemplate
-from langchain_core.pydantic_v1 import BaseModel, Field
-from typing import Tuple, List, Optional
-from langchain_core.messages import AIMessage, HumanMessage
-from langchain_core.output_parsers import StrOutputParser
-from langchain_community.graphs import Neo4jGraph
+import time
+from functools import partial
 from langchain.document_loaders import WikipediaLoader
 from langchain.text_splitter import TokenTextSplitter
 from langchain_experimental.graph_transformers import LLMGraphTransformer
-from neo4j import GraphDatabase
-from yfiles_jupyter_graphs import GraphWidget
-from langchain_community.vectorstores import Neo4jVector
-from langchain_community.vectorstores.neo4j_vector import remove_lucene_chars
-from langchain_openai import AzureChatOpenAI
-from langchain_openai import AzureOpenAIEmbeddings
-
-def get_llm():
-    azure_endpoint: str = os.getenv("AZURE_OPENAI_BASE") or ""
-    api_key = os.getenv("AZURE_OPENAI_API_KEY") or ""
-    api_version: str = os.getenv("AZURE_OPENAI_API_VERSION") or ""
-    azure_openai_deployment : str = os.getenv("AZURE_OPENAI_MODEL") or ""
-    llm = AzureChatOpenAI(azure_deployment=azure_openai_deployment, temperature=0, streaming=False, 
-                          azure_endpoint=azure_endpoint, api_key=api_key, api_version=api_version)
-    return llm
-
-def get_graph():
-    graph = Neo4jGraph(
-        url=os.getenv("NEO4J_URL"),
-        username=os.getenv("NEO4J_USERNAME"),
-        password=os.getenv("NEO4J_PASSWORD"),
-        refresh_schema=False
-    )
-    return graph
-
-def clean_graph(graph):
-    input("Press Enter to delete graph...")
-    query = """
-    MATCH (n)
-    DETACH DELETE n
-    """
-    graph.query(query)
-
-url=os.getenv("NEO4J_URL")
-username=os.getenv("NEO4J_USERNAME")
-password=os.getenv("NEO4J_PASSWORD")
-azure_endpoint: str = os.getenv("AZURE_OPENAI_BASE")
-api_key = os.getenv("AZURE_OPENAI_API_KEY")
-api_version: str = os.getenv("AZURE_OPENAI_API_VERSION")
-azure_embedding_deployment : str = os.getenv("AZURE_OPENAI_EMBEDDING_MODEL")
+from graphdemo import telemetry
+from graphdemo.common import get_embeddings, get_graph, get_llm, load_vector_index
+from graphdemo.dedup import NearDuplicateIndex, deduplicate, link_duplicates
+from graphdemo.extraction import run_extraction, successful, summarize
+from graphdemo.extraction_cache import ExtractionCache, extraction_schema
+from graphdemo.graph_writer import BulkGraphWriter
+from graphdemo.incremental import fingerprint_documents, plan_sync, remove_stale
+from graphdemo.embeddings import embed_missing
+from graphdemo.entity_matcher import EntityMatcher
+from graphdemo.answer_cache import AnswerCache, GraphVersion, bump_graph_version
+from graphdemo.neighborhoods import NeighborhoodView
+from graphdemo.resolution import EntityResolver
+from graphdemo.rag import build_chain, ensure_entity_index, entity_chain
+
+# Per-stage timings, tokens and Cypher round trips as JSON logs and Prometheus
+# metrics when TELEMETRY is set (TELEMETRY_LOG, TELEMETRY_PORT)
+telemetry.enable_from_env()
 
 # Read the wikipedia article
 raw_documents = WikipediaLoader(query="Elizabeth I").load()
 # Define chunking strategy
 text_splitter = TokenTextSplitter(chunk_size=512, chunk_overlap=24)
-documents = text_splitter.split_documents(raw_documents[:3])
+documents = fingerprint_documents(text_splitter.split_documents(raw_documents[:3]))
 
 llm = get_llm()
 llm_transformer = LLMGraphTransformer(llm=llm)
 
 graph = get_graph()
 
-graph_documents = llm_transformer.convert_to_graph_documents(documents)
-graph.add_graph_documents(
-    graph_documents,
-    baseEntityLabel=True,
-    include_source=True
-)
-
-# directly show the graph resulting from the given Cypher query
-default_cypher = "MATCH (s)-[r:!MENTIONS]->(t) RETURN s,r,t LIMIT 50"
-
-vector_index = Neo4jVector.from_existing_graph(
-    AzureOpenAIEmbeddings(azure_endpoint=azure_endpoint, api_key=api_key, azure_deployment=azure_embedding_deployment),
-    search_type="hybrid",
-    node_label="Document",
-    text_node_properties=["text"],
-    embedding_node_property="embedding"
+# Optionally keep each entity's ranked neighborhood materialized, so retrieval reads one property
+neighborhoods = NeighborhoodView(graph) if os.getenv("MATERIALIZED_NEIGHBORHOODS") else None
+
+# Only new or edited chunks are extracted; chunks no longer in the corpus are removed
+plan = plan_sync(graph, documents)
+print(plan)
+removed = remove_stale(graph, plan.stale, on_affected=neighborhoods.refresh if neighborhoods else None)
+print(f"Removed {removed} orphaned entities")
+if plan.stale:
+    bump_graph_version(graph)
+
+# Overlapping Wikipedia pages repeat passages almost word for word: only one chunk
+# of each near-duplicate cluster is extracted and embedded
+dedup = NearDuplicateIndex()
+representatives, duplicates = deduplicate(plan.new, dedup)
+print(dedup.stats)
+
+results = run_extraction(
+    llm_transformer,
+    representatives,
+    max_concurrency=int(os.getenv("EXTRACTION_CONCURRENCY") or 8),
+    requests_per_minute=int(os.getenv("AZURE_OPENAI_RPM") or 0) or None,
+    tokens_per_minute=int(os.getenv("AZURE_OPENAI_TPM") or 0) or None,
+    cache=ExtractionCache(),
+    schema=extraction_schema(os.getenv("AZURE_OPENAI_MODEL") or ""),
 )
+print(summarize(results))
+graph_documents = successful(results)
+# Fold "Elizabeth", "Elizabeth I" and "Queen Elizabeth I" into one node, with the other names as aliases,
+# against the entities already in the graph too
+resolver = EntityResolver(get_embeddings()).load(graph)
+graph_documents = resolver.resolve(graph_documents)
+writer = BulkGraphWriter(graph, batch_size=1000, parallelism=int(os.getenv("NEO4J_WRITE_PARALLELISM") or 1))
+# Local gazetteer of entity names, kept up to date by the writer
+entity_matcher = EntityMatcher().load(graph)
+writer.listeners.append(entity_matcher.add_graph_documents)
+if neighborhoods:
+    writer.listeners.append(neighborhoods.add_graph_documents)
+# Every write bumps the graph version, which expires cached answers
+writer.listeners.append(partial(bump_graph_version, graph))
+print(writer.write(graph_documents))
+if neighborhoods:
+    print(f"Materialized {neighborhoods.rebuild(missing_only=True)} more entity neighborhoods")
+
+embeddings = get_embeddings()
+# Embed new chunks in token-sized batches and write the vectors back in bulk,
+# from_existing_graph then finds nothing left to embed
+print(f"Embedded {embed_missing(graph, embeddings)} chunks ({embeddings.api_calls} embedding calls)")
+# The duplicates get the MENTIONS edges and the embedding of their representative
+print(f"Linked {link_duplicates(graph, duplicates)} near-duplicate chunks")
+
+# Hybrid Neo4jVector index, or an in-process mirror of the Document embeddings with LOCAL_VECTOR_INDEX
+vector_index = load_vector_index(graph, embeddings)
 
 # Retriever
 
-graph.query(
-    "CREATE FULLTEXT INDEX entity IF NOT EXISTS FOR (e:__Entity__) ON EACH [e.id]")
-
-# Extract entities from text
-class Entities(BaseModel):
-    """Identifying information about entities."""
-
-    names: List[str] = Field(
-        ...,
-        description="All the person, organization, or business entities that "
-        "appear in the text",
-    )
-
-prompt = ChatPromptTemplate.from_messages(
-    [
-        (
-            "system",
-            "You are extracting organization and person entities from the text.",
-        ),
-        (
-            "human",
-            "Use the given format to extract information from the following "
-            "input: {question}",
-        ),
-    ]
-)
+ensure_entity_index(graph)
 
-entity_chain = prompt | llm.with_structured_output(Entities)
-
-names = entity_chain.invoke({"question": "Where was Amelia Earhart born?"}).names
+names = entity_chain(llm).invoke({"question": "Where was Amelia Earhart born?"}).names
 print(names)
 
-def generate_full_text_query(input: str) -> str:
-    """
-    Generate a full-text search query for a given input string.
-
-    This function constructs a query string suitable for a full-text search.
-    It processes the input string by splitting it into words and appending a
-    similarity threshold (~2 changed characters) to each word, then combines
-    them using the AND operator. Useful for mapping entities from user questions
-    to database values, and allows for some misspelings.
-    """
-    full_text_query = ""
-    words = [el for el in remove_lucene_chars(input).split() if el]
-    for word in words[:-1]:
-        full_text_query += f" {word}~2 AND"
-    full_text_query += f" {words[-1]}~2"
-    return full_text_query.strip()
-
-# Fulltext index query
-def structured_retriever(question: str) -> str:
-    """
-    Collects the neighborhood of entities mentioned
-    in the question
-    """
-    result = ""
-    entities = entity_chain.invoke({"question": question})
-    for entity in entities.names:
-        response = graph.query(
-            """CALL db.index.fulltext.queryNodes('entity', $query, {limit:2})
-            YIELD node,score
-            CALL {
-              WITH node
-              MATCH (node)-[r:!MENTIONS]->(neighbor)
-              RETURN node.id + ' - ' + type(r) + ' -> ' + neighbor.id AS output
-              UNION ALL
-              WITH node
-              MATCH (node)<-[r:!MENTIONS]-(neighbor)
-              RETURN neighbor.id + ' - ' + type(r) + ' -> ' +  node.id AS output
-            }
-            RETURN output LIMIT 50
-            """,
-            {"query": generate_full_text_query(entity)},
-        )
-        result += "\n".join([el['output'] for el in response])
-    return result
-
-print(structured_retriever("Who is Elizabeth I?"))
-
-def retriever(question: str):
-    print(f"Search query: {question}")
-    structured_data = structured_retriever(question)
-    unstructured_data = [el.page_content for el in vector_index.similarity_search(question)]
-    final_data = f"""Structured data:
-{structured_data}
-Unstructured data:
-{"#Document ". join(unstructured_data)}
-    """
-    return final_data
-
-
-# Condense a chat history and follow-up question into a standalone question
-_template = """Given the following conversation and a follow up question, rephrase the follow up question to be a standalone question,
-in its original language.
-Chat History:
-{chat_history}
-Follow Up Input: {question}
-Standalone question:"""
-CONDENSE_QUESTION_PROMPT = PromptTemplate.from_template(_template)
-
-def _format_chat_history(chat_history: List[Tuple[str, str]]) -> List:
-    buffer = []
-    for human, ai in chat_history:
-        buffer.append(HumanMessage(content=human))
-        buffer.append(AIMessage(content=ai))
-    return buffer
-
-_search_query = RunnableBranch(
-    # If input includes chat_history, we condense it with the follow-up question
-    (
-        RunnableLambda(lambda x: bool(x.get("chat_history"))).with_config(
-            run_name="HasChatHistoryCheck"
-        ),  # Condense follow-up question and chat into a standalone_question
-        RunnablePassthrough.assign(
-            chat_history=lambda x: _format_chat_history(x["chat_history"])
-        )
-        | CONDENSE_QUESTION_PROMPT
-        | get_llm()
-        | StrOutputParser(),
-    ),
-    # Else, we have no chat history, so just pass through the question
-    RunnableLambda(lambda x : x["question"]),
+# Fulltext index query for all entities in one round trip, concurrently with vector search.
+# Entities already in the graph are matched locally, entity_chain only runs when nothing matches.
+# Answers are cached by standalone question and dropped whenever the graph version changes.
+# graph, the vector index and the async retrieval path share one pooled driver
+# The blocking and the streaming chain below share one answer cache
+answer_cache = AnswerCache(embeddings, GraphVersion(graph), threshold=0.95)
+chain, graph_retriever = build_chain(
+    graph, llm, embeddings, vector_index, entity_matcher=entity_matcher, condense_llm=get_llm(),
+    materialized=neighborhoods is not None, answer_cache=answer_cache,
 )
+structured_retriever = graph_retriever.structured
 
-template = """Answer the question based only on the following context:
-{context}
-
-Question: {question}
-Use natural language and be concise.
-Answer:"""
-prompt = ChatPromptTemplate.from_template(template)
-
-chain = (
-    RunnableParallel(
-        {
-            "context": _search_query | retriever,
-            "question": RunnablePassthrough(),
-        }
-    )
-    | prompt
-    | llm
-    | StrOutputParser()
-)
+print(structured_retriever("Who is Elizabeth I?"))
 
 chain.invoke({"question": "Which house did Elizabeth I belong to?"})
 
@@ -247,4 +125,26 @@ chain.invoke(
         "question": "When was she born?",
         "chat_history": [("Which house did Elizabeth I belong to?", "House Of Tudor")],
     }
-)
\ No newline at end of file
+)
+
+# Streaming: retrieval runs asynchronously (the graph lookup of the follow-up overlaps condensing)
+# and the answer is printed token by token
+streaming_chain, _ = build_chain(
+    graph, get_llm(streaming=True), embeddings, vector_index, entity_matcher=entity_matcher, condense_llm=get_llm(),
+    materialized=neighborhoods is not None, streaming=True, answer_cache=answer_cache,
+)
+
+
+async def stream(inputs):
+    start = time.perf_counter()
+    first = None
+    async for chunk in streaming_chain.astream(inputs):
+        first = first or time.perf_counter() - start
+        print(chunk, end="", flush=True)
+    print(f"\n(first token after {first:.2f}s)")
+
+
+asyncio.run(stream({
+    "question": "Who were her parents?",
+    "chat_history": [("Which house did Elizabeth I belong to?", "House Of Tudor")],
+}))
@@ -1,53 +1,20 @@
-import os
-from langchain_community.graphs import Neo4jGraph
-from langchain_experimental.graph_transformers import LLMGraphTransformer
-from langchain_openai import AzureChatOpenAI, AzureOpenAIEmbeddings
-from langchain_core.documents import Document
-from langchain_core.runnables import (
-    RunnableBranch,
-    RunnableLambda,
-    RunnableParallel,
-    RunnablePassthrough,
-)
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.prompts.prompt import PromptTemplate
-from langchain_core.pydantic_v1 import BaseModel, Field
-from typing import Tuple, List, Optional
-from langchain_core.messages import AIMessage, HumanMessage
-from langchain_core.output_parsers import StrOutputParser
-import os
-from langchain_community.graphs import Neo4jGraph
-from langchain.document_loaders import WikipediaLoader
-from langchain.text_splitter import TokenTextSplitter
-from langchain_openai import ChatOpenAI
-from langchain_experimental.graph_transformers import LLMGraphTransformer
-from neo4j import GraphDatabase
 from langchain_community.vectorstores import Neo4jVector
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.vectorstores.neo4j_vector import remove_lucene_chars
-from langchain_core.runnables import ConfigurableField, RunnableParallel, RunnablePassthrough
-
-
-os.environ["NEO4J_URI"] = "neo4j+s://2f8c7fba.databases.neo4j.io"
-os.environ["NEO4J_USERNAME"] = "neo4j"
-os.environ["NEO4J_PASSWORD"] = "qWU5Fx0_d5gD0jy2RG1fduJep0qFOVwG3dhJ2inlwHw"
+from graphdemo.common import get_embeddings, get_graph
 
-graph = Neo4jGraph()
-
-azure_endpoint = "https://mtcmilan-oai-swecen.openai.azure.com/"
-api_key = "38c794f8881246d99da7d9d501890524"
-azure_embedding_deployment = "text-embedding-ada-002"
+# Neo4j and Azure OpenAI settings come from the environment (see graphdemo.common)
+graph = get_graph()
 
 # Neo4jVector.delete_index("vector")
 # Create a new vector index with the correct dimension
 # Neo4jVector.create_new_index("vector", dimension=1536)
 
 vector_index = Neo4jVector.from_existing_graph(
-    AzureOpenAIEmbeddings(azure_endpoint=azure_endpoint, api_key=api_key, azure_deployment=azure_embedding_deployment),
+    get_embeddings(),
+    graph=graph,
     index_name="vector",
     dimension=1536,
     search_type="hybrid",
     node_label="Document",
     text_node_properties=["text"],
     embedding_node_property="embedding"
-)
\ No newline at end of file
+)
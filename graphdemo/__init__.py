@@ -0,0 +1,6 @@
+"""
+Knowledge graph construction and graph RAG over Neo4j with LangChain.
+
+Kept free of imports so the command line starts fast; import the modules
+you need, e.g. graphdemo.common or graphdemo.rag.
+"""
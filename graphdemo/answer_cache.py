@@ -0,0 +1,250 @@
+import asyncio
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+import numpy as np
+from langchain_core.runnables import RunnableLambda
+
+from . import telemetry
+
+
+def normalize_question(question: str) -> str:
+    return re.sub(r"\s+", " ", question.casefold()).strip().rstrip("?!. ")
+
+
+def bump_graph_version(graph, *args):
+    """
+    Increment the graph version counter. Extra arguments are ignored so it can
+    be registered directly as a BulkGraphWriter listener.
+    """
+    graph.query("MERGE (m:__Meta__ {name: 'graph'}) SET m.version = coalesce(m.version, 0) + 1")
+
+
+class GraphVersion:
+    """Graph version counter, re-read from Neo4j at most every poll_interval seconds."""
+
+    def __init__(self, graph, poll_interval: float = 5.0):
+        self.graph = graph
+        self.poll_interval = poll_interval
+        self._value = None
+        self._read_at = 0.0
+
+    def get(self) -> int:
+        now = time.monotonic()
+        if self._value is None or now - self._read_at >= self.poll_interval:
+            rows = self.graph.query("MATCH (m:__Meta__ {name: 'graph'}) RETURN m.version AS version")
+            self._value = rows[0]["version"] if rows else 0
+            self._read_at = now
+        return self._value
+
+    async def aget(self) -> int:
+        """get() for event loops: a due poll runs on a thread instead of blocking the loop."""
+        if self._value is None or time.monotonic() - self._read_at >= self.poll_interval:
+            return await asyncio.to_thread(self.get)
+        return self._value
+
+
+class ExactCache:
+    """LRU with a time to live, keyed by normalized question."""
+
+    def __init__(self, max_size: int = 1024, ttl: float = 3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        item = self._items.get(key)
+        if item is None:
+            return None
+        value, expires = item
+        if expires < time.monotonic():
+            del self._items[key]
+            return None
+        self._items.move_to_end(key)
+        return value
+
+    def put(self, key: str, value: Any):
+        self._items[key] = (value, time.monotonic() + self.ttl)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def clear(self):
+        self._items.clear()
+
+
+class SemanticCache:
+    """
+    Answers indexed by unit-normalized question embeddings. A lookup is one
+    matrix-vector product over all cached questions; when full, the oldest
+    entry is overwritten.
+    """
+
+    def __init__(self, threshold: float = 0.95, max_size: int = 1024, ttl: float = 3600):
+        self.threshold = threshold
+        self.max_size = max_size
+        self.ttl = ttl
+        self._vectors = None
+        self._answers = [None] * max_size
+        self._expires = np.zeros(max_size)
+        self._size = 0
+        self._next = 0
+
+    @staticmethod
+    def _unit(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def get(self, vector) -> Optional[Any]:
+        if not self._size:
+            return None
+        scores = self._vectors[:self._size] @ self._unit(vector)
+        scores[self._expires[:self._size] < time.monotonic()] = -1
+        best = int(np.argmax(scores))
+        return self._answers[best] if scores[best] >= self.threshold else None
+
+    def put(self, vector, answer: Any):
+        vector = self._unit(vector)
+        if self._vectors is None:
+            self._vectors = np.zeros((self.max_size, vector.shape[0]), dtype=np.float32)
+        self._vectors[self._next] = vector
+        self._answers[self._next] = answer
+        self._expires[self._next] = time.monotonic() + self.ttl
+        self._next = (self._next + 1) % self.max_size
+        self._size = min(self._size + 1, self.max_size)
+
+    def clear(self):
+        self._answers = [None] * self.max_size
+        self._size = 0
+        self._next = 0
+
+
+class AnswerCache:
+    """
+    Two-level cache for RAG answers: exact match on the normalized standalone
+    question, then a semantic match on the embedding of the question as
+    asked (the vector GraphRetriever searches with). Both levels are dropped
+    whenever the graph version changes, so ingestion expires stale answers.
+
+    The semantic level trades exactness for hit rate. At the default cosine
+    threshold of 0.95, ada-002 vectors of questions that differ only in a
+    short token, e.g. "Elizabeth I" and "Elizabeth II", can still match and
+    return the other question's answer. Raise the threshold towards 0.99 for
+    entity-dense questions, or pass embeddings=None to keep only the exact
+    level.
+    """
+
+    def __init__(self, embeddings=None, graph_version: Optional[GraphVersion] = None, threshold: float = 0.95,
+                 max_size: int = 1024, ttl: float = 3600):
+        self.embeddings = embeddings
+        self.graph_version = graph_version
+        self.exact = ExactCache(max_size, ttl)
+        self.semantic = SemanticCache(threshold, max_size, ttl)
+        self.hits = {"exact": 0, "semantic": 0}
+        self.misses = 0
+        self._version = None
+        self._lock = threading.Lock()
+
+    def _apply_version(self, version: Optional[int]):
+        if self.graph_version is None:
+            return
+        if version != self._version:
+            self.exact.clear()
+            self.semantic.clear()
+            self._version = version
+
+    def _check_version(self):
+        if self.graph_version is not None:
+            self._apply_version(self.graph_version.get())
+
+    async def _aversion(self) -> Optional[int]:
+        return await self.graph_version.aget() if self.graph_version is not None else None
+
+    def _exact(self, question: str) -> Optional[Any]:
+        answer = self.exact.get(normalize_question(question))
+        if answer is not None:
+            self.hits["exact"] += 1
+        return answer
+
+    def _semantic(self, vector) -> Optional[Any]:
+        answer = self.semantic.get(vector) if vector is not None else None
+        if answer is not None:
+            self.hits["semantic"] += 1
+        else:
+            self.misses += 1
+        return answer
+
+    def get_exact(self, question: str) -> Optional[Any]:
+        with self._lock:
+            self._check_version()
+            return self._exact(question)
+
+    def get_semantic(self, vector) -> Optional[Any]:
+        with self._lock:
+            self._check_version()
+            return self._semantic(vector)
+
+    async def aget_exact(self, question: str) -> Optional[Any]:
+        """get_exact() for event loops: a due version poll does not block the loop."""
+        version = await self._aversion()
+        with self._lock:
+            self._apply_version(version)
+            return self._exact(question)
+
+    async def aget_semantic(self, vector) -> Optional[Any]:
+        version = await self._aversion()
+        with self._lock:
+            self._apply_version(version)
+            return self._semantic(vector)
+
+    def put(self, question: str, answer: Any, vector=None):
+        with self._lock:
+            self.exact.put(normalize_question(question), answer)
+            if vector is not None:
+                self.semantic.put(vector, answer)
+
+    def wrap(self, search_query, answer_chain) -> RunnableLambda:
+        """
+        Cache a RAG chain split at the standalone question: search_query turns
+        the chain input into the question, answer_chain answers it.
+        """
+        def invoke(inputs):
+            with telemetry.stage("chain"):
+                with telemetry.stage("condense"):
+                    question = search_query.invoke(inputs)
+                answer = self.get_exact(question)
+                if answer is not None:
+                    telemetry.add(exact_hits=1)
+                    return answer
+                vector = self.embeddings.embed_query(question) if self.embeddings else None
+                answer = self.get_semantic(vector)
+                if answer is not None:
+                    telemetry.add(semantic_hits=1)
+                    return answer
+                with telemetry.stage("answer"):
+                    answer = answer_chain.invoke(question)
+                self.put(question, answer, vector)
+                return answer
+
+        async def ainvoke(inputs):
+            with telemetry.stage("chain"):
+                with telemetry.stage("condense"):
+                    question = await search_query.ainvoke(inputs)
+                answer = await self.aget_exact(question)
+                if answer is not None:
+                    telemetry.add(exact_hits=1)
+                    return answer
+                vector = await self.embeddings.aembed_query(question) if self.embeddings else None
+                answer = await self.aget_semantic(vector)
+                if answer is not None:
+                    telemetry.add(semantic_hits=1)
+                    return answer
+                with telemetry.stage("answer"):
+                    answer = await answer_chain.ainvoke(question)
+                self.put(question, answer, vector)
+                return answer
+
+        return RunnableLambda(invoke, afunc=ainvoke).with_config(run_name="AnswerCache")
@@ -0,0 +1,383 @@
+"""
+Reproducible benchmarks without Azure OpenAI.
+
+The LLM and the embedding model are replaced by deterministic local stand-ins
+with configurable latency; the graph is a local Neo4j, for example
+
+    docker run -p 7687:7687 -e NEO4J_AUTH=neo4j/password neo4j:5
+
+with NEO4J_URL, NEO4J_USERNAME and NEO4J_PASSWORD pointing at it. The
+database is wiped by the ingest scenario. The startup scenario needs no
+services: it times cold starts of the command line and fails the run when
+the median exceeds --max-startup-ms. Results are printed, and written with
+--output, as JSON so runs can be compared.
+
+    graphdemo bench --scenario all --chunks 200 --latency 0.05 --output bench.json
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import platform
+import random
+import re
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableParallel, RunnablePassthrough
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import BaseModel, Field
+
+FIRST_NAMES = ["Elizabeth", "Mary", "Henry", "Anne", "Edward", "Catherine", "Robert", "Francis", "Walter", "Jane"]
+LAST_NAMES = ["Tudor", "Boleyn", "Dudley", "Drake", "Raleigh", "Seymour", "Grey", "Cecil", "Howard", "Parr"]
+PLACES = ["London", "Greenwich", "Hatfield", "Richmond", "Windsor", "Oxford", "Cambridge", "Dover"]
+ORGANIZATIONS = ["House of Tudor", "Privy Council", "Church of England", "Royal Navy", "East India Company"]
+VERBS = ["met", "married", "advised", "served", "visited", "opposed", "founded", "joined"]
+_CAPITALIZED = re.compile(r"\b[A-Z][a-z]+(?:\s+(?:of\s+)?[A-Z][a-z]+)*")
+
+
+def synthetic_corpus(documents: int, sentences: int = 120, seed: int = 7) -> List[Document]:
+    """Wikipedia-like pages about a fixed cast of people, places and organizations."""
+    rng = random.Random(seed)
+    people = [f"{f} {l}" for f in FIRST_NAMES for l in LAST_NAMES]
+    pages = []
+    for i in range(documents):
+        lines = []
+        for _ in range(sentences):
+            lines.append(f"{rng.choice(people)} {rng.choice(VERBS)} {rng.choice(people + ORGANIZATIONS)} "
+                         f"in {rng.choice(PLACES)} in {rng.randint(1500, 1620)}.")
+        pages.append(Document(page_content=" ".join(lines), metadata={"source": f"synthetic://{i}", "title": f"Page {i}"}))
+    return pages
+
+
+KNOWN = {f"{f} {l}" for f in FIRST_NAMES for l in LAST_NAMES} | set(PLACES) | set(ORGANIZATIONS)
+
+
+def _entities(text: str) -> List[str]:
+    names = (m.group(0) for m in _CAPITALIZED.finditer(text))
+    return list(dict.fromkeys(n for n in names if n in KNOWN))
+
+
+def _node_type(name: str) -> str:
+    if name in PLACES:
+        return "Location"
+    if name in ORGANIZATIONS:
+        return "Organization"
+    return "Person"
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic chat model. With LLMGraphTransformer's DynamicGraph tool
+    bound it returns a tool call with the capitalized names of the input as
+    nodes, linked in order; with the Entities tool it returns those names;
+    otherwise a short text answer. Every call sleeps for latency seconds.
+    """
+
+    latency: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], **kwargs)
+
+    def _respond(self, messages: List[BaseMessage], tools: Optional[List[Dict]]) -> ChatResult:
+        text = str(messages[-1].content)
+        prompt_tokens = sum(len(str(m.content).split()) for m in messages)
+        if tools:
+            name = tools[0]["function"]["name"]
+            names = _entities(text.rsplit("input:", 1)[-1])
+            if name == "DynamicGraph":
+                names = names[:40]
+                args = {
+                    "nodes": [{"id": n, "type": _node_type(n)} for n in names],
+                    "relationships": [
+                        {"source_node_id": a, "source_node_type": _node_type(a), "target_node_id": b,
+                         "target_node_type": _node_type(b), "type": "RELATED_TO"}
+                        for a, b in zip(names, names[1:])
+                    ],
+                }
+            elif name == "EntityBatch":
+                texts = re.findall(r"^\d+\. (.*)$", text.rsplit("input:", 1)[-1], re.MULTILINE)
+                args = {"entities": [{"names": _entities(t)[:5]} for t in texts]}
+            else:
+                args = {"names": names[:5]}
+            message = AIMessage(content="", tool_calls=[{"name": name, "args": args, "id": "call_0"}])
+            completion_tokens = len(json.dumps(args).split())
+        else:
+            answer = f"Based on the context, {(_entities(text) or ['the answer'])[-1]}."
+            message = AIMessage(content=answer)
+            completion_tokens = len(answer.split())
+        message.usage_metadata = {"input_tokens": prompt_tokens, "output_tokens": completion_tokens,
+                                  "total_tokens": prompt_tokens + completion_tokens}
+        return ChatResult(generations=[ChatGeneration(message=message)],
+                          llm_output={"token_usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                                                      "total_tokens": prompt_tokens + completion_tokens}})
+
+    def _generate(self, messages, stop=None, run_manager=None, tools=None, **kwargs) -> ChatResult:
+        time.sleep(self.latency)
+        return self._respond(messages, tools)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, tools=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return self._respond(messages, tools)
+
+
+class FakeEmbeddings(Embeddings):
+    """Hashed bag-of-words vectors: deterministic, and texts sharing words end up close."""
+
+    def __init__(self, size: int = 1536, latency: float = 0.0):
+        self.size = size
+        self.latency = latency
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.size, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            vector[int(hashlib.md5(word.encode("utf-8")).hexdigest()[:8], 16) % self.size] += 1
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.latency)
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+class Entities(BaseModel):
+    """Identifying information about entities."""
+
+    names: List[str] = Field(..., description="All the person, organization, or business entities that appear in the text")
+
+
+def latency_stats(samples: List[float]) -> Dict[str, float]:
+    values = np.asarray(samples) * 1000
+    return {
+        "count": len(samples),
+        "mean_ms": float(values.mean()),
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+    }
+
+
+def questions(count: int, seed: int = 11) -> List[str]:
+    rng = random.Random(seed)
+    templates = ["Who did {} meet?", "Where was {} in 1560?", "What did {} found?", "Who advised {}?"]
+    people = [f"{f} {l}" for f in FIRST_NAMES for l in LAST_NAMES]
+    return [rng.choice(templates).format(rng.choice(people)) for _ in range(count)]
+
+
+# Modules the command line must not import before a subcommand asks for them
+HEAVY_MODULES = ["langchain", "langchain_core", "langchain_community", "langchain_experimental", "langchain_openai",
+                 "neo4j", "numpy", "tiktoken", "wikipedia", "yfiles_jupyter_graphs"]
+_IMPORTED = ("import json, sys; import graphdemo.cli; "
+             "print(json.dumps(sorted({m.split('.')[0] for m in sys.modules} & set(%r))))" % HEAVY_MODULES)
+
+
+def bench_startup(args) -> Dict[str, Any]:
+    samples = {"import": [], "help": []}
+    commands = {"import": [sys.executable, "-c", "import graphdemo.cli"],
+                "help": [sys.executable, "-m", "graphdemo", "--help"]}
+    for _ in range(args.startup_runs):
+        for name, command in commands.items():
+            start = time.perf_counter()
+            subprocess.run(command, check=True, capture_output=True)
+            samples[name].append(time.perf_counter() - start)
+    imported = subprocess.run([sys.executable, "-c", _IMPORTED], check=True, capture_output=True, text=True)
+    return {**{name: latency_stats(s) for name, s in samples.items()},
+            "heavy_modules_imported": json.loads(imported.stdout)}
+
+
+def bench_ingest(args) -> Dict[str, Any]:
+    from langchain.text_splitter import TokenTextSplitter
+    from langchain_experimental.graph_transformers import LLMGraphTransformer
+    from .common import get_graph
+    from .extraction import run_extraction, successful
+    from .graph_writer import BulkGraphWriter, baseline_write
+
+    splitter = TokenTextSplitter(chunk_size=512, chunk_overlap=24)
+    chunks = splitter.split_documents(synthetic_corpus(args.documents))[:args.chunks]
+    transformer = LLMGraphTransformer(llm=FakeChatModel(latency=args.latency))
+
+    start = time.perf_counter()
+    results = run_extraction(transformer, chunks, max_concurrency=args.concurrency)
+    extract_seconds = time.perf_counter() - start
+    graph_documents = successful(results)
+
+    graph = get_graph()
+    graph.query("MATCH (n) CALL { WITH n DETACH DELETE n } IN TRANSACTIONS OF 10000 ROWS")
+    writes = {}
+    if args.baseline:
+        writes["add_graph_documents"] = baseline_write(graph, graph_documents)
+        graph.query("MATCH (n) CALL { WITH n DETACH DELETE n } IN TRANSACTIONS OF 10000 ROWS")
+    writes["bulk"] = BulkGraphWriter(graph, batch_size=args.batch_size, parallelism=args.parallelism).write(graph_documents)
+    graph.query("CREATE FULLTEXT INDEX entity IF NOT EXISTS FOR (e:__Entity__) ON EACH [e.id]")
+    return {
+        "chunks": len(chunks),
+        "extract_seconds": extract_seconds,
+        "chunks_per_second": len(chunks) / extract_seconds,
+        "writes": {name: {"rows": s.rows, "seconds": s.seconds, "rows_per_second": s.rows_per_second}
+                   for name, s in writes.items()},
+    }
+
+
+def _retrieval_setup(args):
+    from langchain_community.vectorstores import Neo4jVector
+    from .common import get_graph
+    from .embeddings import embed_missing
+    from .retrieval import GraphRetriever
+
+    graph = get_graph()
+    llm = FakeChatModel(latency=args.latency)
+    embeddings = FakeEmbeddings(latency=args.embedding_latency)
+    embed_missing(graph, embeddings)
+    vector_index = Neo4jVector.from_existing_graph(
+        embeddings, graph=graph, search_type="hybrid", node_label="Document",
+        text_node_properties=["text"], embedding_node_property="embedding")
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", "You are extracting organization and person entities from the text."),
+        ("human", "Use the given format to extract information from the following input: {question}"),
+    ])
+    entity_chain = prompt | llm.with_structured_output(Entities)
+    return graph, llm, vector_index, GraphRetriever(graph, entity_chain, vector_index)
+
+
+def _timed(fn, items) -> List[float]:
+    samples = []
+    for item in items:
+        start = time.perf_counter()
+        fn(item)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def bench_retrieval(args) -> Dict[str, Any]:
+    from .answer_cache import GraphVersion
+    from .entity_lookup import EntityLookup, ensure_normalized_ids
+    from .retrieval import GraphRetriever
+
+    graph, llm, vector_index, retriever = _retrieval_setup(args)
+    qs = questions(args.queries)
+    template = ChatPromptTemplate.from_template(
+        "Answer the question based only on the following context:\n{context}\n\nQuestion: {question}\n"
+        "Use natural language and be concise.\nAnswer:")
+    chain = (RunnableParallel({"context": retriever.as_runnable(), "question": RunnablePassthrough()})
+             | template | llm | StrOutputParser())
+    ensure_normalized_ids(graph)
+    tiered = GraphRetriever(graph, retriever.entity_chain, vector_index, lookup=EntityLookup(graph, GraphVersion(graph)))
+    return {
+        "structured_retriever": latency_stats(_timed(retriever.structured, qs)),
+        "structured_retriever_tiered_lookup": latency_stats(_timed(tiered.structured, qs)),
+        "entity_lookup_tiers": tiered.lookup.counts,
+        "similarity_search": latency_stats(_timed(vector_index.similarity_search, qs)),
+        "chain_invoke": latency_stats(_timed(chain.invoke, qs)),
+    }
+
+
+def bench_server(args) -> Dict[str, Any]:
+    """Answers per second of the RAG chain driven concurrently, with and without micro-batching."""
+    from .rag import build_chain
+    from .server import build_service
+
+    graph, llm, vector_index, _ = _retrieval_setup(args)
+    embeddings = vector_index.embedding
+    qs = questions(args.queries)
+
+    async def drive(answer, concurrency: int) -> float:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(question):
+            async with semaphore:
+                await answer(question)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(q) for q in qs))
+        return len(qs) / (time.perf_counter() - start)
+
+    async def scenarios() -> Dict[str, float]:
+        # One loop for every run: the async driver the chain and the service
+        # share is bound to the loop it first ran in
+        chain, _ = build_chain(graph, llm, embeddings, vector_index, cache=False, context_tokens=0)
+        service = build_service(graph, llm, embeddings, cache=False, local=False, context_tokens=0)
+        results = {}
+        for concurrency in sorted({1, args.concurrency}):
+            results[f"unbatched_qps_c{concurrency}"] = await drive(
+                lambda q: chain.ainvoke({"question": q}), concurrency)
+            results[f"batched_qps_c{concurrency}"] = await drive(service.answer, concurrency)
+        return results
+
+    return asyncio.run(scenarios())
+
+
+SCENARIOS = {"startup": bench_startup, "ingest": bench_ingest, "retrieval": bench_retrieval, "server": bench_server}
+
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args) -> Dict[str, Any]:
+    scenarios = list(SCENARIOS) if args.scenario == "all" else [args.scenario]
+    report = {
+        "timestamp": time.time(),
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "results": {},
+    }
+    for name in scenarios:
+        report["results"][name] = SCENARIOS[name](args)
+    return report
+
+
+def parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(prog="graphdemo bench", description=__doc__.strip().splitlines()[0])
+    p.add_argument("--scenario", choices=["all", *SCENARIOS], default="all")
+    p.add_argument("--documents", type=int, default=20)
+    p.add_argument("--chunks", type=int, default=200)
+    p.add_argument("--queries", type=int, default=100)
+    p.add_argument("--latency", type=float, default=0.05, help="fake LLM latency per call, seconds")
+    p.add_argument("--embedding-latency", type=float, default=0.01)
+    p.add_argument("--concurrency", type=int, default=8)
+    p.add_argument("--batch-size", type=int, default=1000)
+    p.add_argument("--parallelism", type=int, default=1)
+    p.add_argument("--baseline", action="store_true", help="also time graph.add_graph_documents")
+    p.add_argument("--startup-runs", type=int, default=10)
+    p.add_argument("--max-startup-ms", type=float, default=500, help="median cold start budget of graphdemo --help")
+    p.add_argument("--output", help="write the JSON report to this file")
+    return p
+
+
+def main(argv=None):
+    args = parser().parse_args(argv)
+    results = run(args)
+    report = json.dumps(results, indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report)
+    startup = results["results"].get("startup")
+    if startup and (startup["help"]["p50_ms"] > args.max_startup_ms or startup["heavy_modules_imported"]):
+        sys.exit(f"Cold start over budget: {startup['help']['p50_ms']:.0f}ms (max {args.max_startup_ms:.0f}ms), "
+                 f"heavy modules imported: {startup['heavy_modules_imported']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""
+Command line for the graph demo.
+
+    graphdemo ingest "Elizabeth I" --documents 3
+    graphdemo query "Which house did Elizabeth I belong to?"
+    graphdemo serve --port 8000
+    graphdemo resolve
+    graphdemo snapshot export graph.npz
+    graphdemo clear --yes
+    graphdemo clear --source "https://en.wikipedia.org/wiki/Elizabeth_I"
+    graphdemo bench --scenario startup
+
+Only the standard library is imported at startup; LangChain, neo4j, the
+Wikipedia loader and the graph transformer are imported by the subcommand
+that needs them.
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+
+def ingest(args):
+    from functools import partial
+
+    from langchain.document_loaders import WikipediaLoader
+    from langchain.text_splitter import TokenTextSplitter
+    from langchain_experimental.graph_transformers import LLMGraphTransformer
+
+    from .answer_cache import bump_graph_version
+    from .common import get_embeddings, get_graph, get_llm
+    from .dedup import NearDuplicateIndex
+    from .extraction_cache import ExtractionCache, extraction_schema
+    from .graph_writer import BulkGraphWriter
+    from .neighborhoods import NeighborhoodView
+    from .pipeline import run_pipeline
+    from .rag import ensure_entity_index
+    from .resolution import EntityResolver
+
+    graph = get_graph()
+    # Chunks already in the graph are skipped before extraction
+    existing = {row["id"] for row in graph.query("MATCH (d:Document) RETURN d.id AS id")}
+    writer = BulkGraphWriter(graph, parallelism=args.parallelism)
+    # Every write bumps the graph version, which expires cached answers
+    writer.listeners.append(partial(bump_graph_version, graph))
+    neighborhoods = NeighborhoodView(graph) if args.neighborhoods else None
+    if neighborhoods:
+        writer.listeners.append(neighborhoods.add_graph_documents)
+    dedup = NearDuplicateIndex(args.dedup_threshold) if args.dedup else None
+    stats = asyncio.run(run_pipeline(
+        WikipediaLoader(query=args.query, load_max_docs=args.documents),
+        LLMGraphTransformer(llm=get_llm()),
+        writer,
+        embeddings=None if args.no_embeddings else get_embeddings(),
+        splitter_factory=partial(TokenTextSplitter, chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap),
+        chunk_filter=lambda chunk: chunk.metadata["id"] not in existing,
+        max_concurrency=args.concurrency,
+        requests_per_minute=int(os.getenv("AZURE_OPENAI_RPM") or 0) or None,
+        tokens_per_minute=int(os.getenv("AZURE_OPENAI_TPM") or 0) or None,
+        cache=ExtractionCache(),
+        schema=extraction_schema(os.getenv("AZURE_OPENAI_MODEL") or ""),
+        resolver=EntityResolver(get_embeddings()).load(graph) if args.resolve else None,
+        dedup=dedup,
+    ))
+    ensure_entity_index(graph)
+    print(stats)
+    if dedup:
+        print(dedup.stats)
+        if stats.duplicates:
+            bump_graph_version(graph)
+    if neighborhoods:
+        print(f"Materialized {neighborhoods.rebuild(missing_only=True)} more entity neighborhoods")
+
+
+async def stream_answer(chain, inputs) -> str:
+    chunks = []
+    async for chunk in chain.astream(inputs):
+        chunks.append(chunk)
+        print(chunk, end="", flush=True)
+    print()
+    return "".join(chunks)
+
+
+async def stream_conversation(chain, questions, history=None):
+    """
+    Stream the answers to questions, asked in order as one conversation.
+    All of them run in one event loop: the async Neo4j driver belongs to the
+    loop that first used it.
+    """
+    history = [] if history is None else history
+    for question in questions:
+        if not question:
+            continue
+        answer = await stream_answer(chain, {"question": question, "chat_history": list(history)})
+        history.append((question, answer))
+    return history
+
+
+def query(args):
+    from .common import get_embeddings, get_graph, get_llm, load_vector_index
+    from .entity_matcher import EntityMatcher
+    from .rag import build_chain
+
+    graph = get_graph()
+    embeddings = get_embeddings()
+    chain, _ = build_chain(graph, get_llm(streaming=args.stream), embeddings,
+                           load_vector_index(graph, embeddings, local=args.local or None),
+                           entity_matcher=EntityMatcher().load(graph), cache=not args.no_cache,
+                           materialized=args.neighborhoods, streaming=args.stream)
+    # Without questions on the command line, read one per line until EOF
+    questions = args.questions or (line.strip() for line in sys.stdin)
+    if args.stream:
+        asyncio.run(stream_conversation(chain, questions))
+        return
+    history = []
+    for question in questions:
+        if not question:
+            continue
+        answer = chain.invoke({"question": question, "chat_history": list(history)})
+        print(answer)
+        history.append((question, answer))
+
+
+def resolve(args):
+    from .answer_cache import bump_graph_version
+    from .common import get_embeddings, get_graph
+    from .neighborhoods import NeighborhoodView
+    from .resolution import resolve_graph
+
+    graph = get_graph()
+    stats = resolve_graph(graph, None if args.no_embeddings else get_embeddings())
+    print(stats)
+    if stats.merged:
+        bump_graph_version(graph)
+        if args.neighborhoods:
+            print(f"Materialized {NeighborhoodView(graph).rebuild()} entity neighborhoods")
+
+
+def serve(args):
+    from .common import get_embeddings, get_graph, get_llm
+    from .entity_matcher import EntityMatcher
+    from .server import build_service
+
+    graph = get_graph()
+    cypher_chain = None
+    if args.cypher:
+        from langchain_community.chains.graph_qa.cypher import GraphCypherQAChain
+
+        from .cypher_cache import CachedCypherQAChain, get_snapshot_graph
+        cypher_graph = get_snapshot_graph(url=os.getenv("ICIJ_NEO4J_URL"), username=os.getenv("ICIJ_NEO4J_USERNAME"),
+                                          password=os.getenv("ICIJ_NEO4J_PASSWORD"))
+        cypher_chain = CachedCypherQAChain(GraphCypherQAChain.from_llm(get_llm(), graph=cypher_graph))
+    service = build_service(graph, get_llm(), get_embeddings(), entity_matcher=EntityMatcher().load(graph),
+                            cypher_chain=cypher_chain, local=args.local or None, materialized=args.neighborhoods,
+                            cache=not args.no_cache, max_batch=args.max_batch, max_wait=args.batch_wait_ms / 1000)
+    asyncio.run(service.serve(args.host, args.port))
+
+
+def snapshot(args):
+    from .snapshot import export_snapshot, load_snapshot, write_admin_csv
+
+    if args.action == "csv":
+        print(write_admin_csv(args.path, args.directory))
+        return
+    from .common import get_graph
+
+    if args.action == "export":
+        print(f"Exported {export_snapshot(get_graph(), args.path)}")
+    else:
+        print(f"Loaded {load_snapshot(get_graph(), args.path, batch_size=args.batch_size)}")
+
+
+def clear(args):
+    from .common import clean_graph, get_graph
+
+    clean_graph(get_graph(), confirm=not args.yes, labels=args.label, source=args.source, batch_size=args.batch_size,
+                rebuild_indexes=args.rebuild_indexes)
+
+
+def parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(prog="graphdemo", description="Knowledge graph construction and graph RAG over Neo4j.")
+    commands = p.add_subparsers(dest="command", required=True)
+
+    p_ingest = commands.add_parser("ingest", help="load Wikipedia pages into the graph")
+    p_ingest.add_argument("query", help="Wikipedia search query")
+    p_ingest.add_argument("--documents", type=int, default=3, help="pages to load")
+    p_ingest.add_argument("--chunk-size", type=int, default=512)
+    p_ingest.add_argument("--chunk-overlap", type=int, default=24)
+    p_ingest.add_argument("--concurrency", type=int, default=int(os.getenv("EXTRACTION_CONCURRENCY") or 8))
+    p_ingest.add_argument("--parallelism", type=int, default=int(os.getenv("NEO4J_WRITE_PARALLELISM") or 1))
+    p_ingest.add_argument("--no-embeddings", action="store_true", help="do not embed the chunks")
+    p_ingest.add_argument("--neighborhoods", action="store_true", default=bool(os.getenv("MATERIALIZED_NEIGHBORHOODS")),
+                          help="maintain materialized entity neighborhoods")
+    p_ingest.add_argument("--resolve", action="store_true", default=bool(os.getenv("ENTITY_RESOLUTION")),
+                          help="merge duplicate entities before writing them")
+    p_ingest.add_argument("--dedup", action="store_true", default=bool(os.getenv("NEAR_DUPLICATES")),
+                          help="extract and embed one chunk per cluster of near-duplicate chunks")
+    p_ingest.add_argument("--dedup-threshold", type=float, default=0.8, help="estimated Jaccard similarity of duplicates")
+    p_ingest.set_defaults(func=ingest)
+
+    p_query = commands.add_parser("query", help="answer questions with the graph RAG chain")
+    p_query.add_argument("questions", nargs="*", help="questions, asked in order as one conversation")
+    p_query.add_argument("--local", action="store_true", help="search the in-process vector index")
+    p_query.add_argument("--no-cache", action="store_true", help="bypass the answer cache")
+    p_query.add_argument("--neighborhoods", action="store_true", default=bool(os.getenv("MATERIALIZED_NEIGHBORHOODS")),
+                         help="read materialized entity neighborhoods")
+    p_query.add_argument("--stream", action="store_true", help="print the answer as it is generated")
+    p_query.set_defaults(func=query)
+
+    p_serve = commands.add_parser("serve", help="answer questions over HTTP, micro-batching concurrent requests")
+    p_serve.add_argument("--host", default=os.getenv("SERVER_HOST") or "127.0.0.1")
+    p_serve.add_argument("--port", type=int, default=int(os.getenv("SERVER_PORT") or 8000))
+    p_serve.add_argument("--local", action="store_true", help="search the in-process vector index")
+    p_serve.add_argument("--no-cache", action="store_true", help="bypass the answer cache")
+    p_serve.add_argument("--neighborhoods", action="store_true", default=bool(os.getenv("MATERIALIZED_NEIGHBORHOODS")),
+                         help="read materialized entity neighborhoods")
+    p_serve.add_argument("--cypher", action="store_true", help="also serve the ICIJ Cypher QA chain on /cypher")
+    p_serve.add_argument("--max-batch", type=int, default=16, help="requests per embedding, entity or fulltext batch")
+    p_serve.add_argument("--batch-wait-ms", type=float, default=5, help="how long a batch waits for more requests")
+    p_serve.set_defaults(func=serve)
+
+    p_resolve = commands.add_parser("resolve", help="merge duplicate entities already in the graph (needs APOC)")
+    p_resolve.add_argument("--no-embeddings", action="store_true", help="compare names by characters only")
+    p_resolve.add_argument("--neighborhoods", action="store_true", default=bool(os.getenv("MATERIALIZED_NEIGHBORHOODS")),
+                           help="rebuild materialized entity neighborhoods afterwards")
+    p_resolve.set_defaults(func=resolve)
+
+    p_snapshot = commands.add_parser("snapshot", help="export the graph to a columnar snapshot, or load one")
+    p_snapshot.add_argument("action", choices=["export", "load", "csv"],
+                            help="export the graph, load into an empty database, or write neo4j-admin import CSVs")
+    p_snapshot.add_argument("path", help="snapshot file (.npz)")
+    p_snapshot.add_argument("--directory", default="import", help="where csv writes the CSV files")
+    p_snapshot.add_argument("--batch-size", type=int, default=5000, help="rows per CREATE batch when loading")
+    p_snapshot.set_defaults(func=snapshot)
+
+    p_clear = commands.add_parser("clear", help="delete every node and relationship, or only some of them")
+    p_clear.add_argument("--yes", action="store_true", help="do not ask for confirmation")
+    p_clear.add_argument("--label", action="append", default=[], help="only delete nodes with this label (repeatable)")
+    p_clear.add_argument("--source", help="only delete the chunks of this source document and their orphaned entities")
+    p_clear.add_argument("--batch-size", type=int, help="nodes deleted per transaction")
+    p_clear.add_argument("--rebuild-indexes", action="store_true",
+                         help="drop the indexes and constraints in scope before deleting and recreate them after")
+    p_clear.set_defaults(func=clear)
+
+    # Arguments after "bench" go to the benchmark's own parser
+    commands.add_parser("bench", help="run the benchmarks (see graphdemo bench --help)", add_help=False)
+    return p
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if argv[:1] == ["bench"]:
+        from .benchmark import main as bench
+        return bench(argv[1:])
+    args = parser().parse_args(argv)
+    from . import telemetry
+    # Per-stage timings, tokens and Cypher round trips when TELEMETRY is set
+    telemetry.enable_from_env()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Connections shared by the scripts and the CLI, configured from the
+environment. LangChain, neo4j and yfiles are imported inside the functions
+so importing this module stays cheap.
+"""
+import os
+
+from . import telemetry
+
+# directly show the graph resulting from the given Cypher query
+DEFAULT_CYPHER = "MATCH (s)-[r:!MENTIONS]->(t) RETURN s,r,t LIMIT 50"
+
+
+def get_llm(streaming: bool = False):
+    """Azure OpenAI chat model; with streaming, astream() yields tokens as they arrive and reports usage."""
+    from langchain_openai import AzureChatOpenAI
+
+    azure_endpoint: str = os.getenv("AZURE_OPENAI_BASE") or ""
+    api_key = os.getenv("AZURE_OPENAI_API_KEY") or ""
+    api_version: str = os.getenv("AZURE_OPENAI_API_VERSION") or ""
+    azure_openai_deployment : str = os.getenv("AZURE_OPENAI_MODEL") or ""
+    llm = AzureChatOpenAI(azure_deployment=azure_openai_deployment, temperature=0, streaming=streaming,
+                          stream_usage=streaming, azure_endpoint=azure_endpoint, api_key=api_key,
+                          api_version=api_version, callbacks=telemetry.callbacks())
+    return llm
+
+
+def get_graph(url: str = None, username: str = None, password: str = None):
+    """Neo4jGraph on the process-wide pooled driver (see graphdemo.connections)."""
+    from .connections import SharedNeo4jGraph
+
+    graph = SharedNeo4jGraph(
+        url=url or os.getenv("NEO4J_URL"),
+        username=username or os.getenv("NEO4J_USERNAME"),
+        password=password or os.getenv("NEO4J_PASSWORD"),
+        refresh_schema=False
+    )
+    return telemetry.instrument_graph(graph)
+
+
+def get_embeddings(cached: bool = True):
+    """Azure OpenAI embeddings, behind the on-disk vector cache unless cached is False."""
+    from langchain_openai import AzureOpenAIEmbeddings
+
+    azure_embedding_deployment: str = os.getenv("AZURE_OPENAI_EMBEDDING_MODEL") or ""
+    embeddings = AzureOpenAIEmbeddings(azure_endpoint=os.getenv("AZURE_OPENAI_BASE"),
+                                       api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+                                       azure_deployment=azure_embedding_deployment)
+    if not cached:
+        return embeddings
+    from .embeddings import CachedEmbeddings
+    return CachedEmbeddings(embeddings, namespace=azure_embedding_deployment)
+
+
+def load_vector_index(graph, embeddings, local: bool = None):
+    """
+    graphdemo.rag.get_vector_index, printing the chunk counts of the sync
+    when the in-process mirror is used.
+    """
+    from .local_vector_index import LocalVectorIndex
+    from .rag import get_vector_index
+
+    index = get_vector_index(graph, embeddings, local=local)
+    if isinstance(index, LocalVectorIndex):
+        print(index)
+    return index
+
+
+def clean_graph(graph, confirm: bool = True, labels=(), source: str = None, batch_size: int = None,
+                rebuild_indexes: bool = False):
+    """
+    Delete the graph, or the part of it in scope, in batches with progress
+    (see graphdemo.reset.clear_graph). batch_size defaults to
+    NEO4J_DELETE_BATCH_SIZE or 10000.
+    """
+    from .reset import clear_graph, print_progress
+
+    if confirm:
+        scope = f"source {source!r}" if source is not None else ", ".join(labels) or "graph"
+        input(f"Press Enter to delete {scope}...")
+    stats = clear_graph(graph, labels=labels, source=source,
+                        batch_size=batch_size or int(os.getenv("NEO4J_DELETE_BATCH_SIZE") or 10000),
+                        rebuild_indexes=rebuild_indexes, progress=print_progress)
+    print(stats)
+    return stats
+
+
+def show_graph(cypher: str = DEFAULT_CYPHER):
+    """yfiles widget of the query result, for notebooks."""
+    from yfiles_jupyter_graphs import GraphWidget
+
+    from .connections import get_driver
+
+    with get_driver().session() as session:
+        widget = GraphWidget(graph=session.run(cypher).graph())
+    widget.node_label_mapping = "id"
+    return widget
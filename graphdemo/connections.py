@@ -0,0 +1,156 @@
+"""
+One pooled Neo4j driver per process.
+
+Neo4jGraph, Neo4jVector and GraphDatabase.driver() each open their own
+driver, so every helper pays its own TLS handshakes and keeps its own idle
+connections. get_driver()/get_async_driver() hand out a single driver per
+url and user instead, SharedNeo4jGraph is a Neo4jGraph on top of it, and
+Neo4jVector shares it through its graph argument.
+
+Pool settings come from the environment:
+
+    NEO4J_MAX_CONNECTION_POOL_SIZE      connections per server (100)
+    NEO4J_MAX_CONNECTION_LIFETIME       seconds before a connection is recycled (3600)
+    NEO4J_CONNECTION_ACQUISITION_TIMEOUT  seconds to wait for a free connection (60)
+
+With a neo4j:// or neo4j+s:// url, reads sent with read_query(), aquery()
+or a read session are routed to followers and read replicas.
+"""
+import atexit
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import neo4j
+from langchain_community.graphs import Neo4jGraph
+from neo4j import AsyncGraphDatabase, GraphDatabase, Query, RoutingControl
+
+_lock = threading.Lock()
+_drivers: Dict[Tuple[str, Optional[str]], neo4j.Driver] = {}
+_async_drivers: Dict[Tuple[str, Optional[str]], neo4j.AsyncDriver] = {}
+
+
+def driver_config() -> Dict[str, Any]:
+    return {
+        "max_connection_pool_size": int(os.getenv("NEO4J_MAX_CONNECTION_POOL_SIZE") or 100),
+        "max_connection_lifetime": float(os.getenv("NEO4J_MAX_CONNECTION_LIFETIME") or 3600),
+        "connection_acquisition_timeout": float(os.getenv("NEO4J_CONNECTION_ACQUISITION_TIMEOUT") or 60),
+        "keep_alive": True,
+    }
+
+
+def _settings(url: Optional[str], username: Optional[str], password: Optional[str]):
+    url = url or os.getenv("NEO4J_URL") or os.getenv("NEO4J_URI")
+    username = username or os.getenv("NEO4J_USERNAME")
+    password = password or os.getenv("NEO4J_PASSWORD")
+    if not url:
+        raise ValueError("Neo4j url missing: pass url or set NEO4J_URL")
+    return url, username, password
+
+
+def get_driver(url: Optional[str] = None, username: Optional[str] = None, password: Optional[str] = None) -> neo4j.Driver:
+    """The process-wide driver for url and user, created and verified on first use."""
+    url, username, password = _settings(url, username, password)
+    with _lock:
+        driver = _drivers.get((url, username))
+        if driver is None:
+            driver = GraphDatabase.driver(url, auth=(username, password), **driver_config())
+            driver.verify_connectivity()
+            _drivers[(url, username)] = driver
+        return driver
+
+
+def get_async_driver(url: Optional[str] = None, username: Optional[str] = None,
+                     password: Optional[str] = None) -> neo4j.AsyncDriver:
+    """
+    The process-wide async driver for url and user. Its connections belong
+    to the event loop that first uses them, so share it within one loop.
+    """
+    url, username, password = _settings(url, username, password)
+    with _lock:
+        driver = _async_drivers.get((url, username))
+        if driver is None:
+            driver = AsyncGraphDatabase.driver(url, auth=(username, password), **driver_config())
+            _async_drivers[(url, username)] = driver
+        return driver
+
+
+def close_all():
+    """Close the sync drivers; async drivers are left to close_all_async()."""
+    with _lock:
+        drivers = list(_drivers.values())
+        _drivers.clear()
+    for driver in drivers:
+        driver.close()
+
+
+async def close_all_async():
+    with _lock:
+        drivers = list(_async_drivers.values())
+        _async_drivers.clear()
+    for driver in drivers:
+        await driver.close()
+
+
+atexit.register(close_all)
+
+
+class SharedNeo4jGraph(Neo4jGraph):
+    """
+    Neo4jGraph on the shared driver. Creating one costs no connection setup,
+    and closing it leaves the driver open for everyone else.
+    """
+
+    def __init__(self, url: Optional[str] = None, username: Optional[str] = None, password: Optional[str] = None,
+                 database: Optional[str] = None, timeout: Optional[float] = None, sanitize: bool = False,
+                 refresh_schema: bool = True, *, enhanced_schema: bool = False):
+        # Neo4jGraph.__init__ would open a driver of its own
+        self._settings = _settings(url, username, password)
+        self._driver = get_driver(*self._settings)
+        self._database = database or os.getenv("NEO4J_DATABASE") or "neo4j"
+        self.timeout = timeout
+        self.sanitize = sanitize
+        self._enhanced_schema = enhanced_schema
+        self.schema: str = ""
+        self.structured_schema: Dict[str, Any] = {}
+        if refresh_schema:
+            self.refresh_schema()
+
+    @property
+    def async_driver(self) -> neo4j.AsyncDriver:
+        return get_async_driver(*self._settings)
+
+    def read_query(self, query: str, params: dict = {}) -> List[Dict[str, Any]]:
+        """Run a read-only query, routed to a follower or read replica."""
+        records, _, _ = self._driver.execute_query(
+            Query(text=query, timeout=self.timeout), params,
+            database_=self._database, routing_=RoutingControl.READ)
+        return self._rows(records)
+
+    async def aquery(self, query: str, params: dict = {}, read: bool = False) -> List[Dict[str, Any]]:
+        records, _, _ = await self.async_driver.execute_query(
+            Query(text=query, timeout=self.timeout), params,
+            database_=self._database, routing_=RoutingControl.READ if read else RoutingControl.WRITE)
+        return self._rows(records)
+
+    def async_session(self, read: bool = False, **kwargs) -> neo4j.AsyncSession:
+        """Async session on the shared pool, e.g. async with graph.async_session(read=True) as session."""
+        access_mode = neo4j.READ_ACCESS if read else neo4j.WRITE_ACCESS
+        return self.async_driver.session(database=self._database, default_access_mode=access_mode, **kwargs)
+
+    def session(self, read: bool = False, **kwargs) -> neo4j.Session:
+        access_mode = neo4j.READ_ACCESS if read else neo4j.WRITE_ACCESS
+        return self._driver.session(database=self._database, default_access_mode=access_mode, **kwargs)
+
+    def _rows(self, records) -> List[Dict[str, Any]]:
+        rows = [record.data() for record in records]
+        if self.sanitize:
+            from langchain_community.graphs.neo4j_graph import value_sanitize
+            rows = [value_sanitize(row) for row in rows]
+        return rows
+
+    def close(self):
+        pass
+
+    def __del__(self):
+        pass
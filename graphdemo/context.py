@@ -0,0 +1,149 @@
+import re
+from typing import List, Optional, Sequence
+
+import numpy as np
+from langchain_core.documents import Document
+
+from . import telemetry
+from .extraction import count_tokens
+from .retrieval import EMBEDDING_KEY, format_context
+
+_WORD = re.compile(r"\w+")
+
+
+def _shingles(text: str, size: int = 5) -> set:
+    words = _WORD.findall(text.casefold())
+    return {" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+
+
+def dedupe_lines(lines: Sequence[str]) -> List[str]:
+    """Drop empty and repeated neighborhood lines, keeping the first occurrence."""
+    seen = set()
+    unique = []
+    for line in lines:
+        key = " ".join(line.split()).casefold()
+        if key and key not in seen:
+            seen.add(key)
+            unique.append(line)
+    return unique
+
+
+def dedupe_documents(documents: Sequence[Document], threshold: float = 0.8) -> List[Document]:
+    """
+    Drop chunks whose word 5-grams are mostly contained in a chunk kept
+    before them: exact repeats, and chunks of the same text split with
+    different windows.
+    """
+    kept, kept_shingles = [], []
+    for document in documents:
+        shingles = _shingles(document.page_content)
+        if any(len(shingles & other) >= threshold * min(len(shingles), len(other)) for other in kept_shingles):
+            continue
+        kept.append(document)
+        kept_shingles.append(shingles)
+    return kept
+
+
+def mmr(query_vector, candidate_vectors, k: int, lambda_mult: float = 0.5) -> List[int]:
+    """
+    Maximal marginal relevance order of the candidates. Each step scores all
+    remaining candidates at once against the query and the closest already
+    selected candidate.
+    """
+    candidates = np.asarray(candidate_vectors, dtype=np.float32)
+    if not len(candidates):
+        return []
+    candidates /= np.maximum(np.linalg.norm(candidates, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(query_vector, dtype=np.float32)
+    query /= max(np.linalg.norm(query), 1e-12)
+    relevance = candidates @ query
+    similarity = candidates @ candidates.T
+    redundancy = np.zeros(len(candidates), dtype=np.float32)
+    available = np.ones(len(candidates), dtype=bool)
+    order = []
+    for _ in range(min(k, len(candidates))):
+        scores = np.where(available, lambda_mult * relevance - (1 - lambda_mult) * redundancy, -np.inf)
+        best = int(np.argmax(scores))
+        order.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, similarity[best])
+    return order
+
+
+class ContextAssembler:
+    """
+    Builds the prompt context from the structured neighborhood lines and the
+    vector search hits within a token budget.
+
+    Repeated lines and overlapping chunks are dropped, the remaining
+    candidates are ordered by maximal marginal relevance to the question
+    (when embeddings are given; otherwise retrieval order is kept), and
+    packed greedily until max_tokens tiktoken tokens are used. Only the
+    neighborhood lines are embedded: chunks carry the vector stored with
+    them (metadata EMBEDDING_KEY) and the question vector comes from the
+    vector search, when given.
+    """
+
+    def __init__(self, embeddings=None, max_tokens: int = 3000, lambda_mult: float = 0.5,
+                 overlap_threshold: float = 0.8):
+        self.embeddings = embeddings
+        self.max_tokens = max_tokens
+        self.lambda_mult = lambda_mult
+        self.overlap_threshold = overlap_threshold
+
+    def _candidates(self, structured: str, documents: List[Document]):
+        lines = dedupe_lines(structured.split("\n"))
+        documents = dedupe_documents(documents, self.overlap_threshold)
+        return lines, documents, lines + [d.page_content for d in documents]
+
+    def _pack(self, lines: List[str], documents: List[Document], order: List[int]) -> str:
+        budget = self.max_tokens
+        selected = set()
+        for i in order:
+            text = lines[i] if i < len(lines) else documents[i - len(lines)].page_content
+            # Plus the separator between entries
+            tokens = count_tokens(text) + 2
+            if tokens <= budget:
+                selected.add(i)
+                budget -= tokens
+        # Sections keep their retrieval order, only membership comes from the ranking
+        kept_lines = [line for i, line in enumerate(lines) if i in selected]
+        kept_documents = [d for i, d in enumerate(documents) if i + len(lines) in selected]
+        telemetry.add(candidates=len(lines) + len(documents), kept=len(selected),
+                      context_tokens=self.max_tokens - budget)
+        return format_context("\n".join(kept_lines), kept_documents)
+
+    @staticmethod
+    def _missing(question: str, question_vector, lines: List[str], documents: List[Document]) -> List[str]:
+        """Texts still to embed: the question unless its vector is given, the lines, and chunks without a stored vector."""
+        texts = [question] if question_vector is None else []
+        return texts + lines + [d.page_content for d in documents if EMBEDDING_KEY not in d.metadata]
+
+    def _order(self, question_vector, lines: List[str], documents: List[Document], embedded: List) -> List[int]:
+        embedded = iter(embedded)
+        query = next(embedded) if question_vector is None else question_vector
+        vectors = [next(embedded) for _ in lines]
+        vectors += [d.metadata[EMBEDDING_KEY] if EMBEDDING_KEY in d.metadata else next(embedded) for d in documents]
+        return mmr(query, vectors, len(vectors), self.lambda_mult)
+
+    def assemble(self, question: str, structured: str, documents: List[Document],
+                 question_vector: Optional[List[float]] = None) -> str:
+        with telemetry.stage("assemble"):
+            lines, documents, texts = self._candidates(structured, documents)
+            order = list(range(len(texts)))
+            if self.embeddings is not None and texts:
+                missing = self._missing(question, question_vector, lines, documents)
+                embedded = self.embeddings.embed_documents(missing) if missing else []
+                order = self._order(question_vector, lines, documents, embedded)
+            return self._pack(lines, documents, order)
+
+    async def aassemble(self, question: str, structured: str, documents: List[Document],
+                        question_vector: Optional[List[float]] = None) -> str:
+        with telemetry.stage("assemble"):
+            lines, documents, texts = self._candidates(structured, documents)
+            order = list(range(len(texts)))
+            if self.embeddings is not None and texts:
+                missing = self._missing(question, question_vector, lines, documents)
+                embedded = await self.embeddings.aembed_documents(missing) if missing else []
+                order = self._order(question_vector, lines, documents, embedded)
+            return self._pack(lines, documents, order)
@@ -0,0 +1,221 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from .connections import SharedNeo4jGraph
+
+# Quoted string literals and number literals in generated Cypher. Backtick
+# quoted names are matched so digits inside them are skipped; numbers that
+# are part of a name, a property access or a variable-length range are not
+# literals.
+_LITERAL = re.compile(r"""'((?:[^'\\]|\\.)*)'|"((?:[^"\\]|\\.)*)"|`[^`]*`|(?<![\w.$*])(\d+(?:\.\d+)?)(?![\w.])""")
+_NUMBER = r"\d+(?:\.\d+)?"
+
+
+def _number(value: str):
+    return float(value) if "." in value else int(value)
+
+
+def _write_json(path: str, value: Any):
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(value, f, default=str)
+    os.replace(tmp, path)
+
+
+def schema_fingerprint(graph) -> str:
+    """
+    Hash of the label, relationship type and property key tokens. Reading the
+    token lists is cheap even on large databases, unlike full introspection.
+    """
+    row = graph.query("""
+        CALL db.labels() YIELD label WITH collect(label) AS labels
+        CALL db.relationshipTypes() YIELD relationshipType WITH labels, collect(relationshipType) AS types
+        CALL db.propertyKeys() YIELD propertyKey
+        RETURN labels, types, collect(propertyKey) AS keys""")[0]
+    tokens = [sorted(row["labels"]), sorted(row["types"]), sorted(row["keys"])]
+    return hashlib.sha256(json.dumps(tokens).encode("utf-8")).hexdigest()
+
+
+def load_schema(graph, path: str = ".cache/schema.json", max_age: Optional[float] = None) -> bool:
+    """
+    Restore graph.schema/structured_schema from a snapshot on disk, running
+    the expensive refresh_schema() only when the snapshot is missing, too old
+    or its fingerprint no longer matches the database. Returns True when the
+    snapshot was used.
+    """
+    fingerprint = schema_fingerprint(graph)
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            snapshot = json.load(f)
+        fresh = max_age is None or time.time() - snapshot["created"] < max_age
+        if snapshot["fingerprint"] == fingerprint and fresh:
+            graph.schema = snapshot["schema"]
+            graph.structured_schema = snapshot["structured_schema"]
+            return True
+    graph.refresh_schema()
+    _write_json(path, {
+        "fingerprint": fingerprint,
+        "created": time.time(),
+        "schema": graph.schema,
+        "structured_schema": graph.structured_schema,
+    })
+    return False
+
+
+def get_snapshot_graph(url: str, username: str, password: str, path: str = ".cache/schema.json",
+                       **kwargs) -> SharedNeo4jGraph:
+    """Neo4jGraph whose schema comes from the on-disk snapshot when it is still current."""
+    graph = SharedNeo4jGraph(url=url, username=username, password=password, refresh_schema=False, **kwargs)
+    load_schema(graph, path)
+    return graph
+
+
+def normalize_question(question: str) -> str:
+    return re.sub(r"\s+", " ", question).strip()
+
+
+def parameterize(question: str, cypher: str) -> Tuple[str, str, Dict[str, Any]]:
+    """
+    Turn literals of the generated Cypher that also appear in the question
+    as whole words into parameters. Returns the parameterized Cypher, a
+    template regex matching questions of the same shape, and the parameters
+    of this question.
+
+    "Who are the officers of ZZZ-MILI COMPANY LTD.?" becomes the template
+    "Who are the officers of (.+?)\\?" and the Cypher gets $p0 in place of
+    the company name. Only quoted strings and number literals are
+    candidates, a value found inside a longer word of the question stays a
+    literal, and a value used twice in the Cypher becomes one parameter.
+    """
+    question = normalize_question(question)
+    params: Dict[str, Any] = {}
+    names: Dict[Tuple[bool, str], str] = {}
+    spans: List[Tuple[int, int, str]] = []
+
+    def locate(value: str) -> Optional[Tuple[int, int]]:
+        for found in re.finditer(r"(?<!\w)" + re.escape(value) + r"(?!\w)", question):
+            if not any(found.start() < e and s < found.end() for s, e, _ in spans):
+                return found.span()
+        return None
+
+    def replace(match):
+        number = match.group(3)
+        value = number if number is not None else match.group(1) if match.group(1) is not None else match.group(2)
+        if not value:
+            return match.group(0)
+        key = (number is not None, value)
+        if key not in names:
+            span = locate(value)
+            if span is None:
+                return match.group(0)
+            names[key] = f"p{len(params)}"
+            params[names[key]] = _number(value) if number is not None else value
+            spans.append((*span, names[key]))
+        return "$" + names[key]
+
+    parameterized = _LITERAL.sub(replace, cypher)
+    # Capture groups in question order
+    template, last = "", 0
+    for start, end, name in sorted(spans):
+        pattern = _NUMBER if not isinstance(params[name], str) else ".+?"
+        template += re.escape(question[last:start]) + f"(?P<{name}>{pattern})"
+        last = end
+    template += re.escape(question[last:])
+    return parameterized, template, params
+
+
+class CypherCache:
+    """
+    Generated Cypher keyed by question, persisted as JSON.
+
+    Besides exact question matches, every entry keeps a template of its
+    question with the literal values cut out, so "officers of X" reuses the
+    query generated for "officers of Y" with X as parameter.
+    """
+
+    def __init__(self, path: str = ".cache/cypher.json"):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self._entries = json.load(f)
+        self._templates = {key: re.compile(e["template"]) for key, e in self._entries.items()}
+
+    def get(self, question: str) -> Optional[Tuple[str, Dict[str, str]]]:
+        question = normalize_question(question)
+        with self._lock:
+            entry = self._entries.get(question)
+            if entry is not None:
+                self.hits += 1
+                return entry["cypher"], entry["params"]
+            for key, template in self._templates.items():
+                match = template.fullmatch(question)
+                if match:
+                    self.hits += 1
+                    params = match.groupdict()
+                    for name in self._entries[key].get("numbers", []):
+                        params[name] = _number(params[name])
+                    return self._entries[key]["cypher"], params
+            self.misses += 1
+            return None
+
+    def put(self, question: str, cypher: str):
+        parameterized, template, params = parameterize(question, cypher)
+        key = normalize_question(question)
+        with self._lock:
+            self._entries[key] = {"cypher": parameterized, "template": template, "params": params,
+                                  "numbers": [name for name, value in params.items() if not isinstance(value, str)]}
+            self._templates[key] = re.compile(template)
+            _write_json(self.path, self._entries)
+
+
+class CachedCypherQAChain:
+    """
+    Wraps a GraphCypherQAChain so questions seen before, or of a shape seen
+    before, skip Cypher generation and go straight to the database.
+    """
+
+    def __init__(self, chain, cache: Optional[CypherCache] = None):
+        self.cache = cache or CypherCache()
+        # The generated Cypher is read back from the intermediate steps of a
+        # copy, so the caller's chain keeps its own setting
+        self.return_intermediate_steps = chain.return_intermediate_steps
+        copy = getattr(chain, "model_copy", None) or chain.copy
+        self.chain = copy(update={"return_intermediate_steps": True})
+
+    def _answer(self, question: str, context: List[Dict[str, Any]]):
+        if self.chain.return_direct:
+            return context
+        # Function responses only exist in newer langchain-community releases
+        if getattr(self.chain, "use_function_response", False):
+            from langchain_community.chains.graph_qa.cypher import get_function_response
+            return self.chain.qa_chain.invoke({"question": question, "function_response": get_function_response(question, context)})
+        result = self.chain.qa_chain.invoke({"question": question, "context": context})
+        return result[self.chain.qa_chain.output_key] if isinstance(result, dict) else result
+
+    def invoke(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        question = inputs[self.chain.input_key]
+        cached = self.cache.get(question)
+        if cached is not None:
+            cypher, params = cached
+            context = self.chain.graph.query(cypher, params)[: self.chain.top_k]
+            result = {self.chain.input_key: question, self.chain.output_key: self._answer(question, context),
+                      "intermediate_steps": [{"query": cypher, "params": params}, {"context": context}]}
+        else:
+            result = self.chain.invoke(inputs)
+            cypher = result["intermediate_steps"][0]["query"]
+            if cypher:
+                self.cache.put(question, cypher)
+        if not self.return_intermediate_steps:
+            result.pop("intermediate_steps")
+        return result
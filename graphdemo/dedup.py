@@ -0,0 +1,162 @@
+"""
+Near-duplicate chunk detection with MinHash and LSH banding, so only one
+chunk of every cluster of near-identical passages is extracted and
+embedded. The others are written afterwards, pointing at the
+representative's entities and sharing its embedding.
+"""
+import re
+import zlib
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from . import telemetry
+from .extraction import count_tokens
+from .graph_writer import quote
+from .incremental import fingerprint
+
+_PRIME = (1 << 61) - 1
+
+# Duplicates are written as chunk nodes of their own, with the MENTIONS edges
+# and the embedding of the representative. A representative that failed
+# extraction leaves its duplicates without them, embed_missing picks them up.
+LINK_QUERY = """
+UNWIND $rows AS row
+MERGE (d:{label} {{id: row.id}})
+SET d.{text} = row.text
+SET d += row.metadata
+SET d.duplicate_of = row.representative
+WITH d, row
+MATCH (r:{label} {{id: row.representative}})
+SET d.{embedding} = r.{embedding}
+WITH d, r
+MATCH (r)-[:MENTIONS]->(e)
+MERGE (d)-[:MENTIONS]->(e)
+"""
+
+
+def chunk_id(document: Document) -> str:
+    return document.metadata.get("id") or fingerprint(document)
+
+
+@dataclass
+class DedupStats:
+    chunks: int = 0
+    duplicates: int = 0
+    # Chunk tokens of the duplicates, each once for extraction and once for embedding
+    tokens: int = 0
+
+    def __str__(self):
+        return (f"{self.duplicates} of {self.chunks} chunks are near-duplicates, saving {self.duplicates} "
+                f"extraction calls and {self.duplicates} embeddings (~{self.tokens} chunk tokens not sent to either)")
+
+
+class NearDuplicateIndex:
+    """
+    MinHash signatures of word shingles, bucketed by LSH bands.
+
+    add() returns the id of an already indexed chunk whose estimated
+    Jaccard similarity to the new one is at least threshold, or indexes the
+    new chunk as a representative and returns None. Only representatives are
+    indexed, so every duplicate is within threshold of its representative.
+    With num_perm=128 and bands=16, pairs above ~0.7 similarity become
+    candidates with high probability.
+    """
+
+    def __init__(self, threshold: float = 0.8, num_perm: int = 128, bands: int = 16, shingle_size: int = 5,
+                 seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        # a * x stays below 2 ** 63 for 32-bit shingle hashes
+        self._a = rng.integers(1, 1 << 31, num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 31, num_perm, dtype=np.uint64)
+        self._buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(bands)]
+        self._ids: List[str] = []
+        self._signatures: List[np.ndarray] = []
+        self._known: Dict[str, int] = {}
+        self.stats = DedupStats()
+
+    def _shingles(self, text: str) -> np.ndarray:
+        words = re.findall(r"\w+", text.lower())
+        k = min(self.shingle_size, len(words)) or 1
+        shingles = {" ".join(words[i:i + k]) for i in range(max(1, len(words) - k + 1))}
+        return np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = self._shingles(text)
+        return ((np.outer(hashes, self._a) + self._b) % _PRIME).min(axis=0)
+
+    def _candidates(self, signature: np.ndarray) -> List[int]:
+        candidates = set()
+        for band, buckets in enumerate(self._buckets):
+            candidates.update(buckets.get(signature[band * self.rows:(band + 1) * self.rows].tobytes(), ()))
+        return sorted(candidates)
+
+    def add(self, document: Document) -> Optional[str]:
+        self.stats.chunks += 1
+        doc_id = chunk_id(document)
+        if doc_id in self._known:
+            # Same text, same chunk node
+            self.stats.duplicates += 1
+            self.stats.tokens += count_tokens(document.page_content)
+            return doc_id
+        signature = self.signature(document.page_content)
+        candidates = self._candidates(signature)
+        if candidates:
+            similarity = (np.vstack([self._signatures[i] for i in candidates]) == signature).mean(axis=1)
+            best = int(np.argmax(similarity))
+            if similarity[best] >= self.threshold:
+                self.stats.duplicates += 1
+                self.stats.tokens += count_tokens(document.page_content)
+                return self._ids[candidates[best]]
+        position = self._known[doc_id] = len(self._ids)
+        self._ids.append(doc_id)
+        self._signatures.append(signature)
+        for band, buckets in enumerate(self._buckets):
+            buckets.setdefault(signature[band * self.rows:(band + 1) * self.rows].tobytes(), []).append(position)
+        return None
+
+
+def deduplicate(documents: List[Document], index: Optional[NearDuplicateIndex] = None
+                ) -> Tuple[List[Document], List[Tuple[Document, str]]]:
+    """
+    Split chunks into representatives, to extract and embed, and
+    (duplicate, representative id) pairs for link_duplicates.
+    """
+    index = index or NearDuplicateIndex()
+    representatives, duplicates = [], []
+    with telemetry.stage("deduplicate") as span:
+        for document in documents:
+            representative = index.add(document)
+            if representative is None:
+                representatives.append(document)
+            else:
+                duplicates.append((document, representative))
+        span.add(chunks=len(documents), near_duplicates=len(duplicates))
+    return representatives, duplicates
+
+
+def link_duplicates(graph, duplicates: List[Tuple[Document, str]], label: str = "Document",
+                    text_node_property: str = "text", embedding_node_property: str = "embedding",
+                    batch_size: int = 1000) -> int:
+    """
+    Write the duplicate chunks once their representatives are in the graph.
+    Exact duplicates already share the representative's node and are
+    skipped. Returns the number of chunk nodes written.
+    """
+    rows = [{"id": chunk_id(d), "text": d.page_content, "metadata": d.metadata, "representative": r}
+            for d, r in duplicates if chunk_id(d) != r]
+    query = LINK_QUERY.format(label=quote(label), text=quote(text_node_property),
+                              embedding=quote(embedding_node_property))
+    with telemetry.stage("link_duplicates") as span:
+        for i in range(0, len(rows), batch_size):
+            graph.query(query, {"rows": rows[i:i + batch_size]})
+        span.add(rows_written=len(rows))
+    return len(rows)
@@ -0,0 +1,170 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from . import telemetry
+from .extraction import count_tokens
+from .graph_writer import quote
+
+
+def text_key(namespace: str, text: str) -> str:
+    return hashlib.sha256(f"{namespace}\x00{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    """SQLite text-hash -> vector store, vectors kept as float32 blobs."""
+
+    def __init__(self, path: str = ".cache/embeddings.sqlite"):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embedding (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+        self._conn.commit()
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embedding WHERE key IN ({','.join('?' * len(chunk))})", chunk)
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embedding (key, vector) VALUES (?, ?)",
+                [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items.items()])
+            self._conn.commit()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that only sends unseen text to the embedding model.
+
+    Vectors are cached on disk by a hash of model and text. Cache misses are
+    grouped into requests sized by tokens rather than by document count, and
+    up to max_concurrency requests are in flight at once. Drop-in for the
+    embedding argument of Neo4jVector.
+    """
+
+    def __init__(self, embeddings: Embeddings, namespace: Optional[str] = None, store: Optional[EmbeddingStore] = None,
+                 max_batch_tokens: int = 100_000, max_batch_size: int = 2048, max_concurrency: int = 4):
+        self.embeddings = embeddings
+        self.namespace = namespace or getattr(embeddings, "deployment", None) or getattr(embeddings, "model", None) or "default"
+        self.store = store or EmbeddingStore()
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max_concurrency
+        self.hits = 0
+        self.misses = 0
+        self.api_calls = 0
+
+    def _batches(self, texts: List[str]) -> List[List[str]]:
+        batches, batch, tokens = [], [], 0
+        for text in texts:
+            size = count_tokens(text)
+            if batch and (tokens + size > self.max_batch_tokens or len(batch) >= self.max_batch_size):
+                batches.append(batch)
+                batch, tokens = [], 0
+            batch.append(text)
+            tokens += size
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _lookup(self, texts: List[str]):
+        keys = [text_key(self.namespace, t) for t in texts]
+        found = self.store.get_many(list(set(keys)))
+        missing = list(dict.fromkeys(t for t, k in zip(texts, keys) if k not in found))
+        self.hits += len(texts) - sum(1 for k in keys if k not in found)
+        self.misses += len(missing)
+        return keys, found, missing
+
+    def _store(self, found: Dict[str, np.ndarray], batch: List[str], vectors: List[List[float]]):
+        items = {text_key(self.namespace, t): v for t, v in zip(batch, vectors)}
+        self.store.put_many(items)
+        found.update({k: np.asarray(v, dtype=np.float32) for k, v in items.items()})
+
+    @telemetry.traced("embed")
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, found, missing = self._lookup(texts)
+        telemetry.add(texts=len(texts), embedded=len(missing))
+        if missing:
+            batches = self._batches(missing)
+            self.api_calls += len(batches)
+            telemetry.add(api_calls=len(batches))
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+                for batch, vectors in zip(batches, pool.map(self.embeddings.embed_documents, batches)):
+                    self._store(found, batch, vectors)
+        return [found[k].tolist() for k in keys]
+
+    @telemetry.traced("embed")
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, found, missing = self._lookup(texts)
+        telemetry.add(texts=len(texts), embedded=len(missing))
+        if missing:
+            batches = self._batches(missing)
+            self.api_calls += len(batches)
+            telemetry.add(api_calls=len(batches))
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+
+            async def embed(batch):
+                async with semaphore:
+                    return await self.embeddings.aembed_documents(batch)
+
+            for batch, vectors in zip(batches, await asyncio.gather(*(embed(b) for b in batches))):
+                self._store(found, batch, vectors)
+        return [found[k].tolist() for k in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+def node_text(properties: Dict[str, str], text_node_properties: List[str]) -> str:
+    # Same text Neo4jVector.from_existing_graph builds, so both paths share cache entries
+    return "".join(f"\n{k}:{properties.get(k) or ''}" for k in text_node_properties)
+
+
+def write_embeddings(graph, rows: List[Dict], label: str = "Document", embedding_node_property: str = "embedding"):
+    """Bulk write-back of {"id", "vector"} rows to the embedding property."""
+    graph.query(
+        f"""UNWIND $rows AS row
+        MATCH (n:{quote(label)} {{id: row.id}})
+        CALL db.create.setNodeVectorProperty(n, $property, row.vector)""",
+        {"rows": rows, "property": embedding_node_property})
+
+
+def embed_missing(graph, embeddings: Embeddings, label: str = "Document", text_node_properties: List[str] = ["text"],
+                  embedding_node_property: str = "embedding", batch_size: int = 1000) -> int:
+    """
+    Embed every node of the label that has no embedding yet and write the
+    vectors back in bulk. Returns the number of embedded nodes.
+    """
+    total = 0
+    while True:
+        nodes = graph.query(
+            f"""MATCH (n:{quote(label)}) WHERE n.{quote(embedding_node_property)} IS NULL AND n.id IS NOT NULL
+            RETURN n.id AS id, n {{{', '.join('.' + quote(p) for p in text_node_properties)}}} AS properties
+            LIMIT $limit""",
+            {"limit": batch_size})
+        if not nodes:
+            return total
+        vectors = embeddings.embed_documents([node_text(n["properties"], text_node_properties) for n in nodes])
+        write_embeddings(graph, [{"id": n["id"], "vector": v} for n, v in zip(nodes, vectors)], label,
+                         embedding_node_property)
+        total += len(nodes)
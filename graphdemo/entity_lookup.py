@@ -0,0 +1,174 @@
+"""
+Tiered entity lookup for the structured retriever: an exact seek on the
+normalized id, then a phrase/prefix fulltext query, then a fuzzy one, each
+tier only for the names the previous ones did not resolve. Resolved names
+are cached until the graph version changes.
+"""
+import asyncio
+import threading
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from langchain_community.vectorstores.neo4j_vector import remove_lucene_chars
+
+from . import telemetry
+from .answer_cache import ExactCache, GraphVersion
+from .entity_matcher import normalize
+from .graph_writer import BASE_ENTITY_LABEL, quote
+
+TIERS = ("exact", "prefix", "fuzzy")
+
+# One round trip for all names. The fulltext subqueries only run for names
+# the earlier tiers left unresolved; an aggregating subquery still returns
+# one (empty) row when its input was filtered out.
+LOOKUP_QUERY = f"""
+UNWIND $lookups AS lookup
+CALL {{
+  WITH lookup
+  OPTIONAL MATCH (e:{quote(BASE_ENTITY_LABEL)} {{normalized_id: lookup.normalized}})
+  WITH lookup, collect(e.id)[..$limit] AS exact
+  CALL {{
+    WITH lookup, exact
+    WITH lookup, exact WHERE exact = [] AND lookup.prefix IS NOT NULL
+    CALL db.index.fulltext.queryNodes('entity', lookup.prefix, {{limit: $limit}})
+    YIELD node
+    RETURN collect(node.id) AS prefix
+  }}
+  CALL {{
+    WITH lookup, exact, prefix
+    WITH lookup, exact, prefix WHERE exact = [] AND prefix = [] AND lookup.fuzzy IS NOT NULL
+    CALL db.index.fulltext.queryNodes('entity', lookup.fuzzy, {{limit: $limit}})
+    YIELD node
+    RETURN collect(node.id) AS fuzzy
+  }}
+  RETURN CASE WHEN exact <> [] THEN 'exact' WHEN prefix <> [] THEN 'prefix' WHEN fuzzy <> [] THEN 'fuzzy' END AS tier,
+         exact + prefix + fuzzy AS ids
+}}
+RETURN lookup.normalized AS normalized, tier, ids
+"""
+
+
+def ensure_normalized_ids(graph, batch_size: int = 1000) -> int:
+    """
+    Range index on __Entity__.normalized_id, and the property on entities
+    written before BulkGraphWriter set it. Returns the number of entities
+    updated.
+    """
+    entity = quote(BASE_ENTITY_LABEL)
+    graph.query(f"CREATE INDEX entity_normalized_id IF NOT EXISTS FOR (e:{entity}) ON (e.normalized_id)")
+    total = 0
+    while True:
+        rows = graph.query(
+            f"MATCH (e:{entity}) WHERE e.normalized_id IS NULL AND e.id IS NOT NULL RETURN e.id AS id LIMIT $limit",
+            {"limit": batch_size})
+        if not rows:
+            return total
+        graph.query(
+            f"UNWIND $rows AS row MATCH (e:{entity} {{id: row.id}}) SET e.normalized_id = row.normalized_id",
+            {"rows": [{"id": row["id"], "normalized_id": normalize(str(row["id"]))} for row in rows]})
+        total += len(rows)
+
+
+def prefix_query(name: str) -> Optional[str]:
+    """The name as a phrase, or every word as a prefix; words under 3 characters must match whole."""
+    words = remove_lucene_chars(name).lower().split()
+    if not words:
+        return None
+    terms = " AND ".join(f"{w}*" if len(w) >= 3 else w for w in words)
+    return f'"{" ".join(words)}" OR ({terms})' if len(words) > 1 else terms
+
+
+def fuzzy_query(name: str) -> Optional[str]:
+    """Every word with an edit distance that grows with its length: none up to 3 characters, 1 up to 6, else 2."""
+    words = remove_lucene_chars(name).lower().split()
+    if not words:
+        return None
+    return " AND ".join(w if len(w) <= 3 else f"{w}~1" if len(w) <= 6 else f"{w}~2" for w in words)
+
+
+class EntityLookup:
+    """
+    Resolves entity names to __Entity__ ids, cheapest tier first (see
+    LOOKUP_QUERY). Results, including names that resolved to nothing, are
+    kept in an LRU that is dropped whenever the graph version changes, so a
+    repeated name costs no round trip at all.
+    """
+
+    def __init__(self, graph, graph_version: Optional[GraphVersion] = None, limit: int = 2,
+                 max_size: int = 4096, ttl: float = 3600):
+        self.graph = graph
+        self.graph_version = graph_version
+        self.limit = limit
+        self.cache = ExactCache(max_size, ttl)
+        self.counts = {"cache": 0, **{tier: 0 for tier in TIERS}, "missing": 0}
+        self._version = None
+        self._lock = threading.Lock()
+
+    def _plan(self, names: List[str], version: Optional[int]
+              ) -> Tuple[List[str], Dict[str, List[str]], List[Dict[str, str]]]:
+        """Normalized names in order, the cached ids, and the lookups still to run."""
+        # The fulltext index does not fold accents, so its queries use the name as given
+        originals = {}
+        for name in names:
+            originals.setdefault(normalize(name), name)
+        keys = [key for key in originals if key]
+        with self._lock:
+            if version != self._version:
+                self.cache.clear()
+                self._version = version
+            cached = {key: ids for key in keys if (ids := self.cache.get(key)) is not None}
+            self.counts["cache"] += len(cached)
+        telemetry.add(cache_hits=len(cached))
+        lookups = [{"normalized": key, "prefix": prefix_query(originals[key]), "fuzzy": fuzzy_query(originals[key])}
+                   for key in keys if key not in cached]
+        return keys, cached, lookups
+
+    def _store(self, rows: List[Dict]) -> Dict[str, List[str]]:
+        tiers = {}
+        with self._lock:
+            for row in rows:
+                tier = row["tier"] or "missing"
+                tiers[tier] = tiers.get(tier, 0) + 1
+                self.counts[tier] += 1
+                self.cache.put(row["normalized"], row["ids"])
+        telemetry.add(**tiers)
+        return {row["normalized"]: row["ids"] for row in rows}
+
+    @staticmethod
+    def _ids(keys: List[str], cached: Dict[str, List[str]], found: Dict[str, List[str]]) -> List[List[str]]:
+        return [ids for key in keys if (ids := cached.get(key) or found.get(key))]
+
+    async def _aversion(self) -> Optional[int]:
+        return await self.graph_version.aget() if self.graph_version is not None else None
+
+    async def _aquery(self, lookups: List[Dict[str, str]], read) -> List[Dict]:
+        if not lookups:
+            return []
+        params = {"lookups": lookups, "limit": self.limit}
+        if read is not None:
+            return await read(LOOKUP_QUERY, params)
+        return await asyncio.to_thread(self.graph.query, LOOKUP_QUERY, params)
+
+    def resolve(self, names: List[str]) -> List[List[str]]:
+        """The ids of every name that resolved, one list per name."""
+        with telemetry.stage("entity_lookup"):
+            keys, cached, lookups = self._plan(names, self.graph_version.get() if self.graph_version else None)
+            rows = getattr(self.graph, "read_query", self.graph.query)(
+                LOOKUP_QUERY, {"lookups": lookups, "limit": self.limit}) if lookups else []
+            return self._ids(keys, cached, self._store(rows))
+
+    async def aresolve(self, names: List[str],
+                       read: Optional[Callable[[str, dict], Awaitable[List[Dict]]]] = None) -> List[List[str]]:
+        """resolve() with the round trip through read, e.g. GraphRetriever._aread."""
+        return (await self.aresolve_many([names], read))[0]
+
+    async def aresolve_many(self, batches: List[List[str]],
+                            read: Optional[Callable[[str, dict], Awaitable[List[Dict]]]] = None
+                            ) -> List[List[List[str]]]:
+        """aresolve() for the names of several questions, in one round trip."""
+        with telemetry.stage("entity_lookup"):
+            version = await self._aversion()
+            plans = [self._plan(names, version) for names in batches]
+            # A name asked by several questions is looked up once
+            lookups = list({lookup["normalized"]: lookup for _, _, pending in plans for lookup in pending}.values())
+            found = self._store(await self._aquery(lookups, read))
+            return [self._ids(keys, cached, found) for keys, cached, _ in plans]
@@ -0,0 +1,147 @@
+import re
+import threading
+import unicodedata
+from collections import deque
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from langchain_core.runnables import RunnableLambda
+
+_NON_WORD = re.compile(r"[^\w]+")
+
+
+def normalize(text: str) -> str:
+    """Casefold, strip accents and collapse punctuation, so 'Skłodowska-Curie' matches 'sklodowska curie'."""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return _NON_WORD.sub(" ", text.casefold().replace("ł", "l").replace("ø", "o")).strip()
+
+
+class MatchedEntities(NamedTuple):
+    names: List[str]
+
+
+class EntityMatcher:
+    """
+    Aho-Corasick automaton over normalized entity ids and aliases.
+
+    Matching a question is a single pass over its characters, independent of
+    the number of entities. Patterns can be added at any time; the failure
+    links are rebuilt lazily on the next match.
+    """
+
+    def __init__(self, min_length: int = 3):
+        self.min_length = min_length
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._terminal: List[Optional[str]] = [None]
+        self._output: List[List[str]] = [[]]
+        self._ids: Dict[str, Set[str]] = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+        self.matched = 0
+        self.fallbacks = 0
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add(self, entity_id: str, aliases: Iterable[str] = ()):
+        with self._lock:
+            for name in [entity_id, *aliases]:
+                pattern = normalize(name)
+                if len(pattern) < self.min_length:
+                    continue
+                if pattern not in self._ids:
+                    self._insert(pattern)
+                    self._ids[pattern] = set()
+                self._ids[pattern].add(entity_id)
+
+    def _insert(self, pattern: str):
+        state = 0
+        for char in pattern:
+            nxt = self._goto[state].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto.append({})
+                self._terminal.append(None)
+                self._goto[state][char] = nxt
+            state = nxt
+        self._terminal[state] = pattern
+        self._dirty = True
+
+    def _build(self):
+        self._output = [[pattern] if pattern else [] for pattern in self._terminal]
+        self._fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(char, 0)
+                self._output[nxt] = self._output[nxt] + self._output[self._fail[nxt]]
+        self._dirty = False
+
+    def load(self, graph, label: str = "__Entity__"):
+        """Load every entity id and its aliases from the graph."""
+        for row in graph.query(f"MATCH (e:`{label}`) RETURN e.id AS id, coalesce(e.aliases, []) AS aliases"):
+            if row["id"]:
+                self.add(str(row["id"]), [str(a) for a in row["aliases"]])
+        return self
+
+    def add_graph_documents(self, graph_documents):
+        """Writer listener: keeps the automaton in step with newly written entities."""
+        for graph_document in graph_documents:
+            for node in graph_document.nodes:
+                self.add(str(node.id), node.properties.get("aliases", []) if node.properties else [])
+
+    def match(self, text: str) -> List[str]:
+        """
+        Entity ids mentioned in text. Only whole-word matches count, and
+        overlapping matches resolve to the longest leftmost one.
+        """
+        with self._lock:
+            if self._dirty:
+                self._build()
+            text = normalize(text)
+            spans: List[Tuple[int, int, str]] = []
+            state = 0
+            for i, char in enumerate(text):
+                while state and char not in self._goto[state]:
+                    state = self._fail[state]
+                state = self._goto[state].get(char, 0)
+                for pattern in self._output[state]:
+                    start = i - len(pattern) + 1
+                    if (start == 0 or text[start - 1] == " ") and (i + 1 == len(text) or text[i + 1] == " "):
+                        spans.append((start, i + 1, pattern))
+            spans.sort(key=lambda s: (s[0], -(s[1] - s[0])))
+            names, end = [], -1
+            for start, stop, pattern in spans:
+                if start >= end:
+                    names.extend(sorted(self._ids[pattern]))
+                    end = stop
+            return list(dict.fromkeys(names))
+
+    def as_entity_chain(self, fallback) -> RunnableLambda:
+        """
+        Drop-in for entity_chain: answers from the automaton and only calls
+        the LLM fallback when nothing in the question matches.
+        """
+        def invoke(inputs):
+            names = self.match(inputs["question"])
+            if names:
+                self.matched += 1
+                return MatchedEntities(names)
+            self.fallbacks += 1
+            return fallback.invoke(inputs)
+
+        async def ainvoke(inputs):
+            names = self.match(inputs["question"])
+            if names:
+                self.matched += 1
+                return MatchedEntities(names)
+            self.fallbacks += 1
+            return await fallback.ainvoke(inputs)
+
+        return RunnableLambda(invoke, afunc=ainvoke).with_config(run_name="EntityMatcher")
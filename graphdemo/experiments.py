@@ -0,0 +1,200 @@
+"""
+Extraction schema experiments: the LLMGraphTransformer configurations of
+01-building-kg.py run concurrently over the same chunks, each written into
+its own label namespace, and compared in one table.
+"""
+import asyncio
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.documents import Document
+
+from . import telemetry
+from .extraction import RateLimiter, extract_documents
+from .extraction_cache import extraction_schema
+from .graph_writer import BulkGraphWriter, quote
+from .reset import delete_nodes
+
+_RELATIONSHIP_TYPES = [
+    ("Person", "SPOUSE", "Person"),
+    ("Person", "AWARD", "Award"),
+    ("Person", "WORKS_AT", "Organization"),
+    ("Organization", "IN_LOCATION", "Location"),
+    ("Person", "FIELD_OF_RESEARCH", "ResearchField"),
+]
+_NODES = ["Person", "Organization", "Location", "Award", "ResearchField"]
+
+
+@dataclass
+class Variant:
+    """One extraction configuration; schema holds LLMGraphTransformer keyword arguments."""
+    name: str
+    schema: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def label_prefix(self) -> str:
+        return "x_" + re.sub(r"\W+", "_", self.name) + "__"
+
+
+VARIANTS = [
+    Variant("no_schema"),
+    Variant("allowed_nodes", {"allowed_nodes": _NODES}),
+    Variant("relation_types", {
+        "allowed_nodes": ["Person", "Organization", "Place", "Award", "ResearchField"],
+        "allowed_relationships": ["SPOUSE", "AWARD", "FIELD_OF_RESEARCH", "WORKS_AT", "IN_LOCATION"],
+    }),
+    Variant("typed_triples", {"allowed_nodes": _NODES, "allowed_relationships": _RELATIONSHIP_TYPES}),
+    Variant("all_properties", {"allowed_nodes": _NODES, "allowed_relationships": _RELATIONSHIP_TYPES,
+                               "node_properties": True, "relationship_properties": True}),
+    Variant("named_properties", {"allowed_nodes": _NODES, "allowed_relationships": _RELATIONSHIP_TYPES,
+                                 "node_properties": ["birth_date", "death_date"],
+                                 "relationship_properties": ["start_date"]}),
+]
+
+
+class UsageCounter(BaseCallbackHandler):
+    """Calls and tokens of one chat model, whether or not telemetry is enabled."""
+
+    run_inline = True
+
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def on_llm_end(self, response, **kwargs):
+        prompt, completion = telemetry.token_counts(response)
+        self.calls += 1
+        self.prompt_tokens += prompt
+        self.completion_tokens += completion
+
+
+@dataclass
+class VariantResult:
+    name: str
+    label_prefix: str
+    chunks: int = 0
+    failed: int = 0
+    cached: int = 0
+    nodes: int = 0
+    relationships: int = 0
+    labels: List[str] = field(default_factory=list)
+    # Share of entities carrying one of the reference labels
+    label_coverage: float = 0.0
+    llm_calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    seconds: float = 0.0
+
+    @property
+    def tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+
+def drop_namespace(graph, label_prefix: str, batch_size: int = 10000):
+    """Delete the Document and entity nodes written with label_prefix, in transactions of batch_size."""
+    for label in (label_prefix + "Document", label_prefix + "__Entity__"):
+        delete_nodes(graph, label, batch_size=batch_size)
+
+
+def graph_stats(graph, label_prefix: str, reference_labels: Sequence[str]) -> Dict[str, Any]:
+    """Entity and relationship counts, entity labels and label coverage of one namespace."""
+    entity = quote(label_prefix + "__Entity__")
+    row = graph.query(
+        f"""MATCH (n:{entity})
+        WITH count(n) AS nodes, count(CASE WHEN any(l IN labels(n) WHERE l IN $reference) THEN 1 END) AS covered
+        RETURN nodes, covered, COUNT {{ (:{entity})-[]->(:{entity}) }} AS relationships""",
+        {"reference": [label_prefix + label for label in reference_labels]})[0]
+    labels = graph.query(
+        f"MATCH (n:{entity}) UNWIND labels(n) AS label WITH DISTINCT label "
+        "WHERE label STARTS WITH $prefix AND label <> $entity RETURN label ORDER BY label",
+        {"prefix": label_prefix, "entity": label_prefix + "__Entity__"})
+    return {
+        "nodes": row["nodes"],
+        "relationships": row["relationships"],
+        "labels": [r["label"][len(label_prefix):] for r in labels],
+        "label_coverage": row["covered"] / row["nodes"] if row["nodes"] else 0.0,
+    }
+
+
+class ExperimentRunner:
+    """
+    Run extraction variants concurrently over the same chunks.
+
+    Each variant gets its own copy of llm, so calls and tokens are counted per
+    variant, and writes through a BulkGraphWriter with the variant's label
+    prefix, so all of them share one database without their MERGEs meeting.
+    The chunks, the ExtractionCache and the RateLimiter are shared: repeated
+    runs are served from the cache and the concurrent variants stay within
+    one deployment budget together.
+    """
+
+    def __init__(self, graph, llm, documents: List[Document], cache=None, model: str = "",
+                 limiter: Optional[RateLimiter] = None, max_concurrency: int = 8,
+                 reference_labels: Sequence[str] = ()):
+        self.graph = graph
+        self.llm = llm
+        self.documents = documents
+        self.cache = cache
+        self.model = model
+        self.limiter = limiter or RateLimiter()
+        self.max_concurrency = max_concurrency
+        self.reference_labels = list(reference_labels)
+
+    async def run_variant(self, variant: Variant, reference_labels: Sequence[str] = ()) -> VariantResult:
+        from langchain_experimental.graph_transformers import LLMGraphTransformer
+
+        result = VariantResult(variant.name, variant.label_prefix)
+        usage = UsageCounter()
+        llm = self.llm.model_copy(update={"callbacks": list(self.llm.callbacks or []) + [usage]})
+        start = time.perf_counter()
+        # to_thread copies the context, so the writes are nested in the experiment span
+        with telemetry.stage("experiment", variant=variant.name):
+            await asyncio.to_thread(drop_namespace, self.graph, variant.label_prefix)
+            extractions = await extract_documents(
+                LLMGraphTransformer(llm=llm, **variant.schema), self.documents,
+                max_concurrency=self.max_concurrency, cache=self.cache, limiter=self.limiter,
+                schema=extraction_schema(self.model, **variant.schema))
+            writer = BulkGraphWriter(self.graph, label_prefix=variant.label_prefix)
+            await asyncio.to_thread(writer.write, [r.graph_document for r in extractions if r.ok])
+            stats = await asyncio.to_thread(
+                graph_stats, self.graph, variant.label_prefix, reference_labels)
+        result.seconds = time.perf_counter() - start
+        result.chunks = len(extractions)
+        result.failed = sum(1 for r in extractions if not r.ok)
+        result.cached = sum(1 for r in extractions if r.cached)
+        result.llm_calls = usage.calls
+        result.prompt_tokens = usage.prompt_tokens
+        result.completion_tokens = usage.completion_tokens
+        for key, value in stats.items():
+            setattr(result, key, value)
+        return result
+
+    async def arun(self, variants: Sequence[Variant] = VARIANTS) -> List[VariantResult]:
+        # Coverage is measured against the same labels for every variant, by
+        # default all the allowed node labels of the variants compared
+        reference = self.reference_labels or sorted(
+            {label for v in variants for label in v.schema.get("allowed_nodes", ())})
+        return list(await asyncio.gather(*(self.run_variant(v, reference) for v in variants)))
+
+    def run(self, variants: Sequence[Variant] = VARIANTS) -> List[VariantResult]:
+        return asyncio.run(self.arun(variants))
+
+    def cleanup(self, variants: Sequence[Variant] = VARIANTS):
+        for variant in variants:
+            drop_namespace(self.graph, variant.label_prefix)
+
+
+def comparison_table(results: List[VariantResult]) -> str:
+    header = ["variant", "chunks", "failed", "cached", "nodes", "rels", "labels", "coverage",
+              "calls", "tokens", "seconds"]
+    rows = [[r.name, r.chunks, r.failed, r.cached, r.nodes, r.relationships, len(r.labels),
+             f"{r.label_coverage:.0%}", r.llm_calls, r.tokens, f"{r.seconds:.1f}"] for r in results]
+    widths = [max(len(str(row[i])) for row in [header] + rows) for i in range(len(header))]
+    lines = ["  ".join(str(v).ljust(w) if i == 0 else str(v).rjust(w) for i, (v, w) in enumerate(zip(row, widths)))
+             for row in [header] + rows]
+    lines.insert(1, "  ".join("-" * w for w in widths))
+    return "\n".join(lines)
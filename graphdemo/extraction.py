@@ -0,0 +1,198 @@
+import asyncio
+import random
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+import tiktoken
+from langchain_core.documents import Document
+from langchain_community.graphs.graph_document import GraphDocument
+
+from . import telemetry
+
+# Status codes worth retrying: throttling plus transient server side errors
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+RETRYABLE_ERRORS = {"RateLimitError", "APITimeoutError", "APIConnectionError", "InternalServerError"}
+
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    global _encoding
+    if _encoding is None:
+        _encoding = tiktoken.get_encoding("cl100k_base")
+    return len(_encoding.encode(text, disallowed_special=()))
+
+
+class RateLimiter:
+    """
+    Sliding one-minute window over requests and tokens.
+
+    Azure OpenAI deployments are provisioned with a requests-per-minute and a
+    tokens-per-minute quota; acquire() waits until both budgets have room for
+    the next call. A budget of None means unlimited. The limiter can be
+    built outside an event loop, e.g. at module level, and shared by
+    successive asyncio.run calls: its lock is made in the running loop.
+    """
+
+    def __init__(self, requests_per_minute: Optional[int] = None, tokens_per_minute: Optional[int] = None):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._window = deque()
+        self._tokens = 0
+        self._lock = None
+        self._loop = None
+
+    def _prune(self, now: float):
+        while self._window and now - self._window[0][0] >= 60:
+            _, tokens = self._window.popleft()
+            self._tokens -= tokens
+
+    def _has_room(self, tokens: int) -> bool:
+        if self.requests_per_minute and len(self._window) >= self.requests_per_minute:
+            return False
+        # A single call larger than the whole budget is let through on an empty window
+        if self.tokens_per_minute and self._window and self._tokens + tokens > self.tokens_per_minute:
+            return False
+        return True
+
+    async def acquire(self, tokens: int = 0):
+        # An asyncio.Lock belongs to one loop (on Python 3.9 the one current
+        # when it is created), so each loop gets its own
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._lock, self._loop = asyncio.Lock(), loop
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._prune(now)
+                if self._has_room(tokens):
+                    self._window.append((now, tokens))
+                    self._tokens += tokens
+                    return
+                await asyncio.sleep(max(60 - (now - self._window[0][0]), 0.05))
+
+
+@dataclass
+class ExtractionResult:
+    index: int
+    document: Document
+    graph_document: Optional[GraphDocument] = None
+    error: Optional[BaseException] = None
+    attempts: int = 0
+    tokens: int = 0
+    seconds: float = 0.0
+    cached: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def is_retryable(error: BaseException) -> bool:
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    return status in RETRYABLE_STATUS or type(error).__name__ in RETRYABLE_ERRORS
+
+
+def retry_delay(error: BaseException, attempt: int, base: float = 1.0, cap: float = 60.0) -> float:
+    """
+    Backoff for the given attempt, honoring the Retry-After header Azure sends
+    along with 429 responses.
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    retry_after = headers.get("retry-after-ms") or headers.get("retry-after")
+    if retry_after:
+        try:
+            seconds = float(retry_after)
+            return seconds / 1000 if "retry-after-ms" in headers else seconds
+        except ValueError:
+            pass
+    return min(cap, base * 2 ** attempt) * (0.5 + random.random() / 2)
+
+
+async def extract_documents(
+    transformer,
+    documents: List[Document],
+    max_concurrency: int = 8,
+    requests_per_minute: Optional[int] = None,
+    tokens_per_minute: Optional[int] = None,
+    max_retries: int = 6,
+    token_overhead: int = 600,
+    on_result: Optional[Callable[[ExtractionResult], None]] = None,
+    cache=None,
+    schema: Optional[Dict[str, Any]] = None,
+    limiter: Optional[RateLimiter] = None,
+) -> List[ExtractionResult]:
+    """
+    Run LLMGraphTransformer over many chunks concurrently.
+
+    At most max_concurrency calls are in flight, and the request/token budgets
+    of the deployment are respected. Throttled or transient failures are
+    retried with exponential backoff; a chunk that still fails is reported in
+    its ExtractionResult instead of failing the whole batch. Results come back
+    in the order of the input documents.
+
+    When an ExtractionCache is given, chunks already extracted with the same
+    schema (see extraction_cache.extraction_schema) skip the LLM entirely.
+    Pass a shared RateLimiter to keep one budget across several calls.
+    """
+    if cache is not None and schema is None:
+        raise ValueError("schema is required when a cache is given")
+    semaphore = asyncio.Semaphore(max_concurrency)
+    limiter = limiter or RateLimiter(requests_per_minute, tokens_per_minute)
+
+    async def extract(index: int, document: Document) -> ExtractionResult:
+        with telemetry.stage("extract") as span:
+            result = await extract_one(index, document)
+            span.add(chunks=1, cached=int(result.cached), attempts=result.attempts, failed=int(not result.ok))
+        if on_result:
+            on_result(result)
+        return result
+
+    async def extract_one(index: int, document: Document) -> ExtractionResult:
+        result = ExtractionResult(index=index, document=document)
+        if cache is not None:
+            result.graph_document = cache.get(document, schema)
+            if result.graph_document is not None:
+                result.cached = True
+                return result
+        # token_overhead approximates the extraction prompt and the generated output
+        result.tokens = count_tokens(document.page_content) + token_overhead
+        start = time.perf_counter()
+        async with semaphore:
+            while True:
+                result.attempts += 1
+                await limiter.acquire(result.tokens)
+                try:
+                    result.graph_document = await transformer.aprocess_response(document)
+                    if cache is not None:
+                        cache.put(document, schema, result.graph_document)
+                    break
+                except Exception as e:
+                    if result.attempts > max_retries or not is_retryable(e):
+                        result.error = e
+                        break
+                    await asyncio.sleep(retry_delay(e, result.attempts - 1))
+        result.seconds = time.perf_counter() - start
+        return result
+
+    return list(await asyncio.gather(*(extract(i, d) for i, d in enumerate(documents))))
+
+
+def run_extraction(transformer, documents: List[Document], **kwargs) -> List[ExtractionResult]:
+    return asyncio.run(extract_documents(transformer, documents, **kwargs))
+
+
+def successful(results: List[ExtractionResult]) -> List[GraphDocument]:
+    return [r.graph_document for r in results if r.ok]
+
+
+def summarize(results: List[ExtractionResult]) -> str:
+    failed = [r for r in results if not r.ok]
+    cached = sum(1 for r in results if r.cached)
+    lines = [f"Extracted {len(results) - len(failed)}/{len(results)} chunks, {cached} from cache "
+             f"({sum(r.attempts for r in results)} calls, ~{sum(r.tokens for r in results)} tokens)"]
+    for r in failed:
+        lines.append(f"  chunk {r.index} failed after {r.attempts} attempts: {type(r.error).__name__}: {r.error}")
+    return "\n".join(lines)
@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Sequence
+
+from langchain_core.documents import Document
+from langchain_community.graphs.graph_document import GraphDocument, Node, Relationship
+
+
+def _hash(value: Any) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def extraction_schema(
+    model: str,
+    prompt=None,
+    allowed_nodes: Sequence = (),
+    allowed_relationships: Sequence = (),
+    node_properties=False,
+    relationship_properties=False,
+) -> Dict[str, Any]:
+    """
+    Everything besides the chunk text that changes what LLMGraphTransformer
+    returns. Two extractions with equal schema and text are interchangeable.
+    """
+    if prompt is not None and not isinstance(prompt, str):
+        prompt = prompt.pretty_repr() if hasattr(prompt, "pretty_repr") else repr(prompt)
+    return {
+        "model": model,
+        "prompt": prompt,
+        "allowed_nodes": list(allowed_nodes),
+        "allowed_relationships": [list(r) if isinstance(r, (list, tuple)) else r for r in allowed_relationships],
+        "node_properties": node_properties if isinstance(node_properties, bool) else list(node_properties),
+        "relationship_properties": relationship_properties if isinstance(relationship_properties, bool) else list(relationship_properties),
+    }
+
+
+def _node_to_dict(node: Node) -> Dict[str, Any]:
+    return {"id": node.id, "type": node.type, "properties": node.properties}
+
+
+def dump_graph_document(graph_document: GraphDocument) -> str:
+    return json.dumps({
+        "nodes": [_node_to_dict(n) for n in graph_document.nodes],
+        "relationships": [
+            {
+                "source": _node_to_dict(r.source),
+                "target": _node_to_dict(r.target),
+                "type": r.type,
+                "properties": r.properties,
+            }
+            for r in graph_document.relationships
+        ],
+    }, default=str)
+
+
+def load_graph_document(data: str, source: Document) -> GraphDocument:
+    value = json.loads(data)
+    return GraphDocument(
+        nodes=[Node(**n) for n in value["nodes"]],
+        relationships=[
+            Relationship(source=Node(**r["source"]), target=Node(**r["target"]), type=r["type"], properties=r["properties"])
+            for r in value["relationships"]
+        ],
+        source=source,
+    )
+
+
+class ExtractionCache:
+    """
+    Content-addressed SQLite cache of LLMGraphTransformer output.
+
+    Entries are keyed by a hash of the chunk text and the extraction schema
+    (see extraction_schema), so a repeated extraction is a local lookup. Once
+    the stored payload grows past max_bytes the least recently used entries
+    are evicted.
+    """
+
+    def __init__(self, path: str = ".cache/extraction.sqlite", max_bytes: int = 512 * 1024 * 1024):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS extraction (
+                key TEXT PRIMARY KEY,
+                schema_key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                accessed REAL NOT NULL
+            )""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS extraction_schema_key ON extraction(schema_key)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS extraction_accessed ON extraction(accessed)")
+        self._conn.commit()
+
+    @staticmethod
+    def schema_key(schema: Dict[str, Any]) -> str:
+        return _hash(schema)
+
+    def key(self, text: str, schema: Dict[str, Any]) -> str:
+        return _hash([self.schema_key(schema), text])
+
+    def get(self, document: Document, schema: Dict[str, Any]) -> Optional[GraphDocument]:
+        key = self.key(document.page_content, schema)
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM extraction WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE extraction SET accessed = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        return load_graph_document(row[0], document)
+
+    def put(self, document: Document, schema: Dict[str, Any], graph_document: GraphDocument):
+        value = dump_graph_document(graph_document)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO extraction (key, schema_key, value, size, accessed) VALUES (?, ?, ?, ?, ?)",
+                (self.key(document.page_content, schema), self.schema_key(schema), value, len(value), time.time()),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM extraction").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used entries until we are back under the limit
+        rows = self._conn.execute("SELECT key, size FROM extraction ORDER BY accessed").fetchall()
+        evicted = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM extraction WHERE key = ?", evicted)
+
+    def invalidate(self, schema: Optional[Dict[str, Any]] = None) -> int:
+        """Remove the entries of one schema config, or everything when schema is None."""
+        with self._lock:
+            if schema is None:
+                cursor = self._conn.execute("DELETE FROM extraction")
+            else:
+                cursor = self._conn.execute("DELETE FROM extraction WHERE schema_key = ?", (self.schema_key(schema),))
+            self._conn.commit()
+            return cursor.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM extraction").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": size,
+        }
+
+    def close(self):
+        self._conn.close()
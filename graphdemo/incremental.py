@@ -0,0 +1,133 @@
+import hashlib
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+from langchain_core.documents import Document
+
+from .graph_writer import quote
+
+
+def fingerprint(document: Document) -> str:
+    return hashlib.sha256(document.page_content.encode("utf-8")).hexdigest()
+
+
+def chunk_key(document: Document, scope_key: Optional[str] = "source") -> str:
+    """Hash of the chunk's source and text: the same text in two sources is two chunks."""
+    source = document.metadata.get(scope_key) if scope_key else None
+    if source is None:
+        return fingerprint(document)
+    return hashlib.sha256(f"{source}\0{document.page_content}".encode("utf-8")).hexdigest()
+
+
+def fingerprint_documents(documents: List[Document], scope_key: Optional[str] = "source") -> List[Document]:
+    """
+    Store the content fingerprint on each chunk and derive the chunk id from
+    it and the chunk's source, so an edited chunk becomes a new node, an
+    unchanged one keeps its node, extraction and embedding, and identical
+    text in another source keeps a node (and metadata) of its own.
+    """
+    for document in documents:
+        document.metadata["fingerprint"] = fingerprint(document)
+        document.metadata["id"] = chunk_key(document, scope_key)
+    return documents
+
+
+@dataclass
+class SyncPlan:
+    new: List[Document] = field(default_factory=list)
+    unchanged: int = 0
+    stale: List[str] = field(default_factory=list)
+
+    def __str__(self):
+        return f"Sync plan: {len(self.new)} new or changed chunks, {self.unchanged} unchanged, {len(self.stale)} to remove"
+
+
+def ensure_indexes(graph, label: str = "Document", scope_key: Optional[str] = "source"):
+    name = label.lower()
+    graph.query(f"CREATE INDEX {quote(name + '_fingerprint')} IF NOT EXISTS FOR (d:{quote(label)}) ON (d.fingerprint)")
+    if scope_key:
+        graph.query(f"CREATE INDEX {quote(name + '_' + scope_key)} IF NOT EXISTS FOR (d:{quote(label)}) ON (d.{quote(scope_key)})")
+
+
+def plan_sync(graph, documents: List[Document], label: str = "Document",
+              scope_key: Optional[str] = "source") -> SyncPlan:
+    """
+    Diff fingerprinted chunks against the chunk nodes already in Neo4j.
+
+    Only chunks of the sources present in documents (by their scope_key
+    metadata) are compared, so syncing one article leaves the others alone.
+    With scope_key=None every node with the label is in scope.
+    """
+    ensure_indexes(graph, label, scope_key)
+    if scope_key:
+        sources = sorted({d.metadata.get(scope_key) for d in documents if d.metadata.get(scope_key) is not None})
+        existing = graph.query(
+            f"MATCH (d:{quote(label)}) WHERE d.{quote(scope_key)} IN $sources RETURN d.id AS id",
+            {"sources": sources})
+    else:
+        existing = graph.query(f"MATCH (d:{quote(label)}) RETURN d.id AS id")
+
+    # Chunk ids cover source and text, so comparing ids compares both
+    stored = {row["id"] for row in existing}
+    wanted = {}
+    for document in documents:
+        wanted.setdefault(document.metadata["id"], document)
+
+    plan = SyncPlan()
+    for key, document in wanted.items():
+        if key in stored:
+            plan.unchanged += 1
+        else:
+            plan.new.append(document)
+    plan.stale = [row["id"] for row in existing if row["id"] not in wanted]
+    return plan
+
+
+def remove_stale(graph, ids: List[str], label: str = "Document", batch_size: int = 500,
+                 on_affected: Optional[Callable[[List[str]], None]] = None) -> int:
+    """
+    Delete chunk nodes together with their MENTIONS edges, then the entities
+    that no remaining chunk mentions, then the relationships between
+    surviving entities that no remaining chunk mentions both ends of.
+    Returns the number of deleted entities. on_affected is called with the
+    ids of surviving entities that lost relationships, e.g.
+    NeighborhoodView.refresh.
+    """
+    removed = 0
+    for i in range(0, len(ids), batch_size):
+        rows = graph.query(
+            f"""UNWIND $ids AS id
+            MATCH (d:{quote(label)} {{id: id}})
+            OPTIONAL MATCH (d)-[:MENTIONS]->(e)
+            WITH d, collect(elementId(e)) AS entities
+            DETACH DELETE d
+            RETURN entities""",
+            {"ids": ids[i:i + batch_size]})
+        entities = list({e for row in rows for e in row["entities"]})
+        if not entities:
+            continue
+        row = graph.query(
+            """UNWIND $entities AS entity
+            MATCH (e) WHERE elementId(e) = entity AND NOT (e)<-[:MENTIONS]-()
+            OPTIONAL MATCH (e)-[:!MENTIONS]-(n)
+            WITH e, collect(n.id) AS neighbors
+            DETACH DELETE e
+            RETURN count(*) AS removed, reduce(ids = [], n IN collect(neighbors) | ids + n) AS neighbors""",
+            {"entities": entities})[0]
+        removed += row["removed"]
+        affected = set(row["neighbors"])
+        # A relationship is extracted from one chunk, and that chunk mentions
+        # both of its ends: once no chunk mentions both, every chunk it came
+        # from is gone
+        row = graph.query(
+            f"""UNWIND $entities AS entity
+            MATCH (e)-[r:!MENTIONS]-(n) WHERE elementId(e) = entity
+              AND NOT EXISTS {{ MATCH (e)<-[:MENTIONS]-(d:{quote(label)}) WHERE (d)-[:MENTIONS]->(n) }}
+            WITH collect(DISTINCT r) AS orphaned, collect(e.id) + collect(n.id) AS ends
+            FOREACH (r IN orphaned | DELETE r)
+            RETURN ends""",
+            {"entities": entities})[0]
+        affected.update(row["ends"])
+        if on_affected and affected:
+            on_affected(sorted(affected))
+    return removed
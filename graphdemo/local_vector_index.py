@@ -0,0 +1,210 @@
+import asyncio
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from numpy.lib.format import open_memmap
+from langchain_core.documents import Document
+
+from .graph_writer import quote
+from .retrieval import EMBEDDING_KEY
+
+
+VECTORS = "vectors.npy"
+META = "meta.jsonl"
+
+
+class LocalVectorIndex:
+    """
+    In-process mirror of the chunk embeddings stored in Neo4j.
+
+    Vectors are kept unit-normalized in one contiguous float32 matrix,
+    memory-mapped so startup does not read the whole file. The .npy file is
+    preallocated and grows geometrically, and metadata is one JSON line per
+    chunk, so an append only writes the new rows: ingesting N chunks in
+    batches costs O(N), not O(N^2). Removing chunks rewrites both files.
+    A top-k query is a single matrix multiply plus argpartition, and
+    several queries can be answered in one batch. Unlike the hybrid
+    Neo4jVector index this is a pure vector search.
+    """
+
+    def __init__(self, embeddings, path: str = ".cache/vector_index", capacity: int = 1024):
+        self.embeddings = embeddings
+        self.path = path
+        self.capacity = capacity
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.metadatas: List[Dict[str, Any]] = []
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        # Counts of the last sync()
+        self.added = 0
+        self.removed = 0
+        self._masks: Dict[Tuple, np.ndarray] = {}
+        if os.path.exists(self._file(META)):
+            self._load()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __str__(self):
+        return f"Local vector index: {len(self)} chunks ({self.added} added, {self.removed} removed)"
+
+    @property
+    def embedding(self):
+        # Same attribute as Neo4jVector, for GraphRetriever's search by vector
+        return self.embeddings
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _load(self):
+        self.ids, self.texts, self.metadatas = [], [], []
+        with open(self._file(META), encoding="utf-8") as f:
+            for line in f:
+                if not line.endswith("\n"):
+                    # Torn last line of an interrupted append; its vector is ignored too
+                    break
+                row = json.loads(line)
+                self.ids.append(row["id"])
+                self.texts.append(row["text"])
+                self.metadatas.append(row["metadata"])
+        self.vectors = np.load(self._file(VECTORS), mmap_mode="r")[:len(self.ids)]
+        self._masks = {}
+
+    @staticmethod
+    def _meta_lines(ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]]) -> str:
+        return "".join(json.dumps({"id": i, "text": t, "metadata": m}, default=str) + "\n"
+                       for i, t, m in zip(ids, texts, metadatas))
+
+    def _reserve(self, rows: int, dim: int) -> np.ndarray:
+        """The vector file opened for writing, with room for at least rows vectors."""
+        path = self._file(VECTORS)
+        current = 0
+        if self.ids:
+            store = open_memmap(path, mode="r+")
+            if store.shape[0] >= rows:
+                return store
+            current = store.shape[0]
+        capacity = max(rows, 2 * current, self.capacity)
+        grown = open_memmap(path + ".tmp", mode="w+", dtype=np.float32, shape=(capacity, dim))
+        if self.ids:
+            grown[:len(self.ids)] = store[:len(self.ids)]
+            del store
+        grown.flush()
+        del grown
+        # Drop the old mapping before the file is replaced
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        os.replace(path + ".tmp", path)
+        return open_memmap(path, mode="r+")
+
+    @staticmethod
+    def _unit(vectors) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    def append(self, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]], vectors):
+        if not ids:
+            return
+        vectors = self._unit(vectors)
+        os.makedirs(self.path, exist_ok=True)
+        start, end = len(self.ids), len(self.ids) + len(ids)
+        store = self._reserve(end, vectors.shape[1])
+        store[start:end] = vectors
+        store.flush()
+        # Vectors first: a row only counts once its metadata line is complete
+        with open(self._file(META), "a" if start else "w", encoding="utf-8") as f:
+            f.write(self._meta_lines(ids, texts, metadatas))
+        self.ids += list(ids)
+        self.texts += list(texts)
+        self.metadatas += list(metadatas)
+        self.vectors = store[:end]
+        self._masks = {}
+
+    def remove(self, ids: List[str]):
+        removed = set(ids)
+        keep = [i for i, id_ in enumerate(self.ids) if id_ not in removed]
+        if len(keep) == len(self.ids):
+            return
+        kept = ([self.ids[i] for i in keep], [self.texts[i] for i in keep], [self.metadatas[i] for i in keep],
+                np.asarray(self.vectors)[keep])
+        self.ids, self.texts, self.metadatas = [], [], []
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self._masks = {}
+        # Appending to the emptied index rewrites both files; the mirror is
+        # rebuilt by sync() if this is interrupted
+        open(self._file(META), "w").close()
+        self.append(*kept)
+
+    def sync(self, graph, label: str = "Document", text_node_property: str = "text",
+             embedding_node_property: str = "embedding", batch_size: int = 1000) -> Tuple[int, int]:
+        """
+        Bring the mirror in line with the graph, fetching only the vectors of
+        chunks it does not have yet. Returns (added, removed).
+        """
+        stored = {row["id"] for row in graph.query(
+            f"MATCH (d:{quote(label)}) WHERE d.{quote(embedding_node_property)} IS NOT NULL RETURN d.id AS id")}
+        known = set(self.ids)
+        stale = known - stored
+        self.remove(list(stale))
+        missing = sorted(stored - known)
+        for i in range(0, len(missing), batch_size):
+            rows = graph.query(
+                f"""UNWIND $ids AS id MATCH (d:{quote(label)} {{id: id}})
+                RETURN d.id AS id, d.{quote(text_node_property)} AS text, d.{quote(embedding_node_property)} AS vector,
+                       d {{.*, {quote(text_node_property)}: null, {quote(embedding_node_property)}: null}} AS metadata""",
+                {"ids": missing[i:i + batch_size]})
+            self.append([r["id"] for r in rows], [r["text"] for r in rows],
+                        [{k: v for k, v in r["metadata"].items() if v is not None} for r in rows],
+                        [r["vector"] for r in rows])
+        self.added, self.removed = len(missing), len(stale)
+        return self.added, self.removed
+
+    def _mask(self, filter: Dict[str, Any]) -> np.ndarray:
+        key = tuple(sorted((k, json.dumps(v, default=str)) for k, v in filter.items()))
+        if key not in self._masks:
+            self._masks[key] = np.fromiter(
+                (all(m.get(k) == v for k, v in filter.items()) for m in self.metadatas), dtype=bool, count=len(self.ids))
+        return self._masks[key]
+
+    def search_vectors(self, query_vectors, k: int = 4, filter: Optional[Dict[str, Any]] = None) -> List[List[Tuple[int, float]]]:
+        """Top-k (row, score) pairs for each query vector, by cosine similarity."""
+        queries = self._unit(np.atleast_2d(query_vectors))
+        if not len(self.ids):
+            return [[] for _ in queries]
+        scores = queries @ self.vectors.T
+        if filter:
+            scores[:, ~self._mask(filter)] = -np.inf
+        k = min(k, scores.shape[1])
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for row, candidates in zip(scores, top):
+            ordered = candidates[np.argsort(-row[candidates])]
+            results.append([(int(i), float(row[i])) for i in ordered if np.isfinite(row[i])])
+        return results
+
+    def _documents(self, hits: List[Tuple[int, float]]) -> List[Tuple[Document, float]]:
+        return [(Document(page_content=self.texts[i],
+                          metadata={"id": self.ids[i], **self.metadatas[i], EMBEDDING_KEY: self.vectors[i].tolist()}),
+                 score)
+                for i, score in hits]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4,
+                                    filter: Optional[Dict[str, Any]] = None, **kwargs) -> List[Document]:
+        return [doc for doc, _ in self._documents(self.search_vectors(embedding, k, filter)[0])]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None):
+        return self._documents(self.search_vectors(self.embeddings.embed_query(query), k, filter)[0])
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    def similarity_search_batch(self, queries: List[str], k: int = 4, filter: Optional[Dict[str, Any]] = None) -> List[List[Document]]:
+        hits = self.search_vectors(self.embeddings.embed_documents(queries), k, filter)
+        return [[doc for doc, _ in self._documents(h)] for h in hits]
+
+    async def asimilarity_search(self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None) -> List[Document]:
+        vector = await self.embeddings.aembed_query(query)
+        hits = await asyncio.get_running_loop().run_in_executor(None, self.search_vectors, vector, k, filter)
+        return [doc for doc, _ in self._documents(hits[0])]
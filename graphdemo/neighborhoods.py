@@ -0,0 +1,69 @@
+from typing import Iterable, List
+
+from langchain_community.graphs.graph_document import GraphDocument
+
+from .graph_writer import BASE_ENTITY_LABEL, quote
+
+# Ranked "source - TYPE -> target" lines of every relationship of the entity,
+# the same lines STRUCTURED_QUERY builds on the fly. Neighbors with more
+# relationships of their own come first, so the cap keeps a hub's links to
+# other central entities rather than an arbitrary slice of its leaves.
+REFRESH_QUERY = f"""
+UNWIND $ids AS id
+MATCH (e:{quote(BASE_ENTITY_LABEL)} {{id: id}})
+CALL {{
+  WITH e
+  MATCH (e)-[r:!MENTIONS]-(n)
+  WITH CASE WHEN startNode(r) = e THEN e.id + ' - ' + type(r) + ' -> ' + n.id
+            ELSE n.id + ' - ' + type(r) + ' -> ' + e.id END AS line,
+       COUNT {{ (n)-[:!MENTIONS]-() }} AS rank
+  ORDER BY rank DESC, line
+  // Aggregating without grouping keys yields one row, [] for isolated entities
+  RETURN collect(line) AS lines
+}}
+SET e.degree = size(lines), e.neighborhood = lines[..$limit]
+RETURN count(e) AS refreshed
+"""
+
+
+class NeighborhoodView:
+    """
+    Materialized 1-hop neighborhoods of __Entity__ nodes.
+
+    Every entity keeps its ranked relationship lines, capped at limit, in
+    e.neighborhood and its full relationship count in e.degree, so the
+    structured retriever reads one property per matched entity instead of
+    traversing hub nodes on every question. Register add_graph_documents as
+    a BulkGraphWriter listener and refresh as the on_affected hook of
+    remove_stale to keep it current, and rebuild(missing_only=True) to cover
+    entities written before. Entities need the __Entity__ base label.
+    """
+
+    def __init__(self, graph, limit: int = 50, batch_size: int = 500):
+        self.graph = graph
+        self.limit = limit
+        self.batch_size = batch_size
+
+    def refresh(self, ids: Iterable[str]) -> int:
+        """Recompute the neighborhoods of the given entity ids. Returns how many were found."""
+        ids = sorted(set(ids))
+        refreshed = 0
+        for i in range(0, len(ids), self.batch_size):
+            refreshed += self.graph.query(
+                REFRESH_QUERY, {"ids": ids[i:i + self.batch_size], "limit": self.limit})[0]["refreshed"]
+        return refreshed
+
+    def rebuild(self, missing_only: bool = False) -> int:
+        """Refresh every entity, or with missing_only those written before the view was enabled."""
+        where = " WHERE e.neighborhood IS NULL" if missing_only else ""
+        ids = [row["id"] for row in self.graph.query(f"MATCH (e:{quote(BASE_ENTITY_LABEL)}){where} RETURN e.id AS id")]
+        return self.refresh(ids)
+
+    def add_graph_documents(self, graph_documents: List[GraphDocument]):
+        """Refresh the entities the written documents touched, both ends of every relationship."""
+        ids = set()
+        for graph_document in graph_documents:
+            ids.update(node.id for node in graph_document.nodes)
+            for rel in graph_document.relationships:
+                ids.update((rel.source.id, rel.target.id))
+        self.refresh(ids)
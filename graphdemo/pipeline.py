@@ -0,0 +1,251 @@
+import asyncio
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from typing import Callable, List, Optional
+
+from langchain_core.documents import Document
+from langchain.text_splitter import TokenTextSplitter
+
+from .dedup import chunk_id, link_duplicates
+from .embeddings import node_text, write_embeddings
+from .extraction import RateLimiter, extract_documents
+from .graph_writer import document_id
+from .incremental import fingerprint_documents
+
+_DONE = object()
+_process_splitter = None
+
+
+def _split_in_process(splitter_factory, document: Document) -> List[Document]:
+    # Each worker process builds its splitter (and tiktoken encoding) once
+    global _process_splitter
+    if _process_splitter is None:
+        _process_splitter = splitter_factory()
+    return _process_splitter.split_documents([document])
+
+
+@dataclass
+class PipelineStats:
+    documents: int = 0
+    chunks: int = 0
+    extracted: int = 0
+    cached: int = 0
+    failed: int = 0
+    rows: int = 0
+    embedded: int = 0
+    duplicates: int = 0
+    seconds: float = 0.0
+    first_write_seconds: Optional[float] = None
+
+    def __str__(self):
+        first = f"{self.first_write_seconds:.2f}s" if self.first_write_seconds is not None else "-"
+        duplicates = f" ({self.duplicates} near-duplicates linked)" if self.duplicates else ""
+        return (f"Pipeline: {self.documents} documents, {self.chunks} chunks{duplicates}, {self.extracted} extracted "
+                f"({self.cached} cached, {self.failed} failed), {self.rows} rows written, {self.embedded} embedded "
+                f"in {self.seconds:.2f}s, first write after {first}")
+
+
+class _Stage:
+    """Worker tasks between two bounded queues; the last worker to finish closes the output."""
+
+    def __init__(self, inbox: asyncio.Queue, outbox: Optional[asyncio.Queue], workers: int):
+        self.inbox = inbox
+        self.outbox = outbox
+        self.remaining = workers
+
+    async def get(self):
+        item = await self.inbox.get()
+        if item is _DONE:
+            # Leave the marker for sibling workers
+            await self.inbox.put(_DONE)
+        return item
+
+    async def get_batch(self, size: int) -> list:
+        item = await self.get()
+        if item is _DONE:
+            return []
+        batch = [item]
+        while len(batch) < size and not self.inbox.empty():
+            item = self.inbox.get_nowait()
+            if item is _DONE:
+                await self.inbox.put(_DONE)
+                break
+            batch.append(item)
+        return batch
+
+    async def finish(self):
+        self.remaining -= 1
+        if self.remaining == 0 and self.outbox is not None:
+            await self.outbox.put(_DONE)
+
+
+async def run_pipeline(
+    loader,
+    transformer,
+    writer,
+    embeddings=None,
+    splitter_factory: Callable = partial(TokenTextSplitter, chunk_size=512, chunk_overlap=24),
+    chunk_filter: Optional[Callable[[Document], bool]] = None,
+    split_processes: int = 0,
+    queue_size: int = 64,
+    extract_workers: int = 2,
+    extract_batch: int = 16,
+    write_batch: int = 64,
+    embed_workers: int = 1,
+    max_concurrency: int = 8,
+    requests_per_minute: Optional[int] = None,
+    tokens_per_minute: Optional[int] = None,
+    cache=None,
+    schema=None,
+    resolver=None,
+    dedup=None,
+) -> PipelineStats:
+    """
+    Streaming load -> split -> extract -> embed -> write ingestion.
+
+    Stages run concurrently and hand over work through bounded queues, so
+    memory stays flat regardless of corpus size and the first chunks land in
+    Neo4j while later documents are still being fetched. A full queue stalls
+    the stage feeding it.
+
+    loader needs lazy_load(). splitter_factory must be picklable when
+    split_processes > 0, which runs tiktoken splitting in a process pool.
+    chunk_filter can drop chunks before extraction, e.g. ones an incremental
+    sync plan already has. An EntityResolver folds duplicate entities
+    together right before each write. With a NearDuplicateIndex only the
+    first chunk of every near-duplicate cluster is extracted and embedded;
+    the others wait for their representative's write and are then linked
+    to its entities in batches, so only duplicates of chunks still in
+    flight are held in memory.
+    Embedding runs in a stage of its own between extraction and the writer,
+    so the next batch is embedded while the previous one is written.
+    """
+    stats = PipelineStats()
+    start = time.perf_counter()
+    raw = asyncio.Queue(queue_size)
+    chunks = asyncio.Queue(queue_size)
+    extracted = asyncio.Queue(queue_size)
+    # (graph document, chunk vector) pairs; without embeddings the writer reads extracted directly
+    embedded = asyncio.Queue(queue_size) if embeddings is not None else None
+    limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+    pool = ProcessPoolExecutor(split_processes) if split_processes else None
+    splitter = None if pool else splitter_factory()
+    loop = asyncio.get_running_loop()
+    # Representatives queued but not written yet, their waiting duplicates,
+    # and (duplicate, representative) pairs ready to be linked
+    in_flight = set()
+    waiting = defaultdict(list)
+    ready = []
+
+    def release(representative: str):
+        in_flight.discard(representative)
+        ready.extend((duplicate, representative) for duplicate in waiting.pop(representative, ()))
+
+    async def link(flush: bool = False):
+        nonlocal ready
+        if ready and (flush or len(ready) >= write_batch):
+            batch, ready = ready, []
+            stats.duplicates += await asyncio.to_thread(link_duplicates, writer.graph, batch, writer.document_label)
+
+    async def load():
+        documents = iter(loader.lazy_load())
+        while True:
+            document = await asyncio.to_thread(next, documents, None)
+            if document is None:
+                break
+            stats.documents += 1
+            await raw.put(document)
+        await raw.put(_DONE)
+
+    split_stage = _Stage(raw, chunks, max(1, split_processes))
+
+    async def split():
+        while (document := await split_stage.get()) is not _DONE:
+            if pool:
+                parts = await loop.run_in_executor(pool, _split_in_process, splitter_factory, document)
+            else:
+                parts = await asyncio.to_thread(splitter.split_documents, [document])
+            for chunk in fingerprint_documents(parts):
+                if chunk_filter is None or chunk_filter(chunk):
+                    stats.chunks += 1
+                    representative = dedup.add(chunk) if dedup is not None else None
+                    if representative is not None:
+                        if representative in in_flight:
+                            waiting[representative].append(chunk)
+                        else:
+                            ready.append((chunk, representative))
+                            await link()
+                        continue
+                    in_flight.add(chunk_id(chunk))
+                    await chunks.put(chunk)
+        await split_stage.finish()
+
+    extract_stage = _Stage(chunks, extracted, extract_workers)
+
+    async def extract():
+        while batch := await extract_stage.get_batch(extract_batch):
+            results = await extract_documents(transformer, batch, max_concurrency=max_concurrency,
+                                              cache=cache, schema=schema, limiter=limiter)
+            for result in results:
+                if result.ok:
+                    stats.extracted += 1
+                    stats.cached += result.cached
+                    await extracted.put(result.graph_document)
+                else:
+                    stats.failed += 1
+                    # Its duplicates are still written, without entities or embedding
+                    release(chunk_id(result.document))
+        await extract_stage.finish()
+
+    embed_stage = _Stage(extracted, embedded, embed_workers)
+
+    async def embed():
+        while graph_documents := await embed_stage.get_batch(write_batch):
+            texts = [node_text({"text": g.source.page_content}, ["text"]) for g in graph_documents]
+            vectors = await embeddings.aembed_documents(texts)
+            for graph_document, vector in zip(graph_documents, vectors):
+                await embedded.put((graph_document, vector))
+        await embed_stage.finish()
+
+    write_stage = _Stage(embedded if embedded is not None else extracted, None, 1)
+
+    async def write():
+        while batch := await write_stage.get_batch(write_batch):
+            if embedded is not None:
+                graph_documents, vectors = [g for g, _ in batch], [v for _, v in batch]
+            else:
+                graph_documents, vectors = batch, None
+            if resolver is not None:
+                graph_documents = await asyncio.to_thread(resolver.resolve, graph_documents)
+            written = await asyncio.to_thread(writer.write, graph_documents)
+            if vectors is not None:
+                rows = [{"id": document_id(g), "vector": v} for g, v in zip(graph_documents, vectors)]
+                await asyncio.to_thread(write_embeddings, writer.graph, rows, writer.document_label)
+                stats.embedded += len(rows)
+            stats.rows += written.rows
+            if stats.first_write_seconds is None:
+                stats.first_write_seconds = time.perf_counter() - start
+            for graph_document in graph_documents:
+                release(document_id(graph_document))
+            await link()
+        await write_stage.finish()
+
+    try:
+        await asyncio.gather(
+            load(),
+            *(split() for _ in range(split_stage.remaining)),
+            *(extract() for _ in range(extract_workers)),
+            *(embed() for _ in range(embed_workers if embedded is not None else 0)),
+            write(),
+        )
+    finally:
+        if pool:
+            pool.shutdown()
+    for representative in list(waiting):
+        release(representative)
+    await link(flush=True)
+    stats.seconds = time.perf_counter() - start
+    return stats
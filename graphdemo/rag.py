@@ -0,0 +1,295 @@
+"""
+Graph RAG chain of 04-enhance-rag.py: entity extraction from the question,
+hybrid graph and vector retrieval, chat history condensing and the answer
+prompt, behind the answer cache; StreamingRAG streams the same answers.
+"""
+import asyncio
+import os
+import threading
+import time
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.prompts.prompt import PromptTemplate
+from langchain_core.pydantic_v1 import BaseModel, Field
+from langchain_core.runnables import (
+    RunnableBranch,
+    RunnableLambda,
+    RunnableParallel,
+    RunnablePassthrough,
+)
+
+from . import telemetry
+from .answer_cache import AnswerCache, GraphVersion
+from .context import ContextAssembler
+from .entity_lookup import EntityLookup, ensure_normalized_ids
+from .retrieval import EMBEDDING_KEY, GraphRetriever
+
+
+# Extract entities from text
+class Entities(BaseModel):
+    """Identifying information about entities."""
+
+    names: List[str] = Field(
+        ...,
+        description="All the person, organization, or business entities that "
+        "appear in the text",
+    )
+
+
+class EntityBatch(BaseModel):
+    """Identifying information about entities in each of several texts."""
+
+    entities: List[Entities] = Field(
+        ...,
+        description="One item per numbered text, in the same order as the texts",
+    )
+
+
+ENTITY_PROMPT = ChatPromptTemplate.from_messages(
+    [
+        (
+            "system",
+            "You are extracting organization and person entities from the text.",
+        ),
+        (
+            "human",
+            "Use the given format to extract information from the following "
+            "input: {question}",
+        ),
+    ]
+)
+
+# Several questions in one call, for the micro-batching query server
+BATCH_ENTITY_PROMPT = ChatPromptTemplate.from_messages(
+    [
+        (
+            "system",
+            "You are extracting organization and person entities from several numbered texts.",
+        ),
+        (
+            "human",
+            "Use the given format to extract information from each of the following "
+            "texts, one item per text in the same order. input:\n{questions}",
+        ),
+    ]
+)
+
+# Condense a chat history and follow-up question into a standalone question
+_template = """Given the following conversation and a follow up question, rephrase the follow up question to be a standalone question,
+in its original language.
+Chat History:
+{chat_history}
+Follow Up Input: {question}
+Standalone question:"""
+CONDENSE_QUESTION_PROMPT = PromptTemplate.from_template(_template)
+
+ANSWER_TEMPLATE = """Answer the question based only on the following context:
+{context}
+
+Question: {question}
+Use natural language and be concise.
+Answer:"""
+ANSWER_PROMPT = ChatPromptTemplate.from_template(ANSWER_TEMPLATE)
+
+
+def entity_chain(llm):
+    return ENTITY_PROMPT | llm.with_structured_output(Entities)
+
+
+def batch_entity_chain(llm):
+    """entity_chain over {"questions": numbered lines}, returning an EntityBatch."""
+    return BATCH_ENTITY_PROMPT | llm.with_structured_output(EntityBatch)
+
+
+def ensure_entity_index(graph):
+    graph.query(
+        "CREATE FULLTEXT INDEX entity IF NOT EXISTS FOR (e:__Entity__) ON EACH [e.id]")
+    # Range index and normalized ids for the exact tier of EntityLookup
+    ensure_normalized_ids(graph)
+
+
+# The default retrieval query of from_existing_graph, plus the stored vector
+# of every hit so the context assembler does not embed the chunks again.
+# Chunks without one (null) leave the key out of their metadata.
+VECTOR_RETRIEVAL_QUERY = (
+    "RETURN reduce(str='', k IN ['text'] | str + '\\n' + k + ': ' + coalesce(node[k], '')) AS text, "
+    f"node {{.*, `embedding`: Null, id: Null, `text`: Null, {EMBEDDING_KEY}: node.`embedding`}} AS metadata, score"
+)
+
+
+def get_vector_index(graph, embeddings, local: Optional[bool] = None):
+    """
+    Hybrid Neo4jVector index over the Document chunks, or its in-process
+    mirror when local is set (default: the LOCAL_VECTOR_INDEX variable).
+    The mirror is synced first; str() of it reports the counts.
+    """
+    if local is None:
+        local = bool(os.getenv("LOCAL_VECTOR_INDEX"))
+    if local:
+        from .local_vector_index import LocalVectorIndex
+        index = LocalVectorIndex(embeddings)
+        with telemetry.stage("vector_index_sync") as span:
+            added, removed = index.sync(graph)
+            span.add(chunks=len(index), added=added, removed=removed)
+        return index
+    from langchain_community.vectorstores import Neo4jVector
+    # Reuses the driver of graph instead of opening another one
+    return Neo4jVector.from_existing_graph(
+        embeddings,
+        graph=graph,
+        search_type="hybrid",
+        node_label="Document",
+        text_node_properties=["text"],
+        embedding_node_property="embedding",
+        retrieval_query=VECTOR_RETRIEVAL_QUERY
+    )
+
+
+def _format_chat_history(chat_history: List[Tuple[str, str]]) -> List:
+    buffer = []
+    for human, ai in chat_history:
+        buffer.append(HumanMessage(content=human))
+        buffer.append(AIMessage(content=ai))
+    return buffer
+
+
+def search_query(llm) -> RunnableBranch:
+    return RunnableBranch(
+        # If input includes chat_history, we condense it with the follow-up question
+        (
+            RunnableLambda(lambda x: bool(x.get("chat_history"))).with_config(
+                run_name="HasChatHistoryCheck"
+            ),  # Condense follow-up question and chat into a standalone_question
+            RunnablePassthrough.assign(
+                chat_history=lambda x: _format_chat_history(x["chat_history"])
+            )
+            | CONDENSE_QUESTION_PROMPT
+            | llm
+            | StrOutputParser(),
+        ),
+        # Else, we have no chat history, so just pass through the question
+        RunnableLambda(lambda x : x["question"]),
+    )
+
+
+class StreamingRAG:
+    """
+    The RAG chain answering through llm.astream, for a streaming chat model
+    (get_llm(streaming=True)).
+
+    The follow-up question is condensed before anything is looked up, so the
+    context matches the blocking chain's. Time to the first token and to the
+    last one are recorded as the time_to_first_token_seconds and
+    answer_seconds metrics.
+    """
+
+    def __init__(self, graph_retriever: GraphRetriever, llm, condense_llm=None,
+                 answer_cache: Optional[AnswerCache] = None):
+        self.graph_retriever = graph_retriever
+        self.llm = llm
+        self.condense = search_query(condense_llm or llm)
+        self.answer_cache = answer_cache
+        self._loop = None
+        self._loop_lock = threading.Lock()
+
+    async def _cached(self, question: str):
+        if self.answer_cache is None:
+            return None, None
+        answer = await self.answer_cache.aget_exact(question)
+        if answer is not None:
+            telemetry.add(exact_hits=1)
+            return answer, None
+        embeddings = self.answer_cache.embeddings
+        vector = await embeddings.aembed_query(question) if embeddings else None
+        answer = await self.answer_cache.aget_semantic(vector)
+        if answer is not None:
+            telemetry.add(semantic_hits=1)
+        return answer, vector
+
+    async def astream(self, inputs: dict) -> AsyncIterator[str]:
+        """Yield the answer to {"question", "chat_history"} as it is generated; cached answers in one piece."""
+        start = time.perf_counter()
+        with telemetry.stage("condense"):
+            question = await self.condense.ainvoke(inputs) if inputs.get("chat_history") else inputs["question"]
+        answer, vector = await self._cached(question)
+        if answer is not None:
+            yield answer
+            return
+        context = await self.graph_retriever.aretrieve(question)
+
+        chunks = []
+        async for chunk in self.llm.astream(ANSWER_PROMPT.format_messages(context=context, question=question)):
+            if not chunk.content:
+                continue
+            if not chunks:
+                telemetry.observe("time_to_first_token_seconds", time.perf_counter() - start)
+            chunks.append(chunk.content)
+            yield chunk.content
+        telemetry.observe("answer_seconds", time.perf_counter() - start)
+        if self.answer_cache is not None:
+            self.answer_cache.put(question, "".join(chunks), vector)
+
+    async def ainvoke(self, inputs: dict) -> str:
+        return "".join([chunk async for chunk in self.astream(inputs)])
+
+    def invoke(self, inputs: dict) -> str:
+        # Every call runs on the same private loop, which the async Neo4j
+        # driver is bound to after the first one
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+            return self._loop.run_until_complete(self.ainvoke(inputs))
+
+
+def build_chain(graph, llm, embeddings, vector_index, entity_matcher=None, async_driver=None, condense_llm=None,
+                cache: bool = True, materialized: bool = False, context_tokens: Optional[int] = None,
+                streaming: bool = False, entities=None, retriever_factory: Callable = GraphRetriever,
+                tiered_lookup: bool = True, answer_cache: Optional[AnswerCache] = None):
+    """
+    The RAG chain over {"question", "chat_history"} and its GraphRetriever.
+    Entities already in the graph are matched locally when an EntityMatcher
+    is given, entity_chain only runs when nothing matches. materialized reads
+    the neighborhoods maintained by NeighborhoodView. The context is trimmed
+    to context_tokens (default: CONTEXT_TOKENS or 3000, 0 disables). With
+    streaming the chain is a StreamingRAG. entities replaces entity_chain(llm)
+    and retriever_factory the GraphRetriever class, e.g. for the batching
+    versions of graphdemo.server. tiered_lookup resolves entity names with
+    an EntityLookup (exact, then prefix, then fuzzy, cached) instead of one
+    fuzzy fulltext query per name. Pass answer_cache to share one cache
+    between chains, e.g. a blocking and a streaming one.
+    """
+    entities = entities or entity_chain(llm)
+    if entity_matcher is not None:
+        entities = entity_matcher.as_entity_chain(entities)
+    if context_tokens is None:
+        context_tokens = int(os.getenv("CONTEXT_TOKENS") or 3000)
+    assembler = ContextAssembler(embeddings, max_tokens=context_tokens) if context_tokens else None
+    lookup = EntityLookup(graph, GraphVersion(graph)) if tiered_lookup else None
+    graph_retriever = retriever_factory(graph, entities, vector_index, async_driver=async_driver,
+                                        materialized=materialized, assembler=assembler, lookup=lookup)
+    # Answers are cached by standalone question, exactly and by embedding similarity,
+    # and dropped whenever the graph version changes
+    if not cache:
+        answer_cache = None
+    elif answer_cache is None:
+        answer_cache = AnswerCache(embeddings, GraphVersion(graph), threshold=0.95)
+    if streaming:
+        return StreamingRAG(graph_retriever, llm, condense_llm, answer_cache), graph_retriever
+    answer_chain = (
+        RunnableParallel(
+            {
+                "context": graph_retriever.as_runnable(),
+                "question": RunnablePassthrough(),
+            }
+        )
+        | ANSWER_PROMPT
+        | telemetry.traced_runnable("generate", llm)
+        | StrOutputParser()
+    )
+    condense = search_query(condense_llm or llm)
+    if answer_cache is None:
+        return condense | answer_chain, graph_retriever
+    return answer_cache.wrap(condense, answer_chain), graph_retriever
@@ -0,0 +1,163 @@
+"""
+Graph reset in bounded transactions: the whole graph, the nodes of some
+labels, or the chunks of one source document with the entities only they
+mention.
+"""
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence
+
+from . import telemetry
+from .answer_cache import bump_graph_version
+from .graph_writer import BASE_ENTITY_LABEL, quote
+
+# Each round deletes up to $limit of the nodes n that match, committing every
+# $batch_size of them. CALL IN TRANSACTIONS needs an implicit transaction
+# (see _run_implicit).
+DELETE_QUERY = """
+{match}
+WITH n LIMIT $limit
+CALL {{
+  WITH n
+  DETACH DELETE n
+}} IN TRANSACTIONS OF $batch_size ROWS
+RETURN count(*) AS deleted
+"""
+
+# The graph version counter survives a clear, so caches keyed on it see the
+# version go up instead of starting over at 1
+KEEP = "NOT n:__Meta__"
+
+# Entities mentioned by chunks of $source and by no chunk of another source
+SOURCE_ENTITIES = f"""
+MATCH (:Document {{source: $source}})-[:MENTIONS]->(e:{quote(BASE_ENTITY_LABEL)})
+WHERE NOT EXISTS {{ (e)<-[:MENTIONS]-(o:Document) WHERE o.source IS NULL OR o.source <> $source }}
+WITH DISTINCT e AS n
+"""
+
+SOURCE_CHUNKS = "MATCH (n:Document {source: $source})"
+
+
+@dataclass
+class ClearStats:
+    nodes: int = 0
+    rounds: int = 0
+    indexes: int = 0
+    seconds: float = 0.0
+
+    def __str__(self):
+        rebuilt = f", {self.indexes} indexes and constraints rebuilt" if self.indexes else ""
+        return f"Deleted {self.nodes} nodes in {self.rounds} rounds{rebuilt}, {self.seconds:.2f}s"
+
+
+def _run_implicit(graph, query: str, params: dict) -> List[Dict]:
+    # SharedNeo4jGraph opens an auto-commit session directly; Neo4jGraph.query
+    # only falls back to one after the managed transaction is refused
+    session = getattr(graph, "session", None)
+    if session is None:
+        return graph.query(query, params)
+    with session() as s:
+        return [record.data() for record in s.run(query, params)]
+
+
+def print_progress(deleted: int, total: int):
+    print(f"\rDeleted {deleted}/{total} nodes", end="\n" if deleted >= total else "", flush=True)
+
+
+def schema_statements(graph, labels: Sequence[str] = ()) -> List[Dict[str, str]]:
+    """
+    Name, type, labels, properties and create statement of every
+    constraint, then every index not owned by a constraint, optionally only
+    those on one of labels. Token lookup indexes are left alone.
+    """
+    where = "WHERE ($labels = [] OR any(l IN labelsOrTypes WHERE l IN $labels))"
+    returned = "RETURN name, type, labelsOrTypes, properties, createStatement"
+    constraints = graph.query(
+        f"SHOW CONSTRAINTS YIELD name, type, labelsOrTypes, properties, createStatement {where} {returned}",
+        {"labels": list(labels)})
+    indexes = graph.query(
+        "SHOW INDEXES YIELD name, type, labelsOrTypes, properties, owningConstraint, createStatement "
+        f"{where} AND type <> 'LOOKUP' AND owningConstraint IS NULL {returned}",
+        {"labels": list(labels)})
+    return [{"kind": "CONSTRAINT", **row} for row in constraints] + [{"kind": "INDEX", **row} for row in indexes]
+
+
+def delete_matching(graph, match: str, params: Optional[dict] = None, batch_size: int = 10000,
+                    round_size: int = 100000, progress: Optional[Callable[[int, int], None]] = None) -> ClearStats:
+    """
+    Delete the nodes n bound by match (a MATCH ... clause), round_size at a
+    time in transactions of batch_size.
+    """
+    stats = ClearStats()
+    params = dict(params or {})
+    total = graph.query(f"{match} RETURN count(n) AS total", params)[0]["total"]
+    query = DELETE_QUERY.format(match=match)
+    while True:
+        deleted = _run_implicit(graph, query, {**params, "limit": round_size, "batch_size": batch_size})[0]["deleted"]
+        if not deleted:
+            break
+        stats.nodes += deleted
+        stats.rounds += 1
+        if progress:
+            progress(stats.nodes, max(total, stats.nodes))
+    return stats
+
+
+def delete_nodes(graph, label: Optional[str] = None, batch_size: int = 10000, round_size: int = 100000,
+                 progress: Optional[Callable[[int, int], None]] = None) -> ClearStats:
+    """Delete every node, or every node with label, round_size at a time. The graph version node stays."""
+    label = f":{quote(label)}" if label else ""
+    return delete_matching(graph, f"MATCH (n{label}) WHERE {KEEP}", batch_size=batch_size, round_size=round_size,
+                           progress=progress)
+
+
+def delete_source(graph, source: str, batch_size: int = 10000, round_size: int = 100000,
+                  progress: Optional[Callable[[int, int], None]] = None) -> ClearStats:
+    """
+    Delete the Document chunks of source and the entities only they
+    mention. The entities go first, while their MENTIONS edges still tell
+    which ones they are.
+    """
+    stats = ClearStats()
+    for match in (SOURCE_ENTITIES, SOURCE_CHUNKS):
+        part = delete_matching(graph, match.strip(), {"source": source}, batch_size, round_size, progress)
+        stats.nodes += part.nodes
+        stats.rounds += part.rounds
+    return stats
+
+
+def clear_graph(graph, labels: Sequence[str] = (), source: Optional[str] = None, batch_size: int = 10000,
+                rebuild_indexes: bool = False, progress: Optional[Callable[[int, int], None]] = None) -> ClearStats:
+    """
+    Delete the whole graph, or only the nodes with one of labels, or only the
+    Document chunks whose source metadata is source together with the
+    entities no other chunk mentions.
+
+    With rebuild_indexes the constraints and indexes in scope (the entity
+    fulltext index, the vector index, the id constraints, ...) are dropped
+    before the delete, so it does not pay for index maintenance, and created
+    again afterwards, also when the delete fails. The graph version is
+    bumped, so cached answers expire.
+    """
+    start = time.perf_counter()
+    with telemetry.stage("clear") as span:
+        if source is not None:
+            stats = delete_source(graph, source, batch_size, progress=progress)
+        else:
+            schema = schema_statements(graph, labels) if rebuild_indexes else []
+            for item in schema:
+                graph.query(f"DROP {item['kind']} {quote(item['name'])} IF EXISTS")
+            try:
+                stats = ClearStats()
+                for label in labels or [None]:
+                    part = delete_nodes(graph, label, batch_size, progress=progress)
+                    stats.nodes += part.nodes
+                    stats.rounds += part.rounds
+            finally:
+                for item in schema:
+                    graph.query(item["createStatement"])
+            stats.indexes = len(schema)
+        bump_graph_version(graph)
+        span.add(nodes_deleted=stats.nodes)
+    stats.seconds = time.perf_counter() - start
+    return stats
@@ -0,0 +1,322 @@
+"""
+Entity resolution between extraction and the graph write: "Marie Curie",
+"Curie" and "Marie Skłodowska-Curie" become one __Entity__ node that keeps
+the other names in its aliases property.
+"""
+import time
+import zlib
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from langchain_community.graphs.graph_document import GraphDocument, Node, Relationship
+
+from . import telemetry
+from .entity_matcher import normalize
+from .graph_writer import BASE_ENTITY_LABEL, quote
+
+# Keep the first node of every cluster, with its properties and id, move
+# the relationships of the others onto it and drop the loops this leaves
+MERGE_QUERY = f"""
+UNWIND $clusters AS cluster
+MATCH (keep:{quote(BASE_ENTITY_LABEL)} {{id: cluster.keep}})
+MATCH (other:{quote(BASE_ENTITY_LABEL)}) WHERE other.id IN cluster.merge
+WITH keep, cluster, collect(other) AS others
+CALL apoc.refactor.mergeNodes([keep] + others, {{properties: 'discard', mergeRels: true}}) YIELD node
+SET node.aliases = cluster.aliases
+WITH node
+OPTIONAL MATCH (node)-[loop]->(node)
+DELETE loop
+RETURN count(DISTINCT node) AS merged
+"""
+
+
+@dataclass
+class ResolutionStats:
+    entities: int = 0
+    pairs: int = 0
+    merged: int = 0
+    seconds: float = 0.0
+
+    def __str__(self):
+        return (f"Resolved {self.entities} entities: {self.pairs} candidate pairs, "
+                f"{self.merged} merged into others, {self.seconds:.2f}s")
+
+
+def ngram_vectors(texts: List[str], n: int = 3, dim: int = 2048) -> np.ndarray:
+    """Unit-normalized hashed character n-gram counts, one row per text."""
+    vectors = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        padded = f" {text} "
+        for i in range(max(1, len(padded) - n + 1)):
+            vectors[row, zlib.crc32(padded[i:i + n].encode("utf-8")) % dim] += 1
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    return vectors
+
+
+class EntityResolver:
+    """
+    Incremental entity resolution over (type, id) pairs.
+
+    Every entity seen so far is kept with its character n-gram vector and,
+    when embeddings are given, the embedding of its name. A new batch is
+    resolved in three steps:
+
+    - blocking: only entities of the same type sharing the normalized name,
+      a word of at least min_word characters, or a character n-gram held by
+      at most max_block entities are compared;
+    - scoring: n-gram cosine and embedding cosine of all candidate pairs at
+      once; a pair matches above string_threshold, above
+      embedding_threshold when the n-gram cosine is at least min_string, or
+      when one name's words are all in the other and that other name is
+      the only one containing them ("Curie" is left alone next to both
+      "Marie Curie" and "Pierre Curie");
+    - clustering: matches are unioned; an entity from an earlier batch
+      stays canonical, otherwise the most mentioned, then longest, name.
+
+    resolve() rewrites GraphDocuments onto the canonical ids, so merged
+    entities never reach Neo4j as separate nodes.
+    """
+
+    def __init__(self, embeddings=None, string_threshold: float = 0.9, embedding_threshold: float = 0.93,
+                 min_string: float = 0.5, min_word: int = 4, max_block: int = 100):
+        self.embeddings = embeddings
+        self.string_threshold = string_threshold
+        self.embedding_threshold = embedding_threshold
+        self.min_string = min_string
+        self.min_word = min_word
+        self.max_block = max_block
+        self.ids: List[str] = []
+        self.types: List[str] = []
+        self.mentions: List[int] = []
+        self._names: List[str] = []
+        # Entities already written under their own id cannot be renamed by resolve()
+        self._written: List[bool] = []
+        self._parent: List[int] = []
+        self._index: Dict[Tuple[str, str], int] = {}
+        self._blocks: Dict[str, List[int]] = defaultdict(list)
+        self._vectors = np.zeros((0, 2048), dtype=np.float32)
+        self._embedded: Optional[np.ndarray] = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def find(self, i: int) -> int:
+        root = i
+        while self._parent[root] != root:
+            root = self._parent[root]
+        while self._parent[i] != root:
+            self._parent[i], i = root, self._parent[i]
+        return root
+
+    def _rank(self, i: int):
+        return self._written[i], self.mentions[i], len(self.ids[i]), -i
+
+    def _union(self, a: int, b: int) -> bool:
+        a, b = self.find(a), self.find(b)
+        if a == b or (self._written[a] and self._written[b]):
+            return False
+        if self._rank(b) > self._rank(a):
+            a, b = b, a
+        self._parent[b] = a
+        return True
+
+    def _keys(self, i: int) -> Set[str]:
+        kind, name = self.types[i], self._names[i]
+        keys = {"n:" + name}
+        keys.update("w:" + word for word in name.split() if len(word) >= self.min_word)
+        padded = f" {name} "
+        keys.update("g:" + padded[k:k + 3] for k in range(max(1, len(padded) - 2)))
+        return {kind + "\x00" + key for key in keys}
+
+    def _register(self, entities: List[Tuple[str, str]], mentions: Counter, written: bool) -> List[int]:
+        added = []
+        for kind, entity_id in entities:
+            key = (kind.casefold(), entity_id)
+            if key in self._index:
+                self.mentions[self._index[key]] += mentions[(kind, entity_id)]
+                continue
+            i = len(self.ids)
+            self._index[key] = i
+            self.ids.append(entity_id)
+            self.types.append(kind.casefold())
+            self.mentions.append(mentions[(kind, entity_id)])
+            self._names.append(normalize(entity_id))
+            self._written.append(written)
+            self._parent.append(i)
+            added.append(i)
+        if added:
+            self._vectors = np.vstack([self._vectors, ngram_vectors([self._names[i] for i in added])])
+            if self.embeddings is not None:
+                vectors = np.asarray(self.embeddings.embed_documents([self.ids[i] for i in added]), dtype=np.float32)
+                vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+                self._embedded = vectors if self._embedded is None else np.vstack([self._embedded, vectors])
+        return added
+
+    def _candidates(self, added: List[int]) -> np.ndarray:
+        pairs = set()
+        for i in added:
+            for key in self._keys(i):
+                block = self._blocks[key]
+                # Common n-grams ("son", "the") would pair everything with everything
+                if not key.split("\x00", 1)[1].startswith("g:") or len(block) < self.max_block:
+                    pairs.update((j, i) for j in block)
+                block.append(i)
+        return np.array(sorted(pairs), dtype=np.int64).reshape(-1, 2)
+
+    def _matches(self, pairs: np.ndarray) -> np.ndarray:
+        left, right = pairs[:, 0], pairs[:, 1]
+        string = np.einsum("ij,ij->i", self._vectors[left], self._vectors[right])
+        matched = string >= self.string_threshold
+        if self._embedded is not None:
+            semantic = np.einsum("ij,ij->i", self._embedded[left], self._embedded[right])
+            matched |= (semantic >= self.embedding_threshold) & (string >= self.min_string)
+        # Word containment only counts when the shorter name fits one longer name
+        contained = defaultdict(list)
+        for k, (a, b) in enumerate(pairs):
+            words_a, words_b = set(self._names[a].split()), set(self._names[b].split())
+            if words_a < words_b:
+                contained[a].append(k)
+            elif words_b < words_a:
+                contained[b].append(k)
+        for shorter, ks in contained.items():
+            longer = {self.find(int(pairs[k][0] if pairs[k][1] == shorter else pairs[k][1])) for k in ks}
+            if len(longer) == 1:
+                matched[ks] = True
+        return pairs[matched]
+
+    def add(self, entities: Iterable[Tuple[str, str]], mentions: Optional[Counter] = None,
+            written: bool = False) -> ResolutionStats:
+        """Register (type, id) entities and merge them into the clusters they match."""
+        start = time.perf_counter()
+        mentions = mentions or Counter()
+        entities = list(dict.fromkeys(entities))
+        added = self._register(entities, mentions, written)
+        pairs = self._candidates(added)
+        stats = ResolutionStats(entities=len(added), pairs=len(pairs))
+        if len(pairs):
+            for a, b in self._matches(pairs):
+                stats.merged += self._union(int(a), int(b))
+        stats.seconds = time.perf_counter() - start
+        return stats
+
+    def canonical(self, kind: str, entity_id: str) -> str:
+        i = self._index.get((kind.casefold(), entity_id))
+        return entity_id if i is None else self.ids[self.find(i)]
+
+    def clusters(self) -> Dict[int, List[int]]:
+        """Canonical entity -> the entities merged into it, for clusters of more than one."""
+        members = defaultdict(list)
+        for i in range(len(self.ids)):
+            root = self.find(i)
+            if root != i:
+                members[root].append(i)
+        return dict(members)
+
+    def aliases(self) -> Dict[str, List[str]]:
+        """Canonical id -> the other names merged into it."""
+        return {self.ids[root]: sorted({self.ids[i] for i in members} - {self.ids[root]})
+                for root, members in self.clusters().items()}
+
+    def load(self, graph):
+        """Register the entities already in the graph, with their stored aliases, as canonical."""
+        rows = _entity_rows(graph)
+        mentions = Counter({(row["type"] or "", str(row["id"])): row["mentions"] for row in rows})
+        self._register(list(mentions), mentions, written=True)
+        for row in rows:
+            root = self._index[((row["type"] or "").casefold(), str(row["id"]))]
+            for alias in self._register([(row["type"] or "", str(a)) for a in row["aliases"]], Counter(), written=False):
+                self._parent[alias] = root
+        # Blocks are filled last, so loaded entities are not compared with each other
+        for i in range(len(self.ids)):
+            for key in self._keys(i):
+                self._blocks[key].append(i)
+        return self
+
+    def resolve(self, graph_documents: List[GraphDocument]) -> List[GraphDocument]:
+        """
+        Resolve the entities of graph_documents against each other and
+        everything seen before, and return the documents rewritten onto the
+        canonical ids: duplicate nodes folded together with their properties
+        and aliases, relationships moved onto the canonical nodes, and loops
+        and repeated relationships dropped.
+        """
+        with telemetry.stage("resolve") as span:
+            mentions = Counter()
+            for graph_document in graph_documents:
+                mentions.update({(n.type, n.id) for n in graph_document.nodes})
+            stats = self.add(list(mentions), mentions)
+            span.add(entities=stats.entities, pairs=stats.pairs, merged=stats.merged)
+            aliases = self.aliases()
+            resolved = [self._rewrite(graph_document, aliases) for graph_document in graph_documents]
+        # The caller writes them next, from now on their canonical ids are fixed
+        for kind, entity_id in mentions:
+            self._written[self.find(self._index[(kind.casefold(), entity_id)])] = True
+        return resolved
+
+    def _rewrite(self, graph_document: GraphDocument, aliases: Dict[str, List[str]]) -> GraphDocument:
+        nodes: Dict[Tuple[str, str], Node] = {}
+
+        def node_for(node: Node) -> Node:
+            key = (self.canonical(node.type, node.id), node.type)
+            if key not in nodes:
+                properties = {}
+                if aliases.get(key[0]):
+                    properties["aliases"] = aliases[key[0]]
+                nodes[key] = Node(id=key[0], type=node.type, properties=properties)
+            nodes[key].properties.update({k: v for k, v in (node.properties or {}).items() if k != "aliases"})
+            return nodes[key]
+
+        for node in graph_document.nodes:
+            node_for(node)
+        relationships: Dict[Tuple[str, str, str], Relationship] = {}
+        for rel in graph_document.relationships:
+            source, target = node_for(rel.source), node_for(rel.target)
+            if source is target:
+                continue
+            key = (source.id, rel.type, target.id)
+            if key in relationships:
+                relationships[key].properties.update(rel.properties or {})
+            else:
+                relationships[key] = Relationship(source=source, target=target, type=rel.type,
+                                                  properties=dict(rel.properties or {}))
+        return GraphDocument(nodes=list(nodes.values()), relationships=list(relationships.values()),
+                             source=graph_document.source)
+
+
+def _entity_rows(graph) -> List[dict]:
+    rows = graph.query(
+        f"""MATCH (e:{quote(BASE_ENTITY_LABEL)})
+        RETURN e.id AS id, [l IN labels(e) WHERE l <> $base][0] AS type,
+               coalesce(e.aliases, []) AS aliases, COUNT {{ (e)<-[:MENTIONS]-() }} AS mentions""",
+        {"base": BASE_ENTITY_LABEL})
+    return [row for row in rows if row["id"] is not None]
+
+
+def resolve_graph(graph, embeddings=None, batch_size: int = 500, **kwargs) -> ResolutionStats:
+    """
+    Batch job over the entities already in Neo4j: resolve them all and merge
+    every cluster into its canonical node with apoc.refactor.mergeNodes,
+    storing the other names as aliases. Returns the stats with merged set to
+    the number of nodes merged away; bump the graph version afterwards.
+    """
+    start = time.perf_counter()
+    resolver = EntityResolver(embeddings, **kwargs)
+    rows = _entity_rows(graph)
+    mentions = Counter({(row["type"] or "", str(row["id"])): row["mentions"] for row in rows})
+    stats = resolver.add(list(mentions), mentions)
+    stored = defaultdict(set)
+    for row in rows:
+        stored[str(row["id"])].update(row["aliases"])
+    clusters = []
+    for keep, merge in resolver.aliases().items():
+        aliases = set(merge).union(*(stored[name] for name in [keep] + merge)) - {keep}
+        clusters.append({"keep": keep, "merge": merge, "aliases": sorted(aliases)})
+    with telemetry.stage("resolve_graph") as span:
+        for i in range(0, len(clusters), batch_size):
+            graph.query(MERGE_QUERY, {"clusters": clusters[i:i + batch_size]})
+        span.add(clusters=len(clusters), merged=sum(len(c["merge"]) for c in clusters))
+    stats.merged = sum(len(c["merge"]) for c in clusters)
+    stats.seconds = time.perf_counter() - start
+    return stats
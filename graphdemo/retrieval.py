@@ -0,0 +1,276 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import List, Optional, Tuple
+
+from langchain_core.documents import Document
+from langchain_core.runnables import RunnableLambda
+from langchain_community.vectorstores.neo4j_vector import remove_lucene_chars
+from neo4j import RoutingControl
+
+from . import telemetry
+
+# Metadata key of the stored chunk vector on vector search hits, the one
+# Neo4jVector uses with return_embeddings
+EMBEDDING_KEY = "_embedding_"
+
+# One round trip for all entities of a question: every fulltext query keeps
+# its own LIMIT 50 inside the subquery, as with one query per entity
+STRUCTURED_QUERY = """
+UNWIND $queries AS query
+CALL {
+  WITH query
+  CALL db.index.fulltext.queryNodes('entity', query, {limit:2})
+  YIELD node, score
+  CALL {
+    WITH node
+    MATCH (node)-[r:!MENTIONS]->(neighbor)
+    RETURN node.id + ' - ' + type(r) + ' -> ' + neighbor.id AS output
+    UNION ALL
+    WITH node
+    MATCH (node)<-[r:!MENTIONS]-(neighbor)
+    RETURN neighbor.id + ' - ' + type(r) + ' -> ' +  node.id AS output
+  }
+  RETURN output LIMIT 50
+}
+RETURN output
+"""
+
+# Same output read from the neighborhoods materialized by NeighborhoodView
+NEIGHBORHOOD_QUERY = """
+UNWIND $queries AS query
+CALL {
+  WITH query
+  CALL db.index.fulltext.queryNodes('entity', query, {limit:2})
+  YIELD node, score
+  UNWIND coalesce(node.neighborhood, []) AS output
+  RETURN output LIMIT 50
+}
+RETURN output
+"""
+
+# STRUCTURED_QUERY and NEIGHBORHOOD_QUERY over entities already resolved by
+# EntityLookup: each of $queries is a list of __Entity__ ids
+STRUCTURED_ID_QUERY = """
+UNWIND $queries AS query
+CALL {
+  WITH query
+  MATCH (node:`__Entity__`) WHERE node.id IN query
+  CALL {
+    WITH node
+    MATCH (node)-[r:!MENTIONS]->(neighbor)
+    RETURN node.id + ' - ' + type(r) + ' -> ' + neighbor.id AS output
+    UNION ALL
+    WITH node
+    MATCH (node)<-[r:!MENTIONS]-(neighbor)
+    RETURN neighbor.id + ' - ' + type(r) + ' -> ' +  node.id AS output
+  }
+  RETURN output LIMIT 50
+}
+RETURN output
+"""
+
+NEIGHBORHOOD_ID_QUERY = """
+UNWIND $queries AS query
+CALL {
+  WITH query
+  MATCH (node:`__Entity__`) WHERE node.id IN query
+  UNWIND coalesce(node.neighborhood, []) AS output
+  RETURN output LIMIT 50
+}
+RETURN output
+"""
+
+
+def batch_query(query: str) -> str:
+    """
+    Run a $queries query (STRUCTURED_QUERY, NEIGHBORHOOD_QUERY) for many
+    questions in one round trip: $requests is a list of {id, queries} and
+    every output row carries the id of its request.
+    """
+    return f"""
+UNWIND $requests AS request
+CALL {{
+  WITH request
+  WITH request.queries AS queries
+  {query.strip().replace("$queries", "queries")}
+}}
+RETURN request.id AS request, output
+"""
+
+
+def generate_full_text_query(input: str) -> str:
+    """
+    Generate a full-text search query for a given input string.
+
+    This function constructs a query string suitable for a full-text search.
+    It processes the input string by splitting it into words and appending a
+    similarity threshold (~2 changed characters) to each word, then combines
+    them using the AND operator. Useful for mapping entities from user questions
+    to database values, and allows for some misspelings.
+    """
+    full_text_query = ""
+    words = [el for el in remove_lucene_chars(input).split() if el]
+    for word in words[:-1]:
+        full_text_query += f" {word}~2 AND"
+    full_text_query += f" {words[-1]}~2"
+    return full_text_query.strip()
+
+
+def full_text_queries(names: List[str]) -> List[str]:
+    return [generate_full_text_query(name) for name in names if remove_lucene_chars(name).strip()]
+
+
+def format_context(structured_data: str, documents: List[Document]) -> str:
+    unstructured_data = [el.page_content for el in documents]
+    return f"""Structured data:
+{structured_data}
+Unstructured data:
+{"#Document ". join(unstructured_data)}
+    """
+
+
+class GraphRetriever:
+    """
+    Hybrid retriever over the entity graph and the chunk vector index.
+
+    The structured leg resolves all entities of a question in a single Cypher
+    call, and runs concurrently with the vector search, so retrieval takes as
+    long as the slower of the two legs. retrieve() runs the legs on threads
+    with the sync driver; aretrieve() uses the async driver, or the shared
+    one of a SharedNeo4jGraph. Graph reads are routed to replicas where the
+    graph supports it. With materialized=True the neighborhoods are read
+    from the properties NeighborhoodView maintains instead of traversed. An
+    assembler (context.ContextAssembler) dedupes, reranks and trims both
+    legs to a token budget, reusing the question vector of the vector leg
+    and the chunk vectors it returns; without one everything is joined as is. With
+    a lookup (entity_lookup.EntityLookup) entity names are resolved tier by
+    tier and cached instead of every name running a fuzzy fulltext query.
+    """
+
+    def __init__(self, graph, entity_chain, vector_index, async_driver=None, k: int = 4, materialized: bool = False,
+                 assembler=None, lookup=None):
+        self.graph = graph
+        self.entity_chain = entity_chain
+        self.vector_index = vector_index
+        self.async_driver = async_driver
+        self.k = k
+        self.lookup = lookup
+        if lookup is not None:
+            self.query = NEIGHBORHOOD_ID_QUERY if materialized else STRUCTURED_ID_QUERY
+        else:
+            self.query = NEIGHBORHOOD_QUERY if materialized else STRUCTURED_QUERY
+        self.assembler = assembler
+        self._pool = ThreadPoolExecutor(max_workers=4)
+
+    def structured(self, question: str) -> str:
+        """
+        Collects the neighborhood of entities mentioned
+        in the question
+        """
+        with telemetry.stage("entity_chain") as span:
+            names = self.entity_chain.invoke({"question": question}).names
+            span.add(entities=len(names))
+        queries = self.lookup.resolve(names) if self.lookup is not None else full_text_queries(names)
+        if not queries:
+            return ""
+        with telemetry.stage("fulltext"):
+            response = getattr(self.graph, "read_query", self.graph.query)(self.query, {"queries": queries})
+        return "\n".join(el["output"] for el in response)
+
+    def _embedding(self):
+        """The embeddings of the vector index, when it can also search by vector."""
+        if hasattr(self.vector_index, "similarity_search_by_vector"):
+            return getattr(self.vector_index, "embedding", None)
+        return None
+
+    def search(self, question: str) -> Tuple[Optional[List[float]], List[Document]]:
+        """
+        The question vector and the vector search hits. The question is
+        embedded as asked, so case-sensitive names keep their casing; the
+        answer cache embeds the same text, so with CachedEmbeddings it is
+        computed once per question.
+        """
+        with telemetry.stage("vector_search") as span:
+            embedding = self._embedding()
+            if embedding is None:
+                vector, documents = None, self.vector_index.similarity_search(question, self.k)
+            else:
+                vector = embedding.embed_query(question)
+                documents = self.vector_index.similarity_search_by_vector(vector, self.k, query=question)
+            span.add(documents=len(documents))
+        return vector, documents
+
+    def similar(self, question: str) -> List[Document]:
+        return self.search(question)[1]
+
+    @telemetry.traced("retrieve")
+    def retrieve(self, question: str) -> str:
+        structured = self._pool.submit(telemetry.in_context(self.structured), question)
+        search = self._pool.submit(telemetry.in_context(self.search), question)
+        vector, documents = search.result()
+        if self.assembler is not None:
+            return self.assembler.assemble(question, structured.result(), documents, vector)
+        return format_context(structured.result(), documents)
+
+    async def astructured(self, question: str) -> str:
+        with telemetry.stage("entity_chain") as span:
+            names = (await self.entity_chain.ainvoke({"question": question})).names
+            span.add(entities=len(names))
+        if not names:
+            return ""
+        with telemetry.stage("fulltext"):
+            return "\n".join(await self.aneighborhoods(names))
+
+    async def aneighborhoods(self, names: List[str]) -> List[str]:
+        """Neighborhood lines of the entities named in one question."""
+        if self.lookup is not None:
+            queries = await self.lookup.aresolve(names, self._aread)
+        else:
+            queries = full_text_queries(names)
+        if not queries:
+            return []
+        return await self.afulltext(queries)
+
+    async def afulltext(self, queries: List[str]) -> List[str]:
+        """Neighborhood lines of the fulltext queries (or entity ids) of one question, in one round trip."""
+        return [row["output"] for row in await self._aread(self.query, {"queries": queries})]
+
+    async def _aread(self, query: str, params: dict) -> List[dict]:
+        if self.async_driver is None and hasattr(self.graph, "aquery"):
+            return await self.graph.aquery(query, params, read=True)
+        if self.async_driver is None:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._pool, telemetry.in_context(self.graph.query), query, params)
+        records, _, _ = await self.async_driver.execute_query(
+            query, params, database_=getattr(self.graph, "_database", None), routing_=RoutingControl.READ)
+        telemetry.add(round_trips=1, rows=len(records))
+        return [record.data() for record in records]
+
+    async def asearch(self, question: str) -> Tuple[Optional[List[float]], List[Document]]:
+        with telemetry.stage("vector_search") as span:
+            embedding = self._embedding()
+            if embedding is not None:
+                # Neo4jVector only searches synchronously: embed the question
+                # asynchronously and run the search on the vector in a thread
+                vector = await embedding.aembed_query(question)
+                documents = await asyncio.get_running_loop().run_in_executor(
+                    self._pool, telemetry.in_context(partial(
+                        self.vector_index.similarity_search_by_vector, vector, self.k, query=question)))
+            else:
+                vector, documents = None, await self.vector_index.asimilarity_search(question, k=self.k)
+            span.add(documents=len(documents))
+        return vector, documents
+
+    async def asimilar(self, question: str) -> List[Document]:
+        return (await self.asearch(question))[1]
+
+    @telemetry.traced("retrieve")
+    async def aretrieve(self, question: str) -> str:
+        structured, (vector, documents) = await asyncio.gather(self.astructured(question), self.asearch(question))
+        if self.assembler is not None:
+            return await self.assembler.aassemble(question, structured, documents, vector)
+        return format_context(structured, documents)
+
+    def as_runnable(self) -> RunnableLambda:
+        return RunnableLambda(self.retrieve, afunc=self.aretrieve).with_config(run_name="GraphRetriever")
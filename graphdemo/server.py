@@ -0,0 +1,256 @@
+"""
+Long-lived asyncio query service over the graph RAG chain and, optionally,
+the Cypher QA chain of 03-cypher-chain.py.
+
+    POST /query   {"question": "...", "chat_history": [["q", "a"], ...]}
+    POST /cypher  {"query": "..."}
+    GET  /health
+    GET  /metrics
+
+The LLM clients, the pooled Neo4j driver and the vector store are created
+once. Work of concurrent requests arriving within a few milliseconds of each
+other is micro-batched: question embeddings go out in one embedding call,
+entity extraction in one LLM call, and the entity lookups and neighborhood
+reads in one Cypher query each.
+"""
+import asyncio
+import json
+import time
+from http import HTTPStatus
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+from . import telemetry
+from .retrieval import GraphRetriever, batch_query, full_text_queries
+
+
+class MicroBatcher:
+    """
+    Collects items submitted concurrently and hands them to fn in one call.
+
+    A batch is flushed max_wait seconds after its first item arrived, or as
+    soon as it holds max_batch items. fn gets the list of items and returns
+    one result per item, in order; an exception fails every item of the
+    batch.
+    """
+
+    def __init__(self, fn: Callable[[List[Any]], Awaitable[List[Any]]], max_batch: int = 16,
+                 max_wait: float = 0.005, name: str = "batch"):
+        self.fn = fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.name = name
+        self.batches = 0
+        self.items = 0
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+
+    async def submit(self, item: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            # The loop only keeps weak references to tasks
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[Any, asyncio.Future]]):
+        self.batches += 1
+        self.items += len(batch)
+        telemetry.observe("batch_size", len(batch), batcher=self.name)
+        try:
+            results = await self.fn([item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+class BatchedEmbeddings(Embeddings):
+    """Embeddings whose aembed_query calls are micro-batched into aembed_documents calls."""
+
+    def __init__(self, embeddings: Embeddings, max_batch: int = 64, max_wait: float = 0.005):
+        self.embeddings = embeddings
+        self.batcher = MicroBatcher(embeddings.aembed_documents, max_batch, max_wait, name="embed")
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.embeddings.aembed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self.batcher.submit(text)
+
+
+class BatchedEntityChain:
+    """
+    Drop-in for entity_chain whose ainvoke calls are micro-batched into one
+    batch_entity_chain call. Batches of one, and batches whose answer does
+    not have one item per question, go through entity_chain instead.
+    """
+
+    def __init__(self, entity_chain, batch_entity_chain, max_batch: int = 16, max_wait: float = 0.005):
+        self.entity_chain = entity_chain
+        self.batch_entity_chain = batch_entity_chain
+        self.batcher = MicroBatcher(self._extract, max_batch, max_wait, name="entity_chain")
+
+    async def _extract(self, inputs: List[Dict[str, Any]]) -> list:
+        if len(inputs) > 1:
+            questions = "\n".join(f"{i}. {' '.join(x['question'].split())}" for i, x in enumerate(inputs, 1))
+            batch = await self.batch_entity_chain.ainvoke({"questions": questions})
+            if batch is not None and len(batch.entities) == len(inputs):
+                return batch.entities
+        return await self.entity_chain.abatch(inputs)
+
+    def invoke(self, inputs: Dict[str, Any], config=None):
+        return self.entity_chain.invoke(inputs, config)
+
+    async def ainvoke(self, inputs: Dict[str, Any], config=None):
+        return await self.batcher.submit(inputs)
+
+
+class BatchedGraphRetriever(GraphRetriever):
+    """
+    GraphRetriever whose entity lookups and fulltext (or by id) queries of
+    concurrent questions share one Cypher query each.
+    """
+
+    def __init__(self, *args, max_batch: int = 16, max_wait: float = 0.005, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.batch_query = batch_query(self.query)
+        self.batcher = MicroBatcher(self._neighborhoods_batch, max_batch, max_wait, name="fulltext")
+
+    async def aneighborhoods(self, names: List[str]) -> List[str]:
+        return await self.batcher.submit(names)
+
+    async def _neighborhoods_batch(self, batches: List[List[str]]) -> List[List[str]]:
+        if self.lookup is not None:
+            queries = await self.lookup.aresolve_many(batches, self._aread)
+        else:
+            queries = [full_text_queries(names) for names in batches]
+        requests = [{"id": i, "queries": q} for i, q in enumerate(queries) if q]
+        outputs = [[] for _ in batches]
+        if not requests:
+            return outputs
+        rows = await self._aread(self.batch_query, {"requests": requests})
+        for row in rows:
+            outputs[row["request"]].append(row["output"])
+        return outputs
+
+
+class QueryService:
+    """HTTP/1.1 endpoint (with keep-alive) over asyncio.start_server."""
+
+    def __init__(self, chain, cypher_chain=None):
+        self.chain = chain
+        self.cypher_chain = cypher_chain
+
+    async def answer(self, question: str, chat_history: List[Tuple[str, str]] = ()) -> str:
+        return await self.chain.ainvoke({"question": question, "chat_history": [tuple(t) for t in chat_history]})
+
+    async def handle(self, method: str, path: str, body: bytes) -> Tuple[int, str, bytes]:
+        if method == "GET" and path == "/health":
+            return 200, "application/json", b'{"status": "ok"}'
+        if method == "GET" and path == "/metrics":
+            return 200, "text/plain; version=0.0.4", telemetry.metrics.prometheus().encode("utf-8")
+        if method != "POST" or path not in ("/query", "/cypher"):
+            return 404, "application/json", b'{"error": "not found"}'
+        try:
+            request = json.loads(body or b"{}")
+        except ValueError:
+            return 400, "application/json", b'{"error": "invalid JSON"}'
+        start = time.perf_counter()
+        with telemetry.stage("request", route=path):
+            if path == "/query":
+                if not request.get("question"):
+                    return 400, "application/json", b'{"error": "question is required"}'
+                response = {"answer": await self.answer(request["question"], request.get("chat_history") or [])}
+            else:
+                if self.cypher_chain is None:
+                    return 404, "application/json", b'{"error": "no Cypher chain configured"}'
+                if not request.get("query"):
+                    return 400, "application/json", b'{"error": "query is required"}'
+                # The Cypher chain is synchronous
+                result = await asyncio.to_thread(self.cypher_chain.invoke, {"query": request["query"]})
+                response = {"result": result.get("result")}
+        response["seconds"] = round(time.perf_counter() - start, 4)
+        return 200, "application/json", json.dumps(response).encode("utf-8")
+
+    async def _connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                method, path, version = line.decode("latin-1").split()
+                headers = {}
+                while (header := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = header.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length") or 0))
+                try:
+                    status, content_type, payload = await self.handle(method, path.split("?", 1)[0], body)
+                except Exception as e:
+                    status, content_type = 500, "application/json"
+                    payload = json.dumps({"error": f"{type(e).__name__}: {e}"}).encode("utf-8")
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                writer.write(
+                    f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+                    f"Content-Type: {content_type}\r\nContent-Length: {len(payload)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8000):
+        server = await asyncio.start_server(self._connection, host, port)
+        print(f"Serving on http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+def build_service(graph, llm, embeddings, entity_matcher=None, condense_llm=None, cypher_chain=None,
+                  local: Optional[bool] = None, materialized: bool = False, cache: bool = True,
+                  context_tokens: Optional[int] = None, max_batch: int = 16, max_wait: float = 0.005) -> QueryService:
+    """
+    QueryService over build_chain with the batching embeddings, entity chain
+    and retriever. Requests waiting for the same embedding, entity or
+    fulltext step within max_wait seconds go out together.
+    """
+    from functools import partial
+
+    from .rag import batch_entity_chain, build_chain, entity_chain, get_vector_index
+
+    embeddings = BatchedEmbeddings(embeddings, max_batch * 4, max_wait)
+    entities = BatchedEntityChain(entity_chain(llm), batch_entity_chain(llm), max_batch, max_wait)
+    chain, _ = build_chain(
+        graph, llm, embeddings, get_vector_index(graph, embeddings, local=local),
+        entity_matcher=entity_matcher, condense_llm=condense_llm, cache=cache, materialized=materialized,
+        context_tokens=context_tokens, entities=entities, retriever_factory=partial(BatchedGraphRetriever, max_batch=max_batch, max_wait=max_wait))
+    return QueryService(chain, cypher_chain)
@@ -0,0 +1,422 @@
+"""
+Columnar snapshots of the knowledge graph: __Entity__ nodes, Document chunks
+with their embeddings and the relationships between them, saved as one
+compressed NumPy archive and loaded back into an empty database without
+running extraction again.
+"""
+import csv
+import json
+import os
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Tuple
+
+import numpy as np
+
+from . import telemetry
+from .embeddings import write_embeddings
+from .graph_writer import BASE_ENTITY_LABEL, BulkGraphWriter, quote
+from .reset import schema_statements
+
+NODE_QUERY = f"""
+MATCH (n) WHERE n:Document OR n:{quote(BASE_ENTITY_LABEL)}
+RETURN elementId(n) AS element, labels(n) AS labels, properties(n) AS properties
+"""
+
+RELATIONSHIP_QUERY = f"""
+MATCH (s)-[r]->(t)
+WHERE (s:Document OR s:{quote(BASE_ENTITY_LABEL)}) AND (t:Document OR t:{quote(BASE_ENTITY_LABEL)})
+RETURN elementId(s) AS source, elementId(t) AS target, type(r) AS type, properties(r) AS properties
+"""
+
+
+# neo4j-admin array delimiters, the first one no value or label contains is used
+ARRAY_DELIMITERS = [";", "|", "\x1f"]
+
+
+class StringColumn:
+    """
+    Strings stored as one UTF-8 buffer: string i is the bytes
+    data[offsets[i]:offsets[i + 1]], so a column costs its text plus 8 bytes
+    per row instead of its longest string times every row.
+    """
+
+    def __init__(self, offsets: np.ndarray, data: np.ndarray):
+        self.offsets = offsets
+        self.data = data
+
+    @classmethod
+    def from_strings(cls, strings: Iterable[str]) -> "StringColumn":
+        encoded = [text.encode("utf-8") for text in strings]
+        offsets = np.concatenate([[0], np.cumsum([len(b) for b in encoded])]).astype(np.int64)
+        return cls(offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return self.data[self.offsets[i]:self.offsets[i + 1]].tobytes().decode("utf-8")
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def __contains__(self, text: str) -> bool:
+        """Whether any of the strings contains text."""
+        return text.encode("utf-8") in self.data.tobytes()
+
+
+STRING_COLUMNS = ["ids", "properties", "relationship_properties"]
+
+
+@dataclass
+class Snapshot:
+    """
+    Column arrays of one graph. Node i has the id ids[i], the labels
+    label_vocab[label_indices[label_indptr[i]:label_indptr[i + 1]]] and the
+    JSON-encoded properties properties[i]. Its outgoing relationships are
+    indptr[i]:indptr[i + 1] of indices (target node), types (into
+    type_vocab) and relationship_properties. embeddings is a float32 matrix
+    whose row j belongs to node embedding_nodes[j]. The string columns
+    (ids and both properties) are StringColumns.
+    """
+    ids: StringColumn
+    label_vocab: List[str]
+    label_indptr: np.ndarray
+    label_indices: np.ndarray
+    properties: StringColumn
+    indptr: np.ndarray
+    indices: np.ndarray
+    types: np.ndarray
+    type_vocab: List[str]
+    relationship_properties: StringColumn
+    embedding_nodes: np.ndarray
+    embeddings: np.ndarray
+    embedding_property: str = "embedding"
+    schema: List[Dict[str, str]] = field(default_factory=list)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def relationships(self) -> int:
+        return len(self.indices)
+
+    def labels(self, i: int) -> List[str]:
+        return [self.label_vocab[j] for j in self.label_indices[self.label_indptr[i]:self.label_indptr[i + 1]]]
+
+    def key_label(self, i: int) -> str:
+        """The label the node is merged and matched on."""
+        return "Document" if "Document" in self.labels(i) else BASE_ENTITY_LABEL
+
+    def edges(self) -> Iterable[Tuple[int, int, int]]:
+        """(source, target, edge) triples, grouped by source node."""
+        sources = np.repeat(np.arange(len(self.ids)), np.diff(self.indptr))
+        return zip(sources.tolist(), self.indices.tolist(), range(len(self.indices)))
+
+    def save(self, path: str):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        meta = {"label_vocab": self.label_vocab, "type_vocab": self.type_vocab,
+                "embedding_property": self.embedding_property, "schema": self.schema}
+        strings = {}
+        for name in STRING_COLUMNS:
+            column = getattr(self, name)
+            strings[name + "_offsets"], strings[name + "_data"] = column.offsets, column.data
+        np.savez_compressed(
+            path, meta=np.array(json.dumps(meta)), label_indptr=self.label_indptr,
+            label_indices=self.label_indices, indptr=self.indptr, indices=self.indices, types=self.types,
+            embedding_nodes=self.embedding_nodes, embeddings=self.embeddings, **strings)
+
+    @classmethod
+    def load(cls, path: str) -> "Snapshot":
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            strings = {}
+            for name in STRING_COLUMNS:
+                if name in data.files:
+                    # Written before the string columns were packed, as fixed-width arrays
+                    strings[name] = StringColumn.from_strings(data[name].tolist())
+                else:
+                    strings[name] = StringColumn(data[name + "_offsets"], data[name + "_data"])
+            return cls(label_vocab=meta["label_vocab"], label_indptr=data["label_indptr"],
+                       label_indices=data["label_indices"], indptr=data["indptr"], indices=data["indices"],
+                       types=data["types"], type_vocab=meta["type_vocab"], embedding_nodes=data["embedding_nodes"],
+                       embeddings=data["embeddings"], embedding_property=meta["embedding_property"],
+                       schema=meta["schema"], **strings)
+
+
+@dataclass
+class SnapshotStats:
+    nodes: int = 0
+    relationships: int = 0
+    embeddings: int = 0
+    batches: int = 0
+    # Nodes without an id, which cannot be matched on reload, and their relationships
+    skipped: int = 0
+    seconds: float = 0.0
+
+    def __str__(self):
+        skipped = f" ({self.skipped} nodes without id skipped)" if self.skipped else ""
+        return (f"{self.nodes} nodes, {self.relationships} relationships and {self.embeddings} embeddings "
+                f"in {self.seconds:.2f}s{skipped}")
+
+
+def _stream(graph, query: str) -> Iterable[Dict[str, Any]]:
+    # A SharedNeo4jGraph session streams records instead of materializing the whole result
+    session = getattr(graph, "session", None)
+    if session is None:
+        yield from graph.query(query)
+        return
+    with session(read=True) as s:
+        for record in s.run(query):
+            yield record.data()
+
+
+def _json(value: Dict[str, Any]) -> str:
+    # Temporal and spatial values are stored as their string form
+    return json.dumps(value, default=str, ensure_ascii=False)
+
+
+def export_snapshot(graph, path: str, embedding_property: str = "embedding") -> SnapshotStats:
+    """Read the graph into a Snapshot and save it to path (.npz)."""
+    start = time.perf_counter()
+    with telemetry.stage("snapshot_export") as span:
+        index, ids, properties, label_sets = {}, [], [], []
+        vectors, vector_nodes = [], []
+        skipped = 0
+        for row in _stream(graph, NODE_QUERY):
+            props = row["properties"]
+            if props.get("id") is None:
+                skipped += 1
+                continue
+            i = index[row["element"]] = len(ids)
+            vector = props.pop(embedding_property, None)
+            if vector is not None:
+                vectors.append(np.asarray(vector, dtype=np.float32))
+                vector_nodes.append(i)
+            ids.append(str(props.get("id")))
+            properties.append(_json(props))
+            label_sets.append(row["labels"])
+        label_vocab = sorted({label for labels in label_sets for label in labels})
+        label_codes = {label: code for code, label in enumerate(label_vocab)}
+
+        sources, targets, types, rel_properties = [], [], [], []
+        type_codes: Dict[str, int] = {}
+        for row in _stream(graph, RELATIONSHIP_QUERY):
+            if row["source"] not in index or row["target"] not in index:
+                continue
+            sources.append(index[row["source"]])
+            targets.append(index[row["target"]])
+            types.append(type_codes.setdefault(row["type"], len(type_codes)))
+            rel_properties.append(_json(row["properties"]))
+        # CSR: edges sorted by source node, indptr[i] is where node i's edges start
+        order = np.argsort(np.asarray(sources, dtype=np.int64), kind="stable")
+        counts = np.bincount(np.asarray(sources, dtype=np.int64), minlength=len(ids))
+
+        snapshot = Snapshot(
+            ids=StringColumn.from_strings(ids),
+            label_vocab=label_vocab,
+            label_indptr=np.concatenate([[0], np.cumsum([len(labels) for labels in label_sets])]).astype(np.int64),
+            label_indices=np.asarray([label_codes[l] for labels in label_sets for l in labels], dtype=np.int32),
+            properties=StringColumn.from_strings(properties),
+            indptr=np.concatenate([[0], np.cumsum(counts)]).astype(np.int64),
+            indices=np.asarray(targets, dtype=np.int64)[order],
+            types=np.asarray(types, dtype=np.int32)[order],
+            type_vocab=sorted(type_codes, key=type_codes.get),
+            relationship_properties=StringColumn.from_strings(rel_properties[j] for j in order.tolist()),
+            embedding_nodes=np.asarray(vector_nodes, dtype=np.int64),
+            embeddings=np.vstack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32),
+            embedding_property=embedding_property,
+            schema=schema_statements(graph),
+        )
+        snapshot.save(path)
+        span.add(nodes=len(snapshot), relationships=snapshot.relationships)
+    return SnapshotStats(nodes=len(snapshot), relationships=snapshot.relationships,
+                         embeddings=len(snapshot.embedding_nodes), skipped=skipped,
+                         seconds=time.perf_counter() - start)
+
+
+def _batches(rows: List[Dict[str, Any]], size: int) -> Iterable[List[Dict[str, Any]]]:
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+
+def load_snapshot(graph, path: str, batch_size: int = 5000) -> SnapshotStats:
+    """
+    Write a snapshot into an empty database with batched CREATEs: the id
+    constraints first, then nodes grouped by label set, relationships
+    grouped by type and endpoint labels, the embeddings as vector
+    properties, and finally the indexes and constraints of the exported
+    database (fulltext and vector indexes included).
+    """
+    start = time.perf_counter()
+    if graph.query(f"MATCH (n) WHERE n:Document OR n:{quote(BASE_ENTITY_LABEL)} RETURN count(n) > 0 AS used")[0]["used"]:
+        raise ValueError("The database already has Document or entity nodes, clear it first (graphdemo clear)")
+    snapshot = Snapshot.load(path)
+    stats = SnapshotStats()
+    with telemetry.stage("snapshot_load") as span:
+        BulkGraphWriter(graph).ensure_constraints()
+
+        nodes = defaultdict(list)
+        # ids column is for display; matching uses the id as typed in the properties
+        node_ids = []
+        for i in range(len(snapshot)):
+            properties = json.loads(snapshot.properties[i])
+            node_ids.append(properties["id"])
+            nodes[tuple(snapshot.labels(i))].append({"properties": properties})
+        for labels, rows in nodes.items():
+            query = f"UNWIND $rows AS row CREATE (n:{':'.join(quote(l) for l in labels)}) SET n = row.properties"
+            for batch in _batches(rows, batch_size):
+                graph.query(query, {"rows": batch})
+                stats.batches += 1
+        stats.nodes = len(snapshot)
+
+        key_labels = [snapshot.key_label(i) for i in range(len(snapshot))]
+        relationships = defaultdict(list)
+        for source, target, edge in snapshot.edges():
+            key = (key_labels[source], snapshot.type_vocab[snapshot.types[edge]], key_labels[target])
+            relationships[key].append({"source": node_ids[source], "target": node_ids[target],
+                                       "properties": json.loads(snapshot.relationship_properties[edge])})
+        for (source_label, rel_type, target_label), rows in relationships.items():
+            query = (f"UNWIND $rows AS row MATCH (s:{quote(source_label)} {{id: row.source}}) "
+                     f"MATCH (t:{quote(target_label)} {{id: row.target}}) "
+                     f"CREATE (s)-[r:{quote(rel_type)}]->(t) SET r = row.properties")
+            for batch in _batches(rows, batch_size):
+                graph.query(query, {"rows": batch})
+                stats.batches += 1
+        stats.relationships = snapshot.relationships
+
+        vectors = defaultdict(list)
+        for node, vector in zip(snapshot.embedding_nodes.tolist(), snapshot.embeddings):
+            vectors[key_labels[node]].append({"id": node_ids[node], "vector": vector.tolist()})
+        for label, rows in vectors.items():
+            for batch in _batches(rows, batch_size):
+                write_embeddings(graph, batch, label, snapshot.embedding_property)
+                stats.batches += 1
+        stats.embeddings = len(snapshot.embedding_nodes)
+
+        restore_schema(graph, snapshot.schema)
+        span.add(nodes=stats.nodes, relationships=stats.relationships)
+    stats.seconds = time.perf_counter() - start
+    return stats
+
+
+def _schema_key(item: Dict[str, Any]) -> Tuple:
+    return (item["kind"], item.get("type"), tuple(item.get("labelsOrTypes") or ()), tuple(item.get("properties") or ()))
+
+
+def restore_schema(graph, schema: List[Dict[str, Any]]) -> int:
+    """
+    Create the indexes and constraints of schema that the database does not
+    have yet, by name or by what they cover: an unnamed constraint_<hash> of
+    add_graph_documents is the same rule as BulkGraphWriter's
+    constraint_entity_id. Returns the number created.
+    """
+    existing = schema_statements(graph)
+    names = {item["name"] for item in existing}
+    covered = {_schema_key(item) for item in existing}
+    created = 0
+    for item in schema:
+        if item["name"] in names or _schema_key(item) in covered:
+            continue
+        try:
+            graph.query(item["createStatement"])
+        except Exception as e:
+            # Equivalent rules the comparison above does not recognize
+            if not getattr(e, "code", "").endswith("AlreadyExists"):
+                raise
+            continue
+        created += 1
+    return created
+
+
+def _csv_type(values: List[Any]) -> str:
+    present = [v for v in values if v is not None]
+    if present and all(isinstance(v, bool) for v in present):
+        return ":boolean"
+    if present and all(isinstance(v, int) and not isinstance(v, bool) for v in present):
+        return ":long"
+    if present and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in present):
+        return ":double"
+    if present and all(isinstance(v, list) for v in present):
+        items = [x for v in present for x in v]
+        if items and all(isinstance(x, (int, float)) and not isinstance(x, bool) for x in items):
+            return ":double[]"
+        return ":string[]"
+    return ""
+
+
+def _csv_value(value: Any, delimiter: str) -> Any:
+    if isinstance(value, list):
+        return delimiter.join(str(v) for v in value)
+    if isinstance(value, bool):
+        return str(value).lower()
+    return value
+
+
+def _write_csv(path: str, header: List[str], rows: Iterable[List[Any]]):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+def _array_delimiter(snapshot: Snapshot) -> str:
+    # neo4j-admin has no escape for the array delimiter, so use one that
+    # appears in no value at all
+    for delimiter in ARRAY_DELIMITERS:
+        if not any(delimiter in label for label in snapshot.label_vocab) and \
+                delimiter not in snapshot.properties and delimiter not in snapshot.relationship_properties:
+            return delimiter
+    raise ValueError(f"Every array delimiter ({ARRAY_DELIMITERS!r}) appears in the snapshot's values")
+
+
+def write_admin_csv(path: str, directory: str, database: str = "neo4j") -> str:
+    """
+    Write a snapshot as neo4j-admin import CSVs: one node file per label
+    set, one relationship file per type, embeddings as float arrays.
+    Nodes are keyed by their row in the snapshot, which is not stored as a
+    property. Returns the neo4j-admin command that imports them (the
+    database must be stopped, or not exist yet).
+    """
+    snapshot = Snapshot.load(path)
+    delimiter = _array_delimiter(snapshot)
+    os.makedirs(directory, exist_ok=True)
+    vectors = dict(zip(snapshot.embedding_nodes.tolist(), range(len(snapshot.embedding_nodes))))
+    groups = defaultdict(list)
+    for i in range(len(snapshot)):
+        groups[tuple(snapshot.labels(i))].append(i)
+    arguments = []
+    for n, (labels, members) in enumerate(sorted(groups.items())):
+        properties = [json.loads(snapshot.properties[i]) for i in members]
+        keys = sorted({k for p in properties for k in p})
+        header = [":ID"] + [k + _csv_type([p.get(k) for p in properties]) for k in keys] + [":LABEL"]
+        has_vectors = any(i in vectors for i in members)
+        if has_vectors:
+            header.insert(-1, snapshot.embedding_property + ":float[]")
+        rows = []
+        for i, props in zip(members, properties):
+            row = [i] + [_csv_value(props.get(k), delimiter) for k in keys]
+            if has_vectors:
+                row.append(delimiter.join(map(repr, snapshot.embeddings[vectors[i]].tolist())) if i in vectors else "")
+            rows.append(row + [delimiter.join(labels)])
+        file = os.path.join(directory, f"nodes_{n}.csv")
+        _write_csv(file, header, rows)
+        arguments.append(f"--nodes={file}")
+
+    edges = defaultdict(list)
+    for source, target, edge in snapshot.edges():
+        edges[int(snapshot.types[edge])].append((source, target, json.loads(snapshot.relationship_properties[edge])))
+    for code, rows in sorted(edges.items()):
+        keys = sorted({k for _, _, p in rows for k in p})
+        header = [":START_ID", ":END_ID"] + [k + _csv_type([p.get(k) for _, _, p in rows]) for k in keys] + [":TYPE"]
+        file = os.path.join(directory, f"relationships_{code}.csv")
+        _write_csv(file, header, ([s, t] + [_csv_value(p.get(k), delimiter) for k in keys] + [snapshot.type_vocab[code]]
+                                  for s, t, p in rows))
+        arguments.append(f"--relationships={file}")
+    with open(os.path.join(directory, "schema.cypher"), "w", encoding="utf-8") as f:
+        f.writelines(item["createStatement"] + ";\n" for item in snapshot.schema)
+    # Characters outside printable ASCII are passed as U+<hex>, which neo4j-admin also accepts
+    option = delimiter if delimiter.isprintable() else f"U+{ord(delimiter):04X}"
+    return f"neo4j-admin database import full {' '.join(arguments)} --array-delimiter='{option}' {database}"
@@ -0,0 +1,315 @@
+import contextvars
+import functools
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.runnables import RunnableLambda
+
+# Off unless enable() is called; every hook checks this flag first
+enabled = False
+PREFIX = "graphdemo_"
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_current: contextvars.ContextVar = contextvars.ContextVar("telemetry_span", default=None)
+_log = None
+_log_lock = threading.Lock()
+
+
+def _label_key(labels: Dict[str, Any]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: Tuple[Tuple[str, str], ...], extra: str = "") -> str:
+    parts = [f'{k}="{v}"' for k, v in key]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Registry:
+    """Counters and fixed-bucket histograms, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, Dict[Tuple, float]] = defaultdict(lambda: defaultdict(float))
+        self.histograms: Dict[str, Dict[Tuple, List[float]]] = defaultdict(dict)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        with self._lock:
+            self.counters[name][_label_key(labels)] += value
+
+    def observe(self, name: str, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            # Per-bucket counts, then sum and count
+            histogram = self.histograms[name].setdefault(key, [0.0] * (len(BUCKETS) + 2))
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    histogram[i] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def clear(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            for name, series in sorted(self.counters.items()):
+                lines.append(f"# TYPE {PREFIX}{name} counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{PREFIX}{name}{_format_labels(key)} {value:g}")
+            for name, series in sorted(self.histograms.items()):
+                lines.append(f"# TYPE {PREFIX}{name} histogram")
+                for key, histogram in sorted(series.items()):
+                    for bound, count in zip(BUCKETS, histogram):
+                        labels = _format_labels(key, 'le="%g"' % bound)
+                        lines.append(f"{PREFIX}{name}_bucket{labels} {count:g}")
+                    labels = _format_labels(key, 'le="+Inf"')
+                    lines.append(f"{PREFIX}{name}_bucket{labels} {histogram[-1]:g}")
+                    lines.append(f"{PREFIX}{name}_sum{_format_labels(key)} {histogram[-2]:g}")
+                    lines.append(f"{PREFIX}{name}_count{_format_labels(key)} {histogram[-1]:g}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Registry()
+
+
+def _emit(record: Dict[str, Any]):
+    if _log is None:
+        return
+    line = json.dumps(record, default=str)
+    with _log_lock:
+        _log.write(line + "\n")
+        _log.flush()
+
+
+class Span:
+    """
+    One timed stage. Counts added while it is the current span (tokens,
+    Cypher round trips, rows) are reported with its wall time when it ends,
+    as a JSON log line and as stage metrics.
+    """
+
+    __slots__ = ("name", "labels", "trace", "id", "parent", "counts", "start", "_token", "_lock")
+
+    def __init__(self, name: str, labels: Dict[str, Any]):
+        parent = _current.get()
+        self.name = name
+        self.labels = labels
+        self.id = uuid.uuid4().hex[:16]
+        self.parent = parent.id if parent is not None else None
+        self.trace = parent.trace if parent is not None else uuid.uuid4().hex
+        self.counts: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, **counts):
+        with self._lock:
+            for key, value in counts.items():
+                self.counts[key] = self.counts.get(key, 0) + value
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.start
+        _current.reset(self._token)
+        status = "error" if exc_type is not None else "ok"
+        metrics.observe("stage_seconds", seconds, stage=self.name, **self.labels)
+        metrics.inc("stage_total", 1, stage=self.name, status=status, **self.labels)
+        for key, value in self.counts.items():
+            metrics.inc(f"stage_{key}_total", value, stage=self.name, **self.labels)
+        record = {"ts": time.time(), "trace": self.trace, "span": self.id, "parent": self.parent,
+                  "stage": self.name, **self.labels, "seconds": round(seconds, 6), **self.counts, "status": status}
+        if exc_type is not None:
+            record["error"] = f"{exc_type.__name__}: {exc}"
+        _emit(record)
+        return False
+
+
+class _NullSpan:
+    def add(self, **counts):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL = _NullSpan()
+
+
+def stage(name: str, **labels):
+    """Context manager timing a stage; a shared no-op when telemetry is off."""
+    return Span(name, labels) if enabled else _NULL
+
+
+def add(**counts):
+    """Add counts to the current span, if any."""
+    if enabled:
+        span = _current.get()
+        if span is not None:
+            span.add(**counts)
+
+
+def observe(name: str, value: float, **labels):
+    """Record a histogram sample and log it, outside of any stage."""
+    if enabled:
+        metrics.observe(name, value, **labels)
+        _emit({"ts": time.time(), "metric": name, **labels, "value": round(value, 6)})
+
+
+def traced(name: str, **labels):
+    """Decorator running a sync or async function inside stage(name)."""
+    def decorate(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                if not enabled:
+                    return await fn(*args, **kwargs)
+                with Span(name, labels):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return fn(*args, **kwargs)
+            with Span(name, labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def traced_runnable(name: str, runnable, **labels) -> RunnableLambda:
+    """Runnable that invokes the given one inside stage(name)."""
+    def invoke(value, config):
+        with stage(name, **labels):
+            return runnable.invoke(value, config)
+
+    async def ainvoke(value, config):
+        with stage(name, **labels):
+            return await runnable.ainvoke(value, config)
+
+    return RunnableLambda(invoke, afunc=ainvoke).with_config(run_name=name)
+
+
+def in_context(fn):
+    """Bind fn to a copy of the current context, so spans follow it onto a worker thread."""
+    return functools.partial(contextvars.copy_context().run, fn)
+
+
+def _count_rows(rows):
+    if enabled:
+        span = _current.get()
+        if span is not None:
+            span.add(round_trips=1, rows=len(rows))
+    return rows
+
+
+def instrument_graph(graph):
+    """
+    Count round trips and returned rows of graph.query(), and of read_query()
+    and aquery() where the graph has them, against the current span.
+    """
+    for name in ("query", "read_query"):
+        method = getattr(graph, name, None)
+        if method is not None:
+            setattr(graph, name, functools.wraps(method)(
+                lambda *args, _method=method, **kwargs: _count_rows(_method(*args, **kwargs))))
+    aquery = getattr(graph, "aquery", None)
+    if aquery is not None:
+        @functools.wraps(aquery)
+        async def counted(*args, **kwargs):
+            return _count_rows(await aquery(*args, **kwargs))
+        graph.aquery = counted
+    return graph
+
+
+def token_counts(response) -> Tuple[int, int]:
+    """Prompt and completion tokens of an LLMResult, 0 when the model does not report them."""
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    prompt, completion = usage.get("prompt_tokens"), usage.get("completion_tokens")
+    if prompt is None:
+        # Streaming responses only carry usage on the message
+        message = getattr(response.generations[0][0], "message", None) if response.generations else None
+        metadata = getattr(message, "usage_metadata", None) or {}
+        prompt, completion = metadata.get("input_tokens"), metadata.get("output_tokens")
+    return prompt or 0, completion or 0
+
+
+class TokenUsageHandler(BaseCallbackHandler):
+    """Adds prompt and completion tokens of every LLM call to the current span."""
+
+    run_inline = True
+
+    def on_llm_end(self, response, **kwargs):
+        if not enabled:
+            return
+        prompt, completion = token_counts(response)
+        add(llm_calls=1, prompt_tokens=prompt, completion_tokens=completion)
+
+
+token_usage = TokenUsageHandler()
+
+
+def callbacks() -> Optional[List[BaseCallbackHandler]]:
+    """Callbacks to pass to a chat model; None when telemetry is off, so it costs nothing."""
+    return [token_usage] if enabled else None
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("", "/metrics"):
+            self.send_error(404)
+            return
+        body = metrics.prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_prometheus(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Serve /metrics from a daemon thread."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def enable(log: Optional[str] = None, port: Optional[int] = None):
+    """
+    Turn telemetry on. log is a path for JSON lines, or "-" for stderr; port
+    starts a Prometheus scrape endpoint.
+    """
+    global enabled, _log
+    enabled = True
+    if log:
+        _log = sys.stderr if log == "-" else open(log, "a", encoding="utf-8")
+    if port:
+        serve_prometheus(port)
+
+
+def enable_from_env():
+    """enable() when TELEMETRY is set, with TELEMETRY_LOG and TELEMETRY_PORT."""
+    if os.getenv("TELEMETRY"):
+        enable(os.getenv("TELEMETRY_LOG") or "-", int(os.getenv("TELEMETRY_PORT") or 0) or None)
@@ -1,44 +1,12 @@
-import os
-from langchain_community.graphs import Neo4jGraph
 from langchain_experimental.graph_transformers import LLMGraphTransformer
-from langchain_openai import AzureChatOpenAI
 from langchain_core.documents import Document
-from langchain_core.runnables import (
-    RunnableBranch,
-    RunnableLambda,
-    RunnableParallel,
-    RunnablePassthrough,
-)
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.prompts.prompt import PromptTemplate
-from langchain_core.pydantic_v1 import BaseModel, Field
-from typing import Tuple, List, Optional
-from langchain_core.messages import AIMessage, HumanMessage
-from langchain_core.output_parsers import StrOutputParser
-import os
-from langchain_community.graphs import Neo4jGraph
-from langchain.document_loaders import WikipediaLoader
-from langchain.text_splitter import TokenTextSplitter
-from langchain_openai import ChatOpenAI
-from langchain_experimental.graph_transformers import LLMGraphTransformer
-from neo4j import GraphDatabase
 from langchain_community.vectorstores import Neo4jVector
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.vectorstores.neo4j_vector import remove_lucene_chars
-from langchain_core.runnables import ConfigurableField, RunnableParallel, RunnablePassthrough
-
-
-os.environ["NEO4J_URI"] = "neo4j+s://2f8c7fba.databases.neo4j.io"
-os.environ["NEO4J_USERNAME"] = "neo4j"
-os.environ["NEO4J_PASSWORD"] = "qWU5Fx0_d5gD0jy2RG1fduJep0qFOVwG3dhJ2inlwHw"
-
-graph = Neo4jGraph()
+from graphdemo.common import get_embeddings, get_graph, get_llm
+from graphdemo.graph_writer import BulkGraphWriter
 
-azure_endpoint = "https://mtcmilan-oai-swecen.openai.azure.com/"
-api_key = "38c794f8881246d99da7d9d501890524"
-api_version = "2023-12-01-preview"
-azure_openai_deployment = "gpt-4o"
-llm = AzureChatOpenAI(azure_deployment=azure_openai_deployment, temperature=0, streaming=False, azure_endpoint=azure_endpoint, api_key=api_key, api_version=api_version)
+# Neo4j and Azure OpenAI settings come from the environment (see graphdemo.common)
+graph = get_graph()
+llm = get_llm()
 llm_transformer = LLMGraphTransformer(llm=llm)
 
 text = """
@@ -55,14 +23,11 @@ print(f"Relationships:{graph_documents[0].relationships}")
 
 
 # Store to neo4j
-graph.add_graph_documents(
-  graph_documents, 
-  baseEntityLabel=True, 
-  include_source=True
-)
+print(BulkGraphWriter(graph).write(graph_documents))
 
 vector_index = Neo4jVector.from_existing_graph(
-    OpenAIEmbeddings(),
+    get_embeddings(),
+    graph=graph,
     search_type="hybrid",
     node_label="Document",
     text_node_properties=["text"],
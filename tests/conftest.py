@@ -0,0 +1,30 @@
+from typing import Callable, Dict, List, Optional
+
+import pytest
+
+
+class FakeGraph:
+    """
+    Stand-in for Neo4jGraph: records every query and answers it with the
+    first handler whose marker occurs in the query text.
+    """
+
+    def __init__(self, handlers: Optional[Dict[str, Callable[[dict], List[dict]]]] = None):
+        self.handlers = handlers or {}
+        self.queries = []
+
+    def query(self, query: str, params: dict = {}) -> List[dict]:
+        self.queries.append((query, params))
+        for marker, handler in self.handlers.items():
+            if marker in query:
+                return handler(params)
+        return []
+
+    def ran(self, marker: str) -> List[dict]:
+        """Parameters of every query containing marker."""
+        return [params for query, params in self.queries if marker in query]
+
+
+@pytest.fixture
+def fake_graph():
+    return FakeGraph
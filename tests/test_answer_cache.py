@@ -0,0 +1,35 @@
+import asyncio
+
+from langchain_core.runnables import RunnableLambda
+
+from graphdemo.answer_cache import AnswerCache
+
+
+class AsyncOnlyVersion:
+    """A graph version the async path may only read through aget()."""
+
+    value = 1
+
+    def get(self):
+        raise AssertionError("blocking version poll on the event loop")
+
+    async def aget(self):
+        return self.value
+
+
+def test_async_lookups_poll_the_version_without_blocking():
+    version = AsyncOnlyVersion()
+    cache = AnswerCache(graph_version=version)
+    answers = []
+    chain = cache.wrap(RunnableLambda(lambda inputs: inputs["question"]),
+                       RunnableLambda(lambda question: answers.append(question) or f"answer {len(answers)}"))
+
+    async def ask(question):
+        return await chain.ainvoke({"question": question})
+
+    assert asyncio.run(ask("Who?")) == "answer 1"
+    assert asyncio.run(ask("who")) == "answer 1"
+    # A new graph version drops the cached answers
+    version.value = 2
+    assert asyncio.run(ask("Who?")) == "answer 2"
+    assert cache.hits == {"exact": 1, "semantic": 0}
@@ -0,0 +1,39 @@
+import asyncio
+from argparse import Namespace
+
+from graphdemo import benchmark, rag, server
+
+
+class LoopBound:
+    """Answers like the chain or the service, and fails like an async Neo4j driver used from a second loop."""
+
+    def __init__(self):
+        self.loop = None
+        self.answered = 0
+
+    async def _answer(self):
+        loop = asyncio.get_running_loop()
+        if self.loop is None:
+            self.loop = loop
+        if loop is not self.loop:
+            raise RuntimeError("Future attached to a different loop")
+        self.answered += 1
+        return "answer"
+
+    async def ainvoke(self, inputs):
+        return await self._answer()
+
+    async def answer(self, question):
+        return await self._answer()
+
+
+def test_server_benchmark_runs_every_concurrency_in_one_loop(monkeypatch):
+    driver = LoopBound()
+    vector_index = Namespace(embedding=None)
+    monkeypatch.setattr(benchmark, "_retrieval_setup", lambda args: (None, None, vector_index, None))
+    monkeypatch.setattr(rag, "build_chain", lambda *args, **kwargs: (driver, None))
+    monkeypatch.setattr(server, "build_service", lambda *args, **kwargs: driver)
+    results = benchmark.bench_server(Namespace(queries=5, concurrency=4))
+    assert sorted(results) == ["batched_qps_c1", "batched_qps_c4", "unbatched_qps_c1", "unbatched_qps_c4"]
+    assert all(qps > 0 for qps in results.values())
+    assert driver.answered == 20
@@ -0,0 +1,75 @@
+import asyncio
+from types import SimpleNamespace
+
+import numpy as np
+from langchain_core.documents import Document
+
+from graphdemo import context
+from graphdemo.context import ContextAssembler, mmr
+from graphdemo.local_vector_index import LocalVectorIndex
+from graphdemo.retrieval import EMBEDDING_KEY, GraphRetriever
+
+
+class RecordingEmbeddings:
+    """Embeds every text as the same vector and records what it was asked for."""
+
+    def __init__(self):
+        self.documents = []
+        self.queries = []
+
+    def embed_documents(self, texts):
+        self.documents.append(list(texts))
+        return [[1.0, 0.0] for _ in texts]
+
+    async def aembed_documents(self, texts):
+        return self.embed_documents(texts)
+
+    def embed_query(self, text):
+        self.queries.append(text)
+        return [1.0, 0.0]
+
+    async def aembed_query(self, text):
+        return self.embed_query(text)
+
+
+class NoEntities:
+    def invoke(self, inputs):
+        return SimpleNamespace(names=[])
+
+    async def ainvoke(self, inputs):
+        return self.invoke(inputs)
+
+
+def test_mmr_prefers_relevant_then_diverse():
+    candidates = [[1.0, 0.0], [0.99, 0.14], [0.0, 1.0]]
+    assert mmr([1.0, 0.0], candidates, 3, lambda_mult=1.0) == [0, 1, 2]
+    # The near copy of the first pick drops behind the unrelated candidate
+    assert mmr([1.0, 0.0], candidates, 3, lambda_mult=0.3) == [0, 2, 1]
+    assert mmr([1.0, 0.0], [], 3) == []
+
+
+def test_assemble_only_embeds_what_has_no_vector(monkeypatch):
+    monkeypatch.setattr(context, "count_tokens", lambda text: len(text.split()))
+    embeddings = RecordingEmbeddings()
+    assembler = ContextAssembler(embeddings)
+    documents = [Document(page_content="stored chunk", metadata={EMBEDDING_KEY: [0.0, 1.0]}),
+                 Document(page_content="bare chunk")]
+    result = assembler.assemble("Who?", "A - KNOWS -> B\nA - KNOWS -> B", documents, [1.0, 0.0])
+    assert embeddings.documents == [["A - KNOWS -> B", "bare chunk"]]
+    assert "stored chunk" in result and "A - KNOWS -> B" in result
+    # Without a question vector the question is embedded with them
+    asyncio.run(assembler.aassemble("Who?", "", documents))
+    assert embeddings.documents[-1] == ["Who?", "bare chunk"]
+
+
+def test_retriever_hands_its_vectors_to_the_assembler(monkeypatch, tmp_path):
+    monkeypatch.setattr(context, "count_tokens", lambda text: len(text.split()))
+    embeddings = RecordingEmbeddings()
+    index = LocalVectorIndex(embeddings, path=str(tmp_path))
+    index.append(["a", "b"], ["first chunk", "second chunk"], [{}, {}], np.eye(2))
+    retriever = GraphRetriever(None, NoEntities(), index, assembler=ContextAssembler(embeddings))
+    for result in (retriever.retrieve("Which chunk?"), asyncio.run(retriever.aretrieve("Which chunk?"))):
+        assert "first chunk" in result and "second chunk" in result
+    # One query embedding per question, and nothing else embedded
+    assert embeddings.queries == ["Which chunk?", "Which chunk?"]
+    assert embeddings.documents == []
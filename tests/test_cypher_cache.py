@@ -0,0 +1,89 @@
+from typing import Any
+
+from pydantic import BaseModel, ConfigDict
+
+from graphdemo.cypher_cache import CachedCypherQAChain, CypherCache, parameterize
+
+
+def test_string_literal_becomes_a_parameter():
+    cypher, template, params = parameterize(
+        "Who are the officers of ZZZ-MILI COMPANY LTD.?",
+        "MATCH (o:Officer)-[:OFFICER_OF]->(e:Entity {name: 'ZZZ-MILI COMPANY LTD.'}) RETURN o.name")
+    assert cypher == "MATCH (o:Officer)-[:OFFICER_OF]->(e:Entity {name: $p0}) RETURN o.name"
+    assert template == r"Who\ are\ the\ officers\ of\ (?P<p0>.+?)\?"
+    assert params == {"p0": "ZZZ-MILI COMPANY LTD."}
+
+
+def test_literals_inside_longer_words_stay_literals():
+    cypher, _, params = parameterize(
+        "Which companies are registered in Paris?",
+        "MATCH (c:Entity {type: 'Par', kind: 'compan'}) WHERE c.city = 'Paris' RETURN c")
+    assert cypher == "MATCH (c:Entity {type: 'Par', kind: 'compan'}) WHERE c.city = $p0 RETURN c"
+    assert params == {"p0": "Paris"}
+
+
+def test_repeated_value_is_one_parameter():
+    cypher, template, params = parameterize(
+        "How is Acme connected to itself?",
+        "MATCH p = (a {name: 'Acme'})-[*1..3]-(b {name: 'Acme'}) RETURN p")
+    assert cypher == "MATCH p = (a {name: $p0})-[*1..3]-(b {name: $p0}) RETURN p"
+    assert params == {"p0": "Acme"} and template.count("(?P<p0>") == 1
+
+
+def test_numbers_are_parameterized_only_as_literals():
+    cypher, template, params = parameterize(
+        "Top 5 intermediaries within 3 hops of node2",
+        "MATCH (n:`Node 5` {id: 'node2'})-[*1..3]-(i:Intermediary) RETURN i.name, n.x5 LIMIT 5")
+    # The label, the property name and the variable-length range keep their digits
+    assert cypher == "MATCH (n:`Node 5` {id: $p0})-[*1..3]-(i:Intermediary) RETURN i.name, n.x5 LIMIT $p1"
+    assert params == {"p0": "node2", "p1": 5}
+    assert r"(?P<p1>\d+(?:\.\d+)?)" in template
+
+
+def test_number_not_in_the_question_stays_literal():
+    cypher, _, params = parameterize("Which intermediary is connected to most entities?",
+                                     "MATCH (i:Intermediary)--(e) RETURN i.name, count(e) AS n ORDER BY n DESC LIMIT 1")
+    assert params == {} and cypher.endswith("LIMIT 1")
+
+
+def test_template_hits_get_typed_parameters(tmp_path):
+    cache = CypherCache(str(tmp_path / "cypher.json"))
+    cache.put("Top 5 officers of Acme", "MATCH (o)-[:OFFICER_OF]->({name: 'Acme'}) RETURN o LIMIT 5")
+    assert cache.get("Top 12 officers of Globex") == (
+        "MATCH (o)-[:OFFICER_OF]->({name: $p0}) RETURN o LIMIT $p1", {"p0": "Globex", "p1": 12})
+    # A number slot does not swallow text
+    assert cache.get("Top few officers of Globex") is None
+    reloaded = CypherCache(str(tmp_path / "cypher.json"))
+    assert reloaded.get("Top 7 officers of Initech")[1] == {"p0": "Initech", "p1": 7}
+
+
+class FakeCypherChain(BaseModel):
+    """The GraphCypherQAChain fields CachedCypherQAChain reads, without an LLM or a database."""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    graph: Any
+    input_key: str = "query"
+    output_key: str = "result"
+    top_k: int = 10
+    return_intermediate_steps: bool = False
+    return_direct: bool = True
+
+    def invoke(self, inputs):
+        cypher = "MATCH (o)-[:OFFICER_OF]->({name: 'Acme'}) RETURN o.name AS name"
+        context = self.graph.query(cypher, {})
+        steps = [{"query": cypher}, {"context": context}] if self.return_intermediate_steps else []
+        return {"query": inputs["query"], "result": context, "intermediate_steps": steps}
+
+
+def test_cached_chain_leaves_the_callers_chain_alone(tmp_path, fake_graph):
+    graph = fake_graph({"OFFICER_OF": lambda params: [{"name": "Wile E."}]})
+    chain = FakeCypherChain(graph=graph)
+    cached = CachedCypherQAChain(chain, CypherCache(str(tmp_path / "cypher.json")))
+    assert chain.return_intermediate_steps is False
+    first = cached.invoke({"query": "Who are the officers of Acme?"})
+    second = cached.invoke({"query": "Who are the officers of Globex?"})
+    assert first == {"query": "Who are the officers of Acme?", "result": [{"name": "Wile E."}]}
+    assert second["result"] == [{"name": "Wile E."}] and "intermediate_steps" not in second
+    # The second question ran the cached Cypher with its own parameter
+    assert graph.queries[-1][1] == {"p0": "Globex"}
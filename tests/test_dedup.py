@@ -0,0 +1,44 @@
+import pytest
+from langchain_core.documents import Document
+
+from graphdemo import dedup
+from graphdemo.dedup import NearDuplicateIndex, deduplicate, link_duplicates
+
+TEXT = ("Geralt of Rivia is a witcher, a monster hunter trained from childhood and mutated to gain "
+        "superhuman abilities, who travels the Continent taking contracts to kill dangerous creatures")
+
+
+def chunk(text: str, id: str) -> Document:
+    return Document(page_content=text, metadata={"id": id})
+
+
+def test_near_duplicates_point_at_their_representative(monkeypatch):
+    monkeypatch.setattr(dedup, "count_tokens", lambda text: len(text.split()))
+    index = NearDuplicateIndex(threshold=0.7)
+    assert index.add(chunk(TEXT, "a")) is None
+    # One changed word out of thirty
+    assert index.add(chunk(TEXT.replace("dangerous", "deadly"), "b")) == "a"
+    assert index.add(chunk("Yennefer of Vengerberg is a sorceress and a member of the Lodge", "c")) is None
+    # Same chunk id again
+    assert index.add(chunk("whatever", "c")) == "c"
+    assert (index.stats.chunks, index.stats.duplicates) == (4, 2)
+
+
+def test_signatures_are_deterministic():
+    assert (NearDuplicateIndex().signature(TEXT) == NearDuplicateIndex().signature(TEXT)).all()
+    with pytest.raises(ValueError):
+        NearDuplicateIndex(num_perm=100, bands=16)
+
+
+def test_duplicates_are_linked_after_their_representatives(fake_graph, monkeypatch):
+    monkeypatch.setattr(dedup, "count_tokens", lambda text: 1)
+    documents = [chunk(TEXT, "a"), chunk(TEXT.replace("Rivia", "Rivia,"), "b"), chunk(TEXT, "a")]
+    representatives, duplicates = deduplicate(documents)
+    assert [d.metadata["id"] for d in representatives] == ["a"]
+    assert [(d.metadata["id"], r) for d, r in duplicates] == [("b", "a"), ("a", "a")]
+    graph = fake_graph()
+    # The exact repeat already is the representative's node
+    assert link_duplicates(graph, duplicates, label="Test_Document") == 1
+    (params,) = graph.ran("duplicate_of")
+    assert [row["id"] for row in params["rows"]] == ["b"]
+    assert "`Test_Document`" in graph.queries[0][0]
@@ -0,0 +1,86 @@
+import asyncio
+
+from graphdemo.entity_lookup import EntityLookup, fuzzy_query, prefix_query
+from graphdemo.retrieval import STRUCTURED_ID_QUERY, NEIGHBORHOOD_ID_QUERY, GraphRetriever
+from graphdemo.server import BatchedGraphRetriever
+
+ENTITIES = {"elizabeth i": "Elizabeth I", "house of tudor": "House Of Tudor"}
+
+
+def lookup_rows(params):
+    return [{"normalized": l["normalized"], "tier": "exact" if l["normalized"] in ENTITIES else None,
+             "ids": [ENTITIES[l["normalized"]]] if l["normalized"] in ENTITIES else []} for l in params["lookups"]]
+
+
+class Version:
+    value = 1
+
+    def get(self):
+        return self.value
+
+    async def aget(self):
+        return self.value
+
+
+def test_queries_by_tier():
+    assert prefix_query("Tudor") == "tudor*"
+    assert prefix_query("Elizabeth I") == '"elizabeth i" OR (elizabeth* AND i)'
+    assert fuzzy_query("Walsingham of Kent") == "walsingham~2 AND of AND kent~1"
+    assert prefix_query("?!") is None
+
+
+def test_resolve_caches_until_the_graph_version_changes(fake_graph):
+    graph, version = fake_graph({"$lookups": lookup_rows}), Version()
+    lookup = EntityLookup(graph, version)
+    assert lookup.resolve(["Elizabeth I", "elizabeth  i", "Nobody"]) == [["Elizabeth I"]]
+    assert lookup.resolve(["Elizabeth I", "Nobody"]) == [["Elizabeth I"]]
+    # Misses are cached too: one round trip so far
+    assert len(graph.ran("$lookups")) == 1
+    assert lookup.counts == {"cache": 2, "exact": 1, "prefix": 0, "fuzzy": 0, "missing": 1}
+    version.value = 2
+    lookup.resolve(["Elizabeth I"])
+    assert len(graph.ran("$lookups")) == 2
+
+
+def test_aresolve_many_looks_up_shared_names_once(fake_graph):
+    graph = fake_graph({"$lookups": lookup_rows})
+    lookup = EntityLookup(graph, Version())
+    result = asyncio.run(lookup.aresolve_many([["Elizabeth I"], ["House of Tudor", "Elizabeth I"], ["Nobody"]]))
+    assert result == [[["Elizabeth I"]], [["House Of Tudor"], ["Elizabeth I"]], []]
+    [params] = graph.ran("$lookups")
+    assert sorted(l["normalized"] for l in params["lookups"]) == ["elizabeth i", "house of tudor", "nobody"]
+
+
+def test_id_queries_do_not_use_fulltext(fake_graph):
+    retriever = GraphRetriever(fake_graph(), None, None, lookup=EntityLookup(fake_graph()))
+    assert retriever.query == STRUCTURED_ID_QUERY
+    for query in (STRUCTURED_ID_QUERY, NEIGHBORHOOD_ID_QUERY):
+        assert "fulltext" not in query and "node.id IN query" in query
+
+
+class Names:
+    def __init__(self, names):
+        self.names = names
+
+
+class QuestionEntities:
+    async def ainvoke(self, inputs, config=None):
+        return Names([inputs["question"].rstrip("?").split(" about ")[-1]])
+
+
+def test_batched_retriever_one_lookup_and_one_read_per_batch(fake_graph):
+    graph = fake_graph({
+        "$lookups": lookup_rows,
+        "$requests": lambda p: [{"request": r["id"], "output": f"{i} neighbor"} for r in p["requests"] for i in r["queries"][0]],
+    })
+    retriever = BatchedGraphRetriever(graph, QuestionEntities(), None, lookup=EntityLookup(graph, Version()),
+                                      max_wait=0.01)
+
+    async def ask():
+        return await asyncio.gather(*(retriever.astructured(f"Tell me about {name}?")
+                                      for name in ["Elizabeth I", "House of Tudor", "Elizabeth I", "Nobody"]))
+
+    assert asyncio.run(ask()) == ["Elizabeth I neighbor", "House Of Tudor neighbor", "Elizabeth I neighbor", ""]
+    assert len(graph.ran("$lookups")) == 1
+    [params] = graph.ran("$requests")
+    assert [r["id"] for r in params["requests"]] == [0, 1, 2]
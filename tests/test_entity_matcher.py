@@ -0,0 +1,56 @@
+from types import SimpleNamespace
+
+from langchain_community.graphs.graph_document import GraphDocument, Node
+from langchain_core.documents import Document
+
+from graphdemo.entity_matcher import EntityMatcher, normalize
+
+
+class Fallback:
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, inputs):
+        self.calls += 1
+        return SimpleNamespace(names=["from the llm"])
+
+
+def matcher() -> EntityMatcher:
+    m = EntityMatcher()
+    m.add("Marie Curie", ["Maria Skłodowska-Curie"])
+    m.add("Pierre Curie")
+    m.add("Curie")
+    m.add("Al")  # shorter than min_length, never matched
+    return m
+
+
+def test_normalize():
+    assert normalize("Skłodowska-Curie!") == "sklodowska curie"
+    assert normalize("  Éva  Nagy ") == "eva nagy"
+
+
+def test_longest_leftmost_whole_word_matches():
+    m = matcher()
+    assert m.match("Was Marie Curie married to Pierre Curie?") == ["Marie Curie", "Pierre Curie"]
+    assert m.match("What did maria sklodowska curie discover?") == ["Marie Curie"]
+    assert m.match("Tell me about Curie") == ["Curie"]
+    # Inside a longer word, or too short
+    assert m.match("Curiel and Al") == []
+    assert len(m) == 4
+
+
+def test_patterns_added_after_a_match_are_found(fake_graph):
+    m = EntityMatcher().load(fake_graph({"MATCH (e:`__Entity__`)": lambda p: [
+        {"id": "Warsaw", "aliases": ["Warszawa"]}, {"id": None, "aliases": []}]}))
+    assert m.match("Born in Warszawa") == ["Warsaw"]
+    m.add_graph_documents([GraphDocument(nodes=[Node(id="Paris", type="City")], relationships=[],
+                                         source=Document(page_content=""))])
+    assert m.match("From Warsaw to Paris") == ["Warsaw", "Paris"]
+
+
+def test_entity_chain_only_falls_back_without_a_match():
+    m, fallback = matcher(), Fallback()
+    chain = m.as_entity_chain(fallback)
+    assert chain.invoke({"question": "Who was Pierre Curie?"}).names == ["Pierre Curie"]
+    assert chain.invoke({"question": "Who discovered radium?"}).names == ["from the llm"]
+    assert (m.matched, m.fallbacks, fallback.calls) == (1, 1, 1)
@@ -0,0 +1,96 @@
+import asyncio
+from types import SimpleNamespace
+
+from graphdemo import extraction
+from graphdemo.extraction import RateLimiter, is_retryable, retry_delay
+
+
+class Clock:
+    """Fake monotonic clock; sleeping advances it instead of waiting."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+        # Let the other waiters run into the held lock
+        await asyncio.sleep(0)
+
+
+def fake_clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(extraction, "time", SimpleNamespace(monotonic=clock.monotonic))
+    monkeypatch.setattr(extraction, "asyncio", SimpleNamespace(
+        Lock=asyncio.Lock, sleep=clock.sleep, get_running_loop=asyncio.get_running_loop))
+    return clock
+
+
+def test_requests_wait_for_the_window_to_slide(monkeypatch):
+    clock = fake_clock(monkeypatch)
+
+    async def run():
+        limiter = RateLimiter(requests_per_minute=2)
+        await limiter.acquire()
+        clock.now = 10
+        await limiter.acquire()
+        await limiter.acquire()
+
+    asyncio.run(run())
+    # The third call waits until the first one leaves the window
+    assert clock.sleeps == [50]
+    assert clock.now == 60
+
+
+def test_token_budget(monkeypatch):
+    clock = fake_clock(monkeypatch)
+
+    async def run():
+        limiter = RateLimiter(tokens_per_minute=100)
+        # Larger than the whole budget, but alone in the window
+        await limiter.acquire(500)
+        await limiter.acquire(60)
+        return limiter
+
+    limiter = asyncio.run(run())
+    assert clock.sleeps == [60]
+    assert limiter._tokens == 60
+
+
+def test_unlimited_never_waits(monkeypatch):
+    clock = fake_clock(monkeypatch)
+
+    async def run():
+        limiter = RateLimiter()
+        for _ in range(100):
+            await limiter.acquire(10_000)
+
+    asyncio.run(run())
+    assert clock.sleeps == []
+
+
+def test_limiter_built_outside_a_loop_serves_several_loops(monkeypatch):
+    clock = fake_clock(monkeypatch)
+    limiter = RateLimiter(requests_per_minute=1)
+
+    async def run():
+        await asyncio.gather(limiter.acquire(), limiter.acquire(), limiter.acquire())
+
+    # In each loop the third call waits on the lock the second one holds
+    asyncio.run(run())
+    asyncio.run(run())
+    # Six calls at one per minute
+    assert clock.now == 300
+
+
+def test_retry_policy():
+    throttled = SimpleNamespace(status_code=429, response=SimpleNamespace(headers={"retry-after-ms": "1500"}))
+    assert is_retryable(throttled)
+    assert retry_delay(throttled, 0) == 1.5
+    assert not is_retryable(ValueError("bad request"))
+    assert 2.0 <= retry_delay(ValueError(), 2) <= 4.0
+    assert retry_delay(ValueError(), 20, cap=60) <= 60
@@ -0,0 +1,51 @@
+from types import SimpleNamespace
+
+from langchain_community.graphs.graph_document import GraphDocument, Node, Relationship
+from langchain_core.documents import Document
+
+from graphdemo import extraction_cache
+from graphdemo.extraction_cache import ExtractionCache, dump_graph_document, extraction_schema
+
+SCHEMA = extraction_schema("gpt-4o", allowed_nodes=["Person"])
+
+
+def graph_document(text: str) -> GraphDocument:
+    person, place = Node(id=text, type="Person"), Node(id="Paris", type="City", properties={"country": "FR"})
+    return GraphDocument(nodes=[person, place], relationships=[Relationship(source=person, target=place, type="LIVES_IN")],
+                         source=Document(page_content=text))
+
+
+def test_round_trip_and_schema_scope(tmp_path):
+    cache = ExtractionCache(str(tmp_path / "extraction.sqlite"))
+    document = Document(page_content="Marie")
+    cache.put(document, SCHEMA, graph_document("Marie"))
+    cached = cache.get(document, SCHEMA)
+    assert dump_graph_document(cached) == dump_graph_document(graph_document("Marie"))
+    assert cached.source is document
+    # Another schema is another extraction
+    other = extraction_schema("gpt-4o", allowed_nodes=["Person", "City"])
+    assert cache.get(document, other) is None
+    cache.put(document, other, graph_document("Marie"))
+    assert cache.invalidate(SCHEMA) == 1
+    assert cache.get(document, SCHEMA) is None and cache.get(document, other) is not None
+    assert cache.stats()["hits"] == 2
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, monkeypatch):
+    clock = SimpleNamespace(now=0.0)
+
+    def tick():
+        clock.now += 1
+        return clock.now
+
+    monkeypatch.setattr(extraction_cache, "time", SimpleNamespace(time=tick))
+    size = len(dump_graph_document(graph_document("a")))
+    cache = ExtractionCache(str(tmp_path / "extraction.sqlite"), max_bytes=3 * size)
+    documents = [Document(page_content=text) for text in "abcd"]
+    for document in documents[:3]:
+        cache.put(document, SCHEMA, graph_document(document.page_content))
+    # Reading "a" makes "b" the least recently used entry
+    assert cache.get(documents[0], SCHEMA) is not None
+    cache.put(documents[3], SCHEMA, graph_document("d"))
+    assert [cache.get(d, SCHEMA) is not None for d in documents] == [True, False, True, True]
+    assert cache.stats()["bytes"] <= 3 * size
@@ -0,0 +1,55 @@
+from langchain_community.graphs.graph_document import GraphDocument, Node, Relationship
+from langchain_core.documents import Document
+
+from graphdemo.graph_writer import BulkGraphWriter, _partition, document_id
+
+
+def graph_document(text: str, people, knows=()) -> GraphDocument:
+    nodes = {name: Node(id=name, type="Person", properties={"source": text}) for name in people}
+    return GraphDocument(nodes=list(nodes.values()),
+                         relationships=[Relationship(source=nodes[a], target=nodes[b], type="KNOWS") for a, b in knows],
+                         source=Document(page_content=text, metadata={"id": text}))
+
+
+def test_group_merges_nodes_and_relationships_across_documents(fake_graph):
+    writer = BulkGraphWriter(fake_graph())
+    documents, nodes, mentions, relationships = writer._group([
+        graph_document("d1", ["Ann", "Bob"], [("Ann", "Bob")]),
+        graph_document("d2", ["Ann", "Éva"], [("Ann", "Éva")]),
+        graph_document("d3", ["Ann", "Bob"], [("Ann", "Bob")]),
+    ])
+    assert [d["id"] for d in documents] == ["d1", "d2", "d3"]
+    people = {row["id"]: row for row in nodes["Person"]}
+    assert list(people) == ["Ann", "Bob", "Éva"]
+    # Later properties win, and the exact-lookup key is set on every node
+    assert people["Ann"]["properties"] == {"source": "d3"} and people["Éva"]["normalized_id"] == "eva"
+    assert len(mentions["Person"]) == 6
+    assert [(r["source"], r["target"]) for r in relationships[("Person", "KNOWS", "Person")]] == [
+        ("Ann", "Bob"), ("Ann", "Éva")]
+
+
+def test_write_batches_by_label_and_type(fake_graph):
+    graph = fake_graph()
+    writer = BulkGraphWriter(graph, batch_size=2)
+    stats = writer.write([graph_document(f"d{i}", [f"p{i}", f"q{i}"], [(f"p{i}", f"q{i}")]) for i in range(3)])
+    assert (stats.documents, stats.nodes, stats.mentions, stats.relationships) == (3, 6, 6, 3)
+    # 3 documents, 6 nodes, 6 mentions and 3 relationships in batches of 2
+    assert stats.batches == 2 + 3 + 3 + 2
+    assert len(graph.ran("CREATE CONSTRAINT")) == 2
+    assert document_id(graph_document("d0", [])) == "d0"
+
+
+def test_partitioned_writes_keep_crossing_relationships_sequential(fake_graph):
+    graph = fake_graph()
+    writer = BulkGraphWriter(graph, parallelism=4, include_source=False)
+    names = [f"p{i}" for i in range(40)]
+    pairs = list(zip(names, names[1:]))
+    writer.write([graph_document("d", names, pairs)])
+    written = [(query, params["rows"]) for query, params in graph.queries if "KNOWS" in query]
+    assert sorted((r["source"], r["target"]) for _, rows in written for r in rows) == sorted(pairs)
+    crossing = {(a, b) for a, b in pairs if _partition(a, 4) != _partition(b, 4)}
+    # Every batch but the sequential tail stays inside one partition
+    *parallel, tail = [rows for _, rows in written]
+    assert {(r["source"], r["target"]) for r in tail} == crossing
+    for rows in parallel:
+        assert len({_partition(r[k], 4) for r in rows for k in ("source", "target")}) == 1
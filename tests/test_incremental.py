@@ -0,0 +1,39 @@
+from langchain_core.documents import Document
+
+from graphdemo.incremental import fingerprint_documents, plan_sync, remove_stale
+
+
+def chunks(source, *texts):
+    return fingerprint_documents([Document(page_content=t, metadata={"source": source}) for t in texts])
+
+
+def test_same_text_in_two_sources_is_two_chunks():
+    (a,), (b,) = chunks("a.txt", "Shared intro"), chunks("b.txt", "Shared intro")
+    assert a.metadata["fingerprint"] == b.metadata["fingerprint"]
+    assert a.metadata["id"] != b.metadata["id"]
+    # Without a source the id is the content fingerprint
+    (bare,) = fingerprint_documents([Document(page_content="Shared intro")])
+    assert bare.metadata["id"] == bare.metadata["fingerprint"]
+
+
+def test_plan_sync_compares_chunk_ids(fake_graph):
+    kept, edited = chunks("a.txt", "kept", "edited")
+    copy, = chunks("b.txt", "kept")
+    graph = fake_graph({"RETURN d.id AS id": lambda p: [{"id": kept.metadata["id"]}, {"id": "old"}]})
+    plan = plan_sync(graph, [kept, chunks("a.txt", "edited again")[0], copy])
+    assert plan.unchanged == 1
+    assert [d.page_content for d in plan.new] == ["edited again", "kept"]
+    assert plan.stale == ["old"]
+    assert graph.ran("RETURN d.id AS id")[0] == {"sources": ["a.txt", "b.txt"]}
+
+
+def test_remove_stale_prunes_relationships_without_a_remaining_chunk(fake_graph):
+    affected = []
+    graph = fake_graph({
+        "DETACH DELETE d": lambda p: [{"entities": ["e1", "e2"]}],
+        "DETACH DELETE e": lambda p: [{"removed": 1, "neighbors": ["Ann"]}],
+        "FOREACH (r IN orphaned": lambda p: [{"ends": ["Bob", "Eve", "Bob"]}],
+    })
+    assert remove_stale(graph, ["c1"], on_affected=affected.append) == 1
+    assert graph.ran("FOREACH (r IN orphaned")[0]["entities"] in (["e1", "e2"], ["e2", "e1"])
+    assert affected == [["Ann", "Bob", "Eve"]]
@@ -0,0 +1,62 @@
+import os
+
+import numpy as np
+
+from graphdemo.local_vector_index import META, VECTORS, LocalVectorIndex
+
+
+def rows(start, count, dim=4):
+    ids = [f"c{i}" for i in range(start, start + count)]
+    vectors = np.random.default_rng(start).normal(size=(count, dim))
+    return ids, [f"text {i}" for i in ids], [{"source": "s"} for _ in ids], vectors
+
+
+def capacity(path):
+    return np.load(os.path.join(path, VECTORS), mmap_mode="r").shape[0]
+
+
+def test_append_only_writes_new_rows(tmp_path):
+    path = str(tmp_path)
+    index = LocalVectorIndex(None, path=path, capacity=4)
+    index.append(*rows(0, 3))
+    assert capacity(path) == 4
+    inode = os.stat(os.path.join(path, VECTORS)).st_ino
+    index.append(*rows(3, 1))
+    # Fits in the reserved rows: same file, written in place
+    assert os.stat(os.path.join(path, VECTORS)).st_ino == inode
+    index.append(*rows(4, 1))
+    assert capacity(path) == 8
+    index.append(*rows(5, 10))
+    assert capacity(path) == 16
+    with open(os.path.join(path, META), encoding="utf-8") as f:
+        assert len(f.readlines()) == 15
+
+    reloaded = LocalVectorIndex(None, path=path)
+    assert reloaded.ids == index.ids and reloaded.texts == index.texts
+    assert np.allclose(reloaded.vectors, index.vectors)
+    assert np.allclose(np.linalg.norm(reloaded.vectors, axis=1), 1)
+    # Every vector is its own nearest neighbour
+    assert [hits[0][0] for hits in reloaded.search_vectors(np.asarray(reloaded.vectors), k=1)] == list(range(15))
+
+
+def test_torn_metadata_line_is_ignored(tmp_path):
+    path = str(tmp_path)
+    index = LocalVectorIndex(None, path=path)
+    index.append(*rows(0, 2))
+    with open(os.path.join(path, META), "a", encoding="utf-8") as f:
+        f.write('{"id": "c2", "te')
+    assert LocalVectorIndex(None, path=path).ids == ["c0", "c1"]
+
+
+def test_remove_rewrites_the_kept_rows(tmp_path):
+    path = str(tmp_path)
+    index = LocalVectorIndex(None, path=path)
+    ids, texts, metadatas, vectors = rows(0, 3)
+    index.append(ids, texts, metadatas, vectors)
+    index.remove(["c1"])
+    index.append(*rows(3, 1))
+    reloaded = LocalVectorIndex(None, path=path)
+    assert reloaded.ids == ["c0", "c2", "c3"]
+    assert np.allclose(reloaded.vectors[1], vectors[2] / np.linalg.norm(vectors[2]))
+    index.remove(reloaded.ids)
+    assert len(LocalVectorIndex(None, path=path)) == 0
@@ -0,0 +1,94 @@
+import asyncio
+from types import SimpleNamespace
+
+from langchain_community.graphs.graph_document import GraphDocument
+from langchain_core.documents import Document
+
+from graphdemo import dedup, extraction
+from graphdemo.dedup import NearDuplicateIndex
+from graphdemo.pipeline import run_pipeline
+
+
+class Loader:
+    def __init__(self, texts):
+        self.texts = texts
+
+    def lazy_load(self):
+        return (Document(page_content=text) for text in self.texts)
+
+
+class Splitter:
+    def split_documents(self, documents):
+        return [Document(page_content=part) for d in documents for part in d.page_content.split("|")]
+
+
+class Transformer:
+    async def aprocess_response(self, document):
+        return GraphDocument(nodes=[], relationships=[], source=document)
+
+
+class Embeddings:
+    def __init__(self):
+        self.batches = []
+
+    async def aembed_documents(self, texts):
+        self.batches.append(texts)
+        return [[float(len(t))] for t in texts]
+
+
+class Writer:
+    document_label = "Test_Document"
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.written = []
+
+    def write(self, graph_documents):
+        self.written += graph_documents
+        return SimpleNamespace(rows=len(graph_documents))
+
+
+def test_embeddings_are_written_to_the_writers_document_label(fake_graph, monkeypatch):
+    monkeypatch.setattr(extraction, "count_tokens", lambda text: 1)
+    graph, embeddings = fake_graph(), Embeddings()
+    writer = Writer(graph)
+    stats = asyncio.run(run_pipeline(Loader(["a|bb", "ccc"]), Transformer(), writer, embeddings,
+                                     splitter_factory=Splitter, embed_workers=2))
+    assert (stats.chunks, stats.extracted, stats.rows, stats.embedded) == (3, 3, 3, 3)
+    assert sorted(t for batch in embeddings.batches for t in batch) == ["\ntext:a", "\ntext:bb", "\ntext:ccc"]
+    writes = [q for q, _ in graph.queries if "setNodeVectorProperty" in q]
+    assert writes and all("`Test_Document`" in q for q in writes)
+    # Every chunk got the vector of its own text
+    rows = {row["id"]: row["vector"] for params in graph.ran("setNodeVectorProperty") for row in params["rows"]}
+    assert all(rows[g.source.metadata["id"]] == [float(len(g.source.page_content) + 6)] for g in writer.written)
+
+
+def test_without_embeddings_the_writer_reads_the_extracted_chunks(fake_graph, monkeypatch):
+    monkeypatch.setattr(extraction, "count_tokens", lambda text: 1)
+    writer = Writer(fake_graph())
+    stats = asyncio.run(run_pipeline(Loader(["a|b"]), Transformer(), writer, splitter_factory=Splitter))
+    assert (stats.rows, stats.embedded) == (2, 0)
+    assert not writer.graph.queries
+
+
+def test_duplicates_are_linked_once_their_representative_is_written(fake_graph, monkeypatch):
+    monkeypatch.setattr(extraction, "count_tokens", lambda text: 1)
+    monkeypatch.setattr(dedup, "count_tokens", lambda text: 1)
+    text = "the witcher travels the continent taking contracts to kill dangerous creatures for coin"
+    linked = []
+
+    def link(params):
+        # Every representative is already written when its duplicates are linked
+        written = {g.source.metadata["id"] for g in writer.written}
+        assert all(row["representative"] in written for row in params["rows"])
+        linked.extend(row["text"] for row in params["rows"])
+        return []
+
+    writer = Writer(fake_graph({"duplicate_of": link}))
+    loader = Loader([f"{text}|other {i} words here|{text}!|{text}?" for i in range(3)])
+    stats = asyncio.run(run_pipeline(loader, Transformer(), writer, splitter_factory=Splitter, write_batch=1,
+                                     dedup=NearDuplicateIndex(threshold=0.7)))
+    # One representative plus the three other chunks are extracted; the six punctuation
+    # variants get nodes of their own, the exact repeats share the representative's
+    assert stats.extracted == 4
+    assert stats.duplicates == len(linked) == 6
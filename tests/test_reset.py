@@ -0,0 +1,27 @@
+from graphdemo.reset import KEEP, clear_graph
+
+
+def deleting(*rounds):
+    remaining = list(rounds)
+    return lambda params: [{"deleted": remaining.pop(0) if remaining else 0}]
+
+
+def test_full_clear_keeps_graph_version(fake_graph):
+    graph = fake_graph({"DETACH DELETE": deleting(3, 2), "RETURN count(n) AS total": lambda p: [{"total": 5}]})
+    stats = clear_graph(graph, batch_size=2)
+    assert (stats.nodes, stats.rounds) == (5, 2)
+    deletes = [q for q, _ in graph.queries if "DETACH DELETE" in q]
+    assert deletes and all(KEEP in q for q in deletes)
+    # The version is bumped from where it was, not recreated at 1
+    assert graph.queries[-1][0].startswith("MERGE (m:__Meta__")
+
+
+def test_source_clear_runs_in_transactions(fake_graph):
+    graph = fake_graph({"DETACH DELETE": deleting(4, 0, 10, 1), "RETURN count(n) AS total": lambda p: [{"total": 0}]})
+    stats = clear_graph(graph, source="https://en.wikipedia.org/wiki/Elizabeth_I", batch_size=100)
+    assert (stats.nodes, stats.rounds) == (15, 3)
+    deletes = [(q, p) for q, p in graph.queries if "DETACH DELETE" in q]
+    assert all("IN TRANSACTIONS OF $batch_size ROWS" in q and p["batch_size"] == 100 for q, p in deletes)
+    assert all(p["source"] == "https://en.wikipedia.org/wiki/Elizabeth_I" for _, p in deletes)
+    # Orphaned entities first, while their MENTIONS edges still exist
+    assert "MENTIONS" in deletes[0][0] and "MENTIONS" not in deletes[-1][0]
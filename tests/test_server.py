@@ -0,0 +1,68 @@
+import asyncio
+
+from graphdemo.server import BatchedEmbeddings, MicroBatcher
+
+
+class Recorder:
+    def __init__(self, fail: bool = False):
+        self.calls = []
+        self.fail = fail
+
+    async def __call__(self, items):
+        self.calls.append(list(items))
+        if self.fail:
+            raise RuntimeError("backend down")
+        return [item * 2 for item in items]
+
+
+def test_concurrent_items_share_one_call():
+    fn = Recorder()
+
+    async def run():
+        batcher = MicroBatcher(fn, max_batch=16, max_wait=0.01)
+        return await asyncio.gather(*(batcher.submit(i) for i in range(5))), batcher
+
+    results, batcher = asyncio.run(run())
+    assert results == [0, 2, 4, 6, 8]
+    assert fn.calls == [[0, 1, 2, 3, 4]]
+    assert (batcher.batches, batcher.items) == (1, 5)
+
+
+def test_full_batches_flush_without_waiting():
+    fn = Recorder()
+
+    async def run():
+        # max_wait is far longer than the test: only the size limit can flush the first batches
+        batcher = MicroBatcher(fn, max_batch=2, max_wait=0.05)
+        return await asyncio.wait_for(asyncio.gather(*(batcher.submit(i) for i in range(5))), 1)
+
+    assert asyncio.run(run()) == [0, 2, 4, 6, 8]
+    assert fn.calls == [[0, 1], [2, 3], [4]]
+
+
+def test_a_failed_call_fails_every_item_of_its_batch():
+    async def run():
+        batcher = MicroBatcher(Recorder(fail=True), max_batch=4, max_wait=0.001)
+        return await asyncio.gather(*(batcher.submit(i) for i in range(3)), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+def test_query_embeddings_are_batched():
+    class Embeddings:
+        def __init__(self):
+            self.calls = []
+
+        async def aembed_documents(self, texts):
+            self.calls.append(texts)
+            return [[float(len(t))] for t in texts]
+
+    embeddings = Embeddings()
+
+    async def run():
+        batched = BatchedEmbeddings(embeddings, max_wait=0.01)
+        return await asyncio.gather(batched.aembed_query("a"), batched.aembed_query("bb"))
+
+    assert asyncio.run(run()) == [[1.0], [2.0]]
+    assert embeddings.calls == [["a", "bb"]]
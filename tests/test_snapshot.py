@@ -0,0 +1,111 @@
+import csv
+
+import numpy as np
+import pytest
+
+from graphdemo.snapshot import Snapshot, StringColumn, export_snapshot, load_snapshot, restore_schema, write_admin_csv
+
+NODES = [
+    {"element": "a", "labels": ["Document"], "properties": {"id": "d1", "text": "Elizabeth I", "embedding": [0.1, 0.2]}},
+    {"element": "b", "labels": ["__Entity__", "Person"], "properties": {"id": "Elizabeth I"}},
+    {"element": "c", "labels": ["__Entity__", "Year"], "properties": {"id": 1533}},
+    {"element": "d", "labels": ["__Entity__", "Person"], "properties": {"name": "no id"}},
+    {"element": "e", "labels": ["__Entity__", "Person"], "properties": {"name": "no id either"}},
+]
+RELATIONSHIPS = [
+    {"source": "a", "target": "b", "type": "MENTIONS", "properties": {}},
+    {"source": "b", "target": "c", "type": "BORN_IN", "properties": {}},
+    {"source": "d", "target": "b", "type": "KNOWS", "properties": {}},
+]
+ENTITY_CONSTRAINT = {"name": "constraint_5a0f1b", "type": "UNIQUENESS", "labelsOrTypes": ["__Entity__"],
+                     "properties": ["id"], "createStatement": "CREATE CONSTRAINT `constraint_5a0f1b` ..."}
+
+
+def exported_graph(fake_graph):
+    return fake_graph({
+        "RETURN elementId(n)": lambda p: [dict(row, properties=dict(row["properties"])) for row in NODES],
+        "RETURN elementId(s)": lambda p: RELATIONSHIPS,
+        "SHOW CONSTRAINTS": lambda p: [ENTITY_CONSTRAINT],
+    })
+
+
+def test_export_skips_nodes_without_id(fake_graph, tmp_path):
+    path = str(tmp_path / "graph.npz")
+    stats = export_snapshot(exported_graph(fake_graph), path)
+    assert (stats.nodes, stats.relationships, stats.embeddings, stats.skipped) == (3, 2, 1, 2)
+    snapshot = Snapshot.load(path)
+    assert sorted(snapshot.labels(1)) == ["Person", "__Entity__"]
+    assert [(int(s), int(t)) for s, t, _ in snapshot.edges()] == [(0, 1), (1, 2)]
+
+
+def test_load_matches_ids_with_their_type(fake_graph, tmp_path):
+    path = str(tmp_path / "graph.npz")
+    export_snapshot(exported_graph(fake_graph), path)
+    graph = fake_graph({"AS used": lambda p: [{"used": False}]})
+    load_snapshot(graph, path)
+    born = [row for params in graph.ran("BORN_IN") for row in params["rows"]]
+    assert born == [{"source": "Elizabeth I", "target": 1533, "properties": {}}]
+    [vectors] = graph.ran("setNodeVectorProperty")
+    assert vectors["rows"][0]["id"] == "d1"
+
+
+def test_string_columns_are_packed_utf8(fake_graph, tmp_path):
+    path = str(tmp_path / "graph.npz")
+    export_snapshot(exported_graph(fake_graph), path)
+    with np.load(path, allow_pickle=False) as data:
+        assert not any(data[name].dtype.kind == "U" for name in data.files if name != "meta")
+    column = StringColumn.from_strings(["Élisabeth", "", "1533"])
+    assert list(column) == ["Élisabeth", "", "1533"] and len(column) == 3
+    assert "É" in column and ";" not in column
+
+
+def test_load_reads_fixed_width_string_arrays(fake_graph, tmp_path):
+    path = str(tmp_path / "graph.npz")
+    export_snapshot(exported_graph(fake_graph), path)
+    with np.load(path, allow_pickle=False) as data:
+        arrays = {name: data[name] for name in data.files}
+    for name in ("ids", "properties", "relationship_properties"):
+        column = StringColumn(arrays.pop(name + "_offsets"), arrays.pop(name + "_data"))
+        arrays[name] = np.asarray(list(column), dtype=str)
+    np.savez_compressed(path, **arrays)
+    assert list(Snapshot.load(path).ids) == ["d1", "Elizabeth I", "1533"]
+
+
+def test_admin_csv_arrays_never_contain_the_delimiter(fake_graph, tmp_path):
+    path = str(tmp_path / "graph.npz")
+    nodes = [dict(NODES[1], properties={"id": "Elizabeth I", "titles": ["Queen; of England", "Queen of Ireland"]})]
+    graph = fake_graph({"RETURN elementId(n)": lambda p: nodes, "RETURN elementId(s)": lambda p: []})
+    export_snapshot(graph, path)
+    command = write_admin_csv(path, str(tmp_path / "import"))
+    assert "--array-delimiter='|'" in command
+    with open(tmp_path / "import" / "nodes_0.csv", encoding="utf-8") as f:
+        header, row = list(csv.reader(f))
+    # The node key is not stored as a property
+    assert header == [":ID", "id", "titles:string[]", ":LABEL"]
+    assert row == ["0", "Elizabeth I", "Queen; of England|Queen of Ireland", "__Entity__|Person"]
+
+
+def test_load_refuses_a_used_database(fake_graph, tmp_path):
+    path = str(tmp_path / "graph.npz")
+    export_snapshot(exported_graph(fake_graph), path)
+    with pytest.raises(ValueError):
+        load_snapshot(fake_graph({"AS used": lambda p: [{"used": True}]}), path)
+
+
+class AlreadyExists(Exception):
+    code = "Neo.ClientError.Schema.EquivalentSchemaRuleAlreadyExists"
+
+
+def test_restore_schema_skips_covered_rules(fake_graph):
+    writer_constraint = dict(ENTITY_CONSTRAINT, name="constraint_entity_id")
+    fulltext = {"name": "entity", "type": "FULLTEXT", "labelsOrTypes": ["__Entity__"], "properties": ["id"],
+                "createStatement": "CREATE FULLTEXT INDEX `entity` ..."}
+
+    def create(params):
+        raise AlreadyExists()
+
+    graph = fake_graph({"SHOW CONSTRAINTS": lambda p: [writer_constraint], "CREATE CONSTRAINT": create})
+    assert restore_schema(graph, [{"kind": "CONSTRAINT", **ENTITY_CONSTRAINT}, {"kind": "INDEX", **fulltext}]) == 1
+    assert [q for q, _ in graph.queries if q.startswith("CREATE")] == [fulltext["createStatement"]]
+    # Equivalent rules under another shape are tolerated too
+    assert restore_schema(graph, [{"kind": "CONSTRAINT", "name": "old", "createStatement": "CREATE CONSTRAINT x"}]) == 0
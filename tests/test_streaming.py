@@ -0,0 +1,79 @@
+import asyncio
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel, GenericFakeChatModel
+from langchain_core.messages import AIMessage
+
+from graphdemo.cli import stream_conversation
+from graphdemo.rag import StreamingRAG
+
+
+class LoopBoundRetriever:
+    """Fails like an async Neo4j driver used from a second event loop."""
+
+    def __init__(self):
+        self.loop = None
+        self.questions = []
+
+    def _check(self):
+        loop = asyncio.get_running_loop()
+        if self.loop is None:
+            self.loop = loop
+        if loop is not self.loop:
+            raise RuntimeError("Future attached to a different loop")
+
+    async def astructured(self, question):
+        self._check()
+        return ""
+
+    async def aretrieve(self, question):
+        self._check()
+        self.questions.append(question)
+        return "Elizabeth I - MEMBER_OF -> House Of Tudor"
+
+
+def answers(*texts):
+    return GenericFakeChatModel(messages=iter([AIMessage(content=t) for t in texts]))
+
+
+def test_invoke_twice_reuses_one_loop():
+    retriever = LoopBoundRetriever()
+    chain = StreamingRAG(retriever, answers("House Of Tudor", "1533"),
+                         condense_llm=FakeListChatModel(responses=["When was Elizabeth I born?"]))
+    assert chain.invoke({"question": "Which house did Elizabeth I belong to?"}) == "House Of Tudor"
+    assert chain.invoke({"question": "When was she born?",
+                         "chat_history": [("Which house did Elizabeth I belong to?", "House Of Tudor")]}) == "1533"
+    assert retriever.questions == ["Which house did Elizabeth I belong to?", "When was Elizabeth I born?"]
+
+
+def test_stream_conversation_asks_questions_in_one_loop(capsys):
+    retriever = LoopBoundRetriever()
+    chain = StreamingRAG(retriever, answers("House Of Tudor", "1533"),
+                         condense_llm=FakeListChatModel(responses=["When was Elizabeth I born?"]))
+    history = asyncio.run(stream_conversation(chain, ["Which house did Elizabeth I belong to?", "When was she born?"]))
+    assert history == [("Which house did Elizabeth I belong to?", "House Of Tudor"), ("When was she born?", "1533")]
+    assert "House Of Tudor" in capsys.readouterr().out
+
+
+class RecordingRetriever(LoopBoundRetriever):
+    def __init__(self):
+        super().__init__()
+        self.structured = []
+
+    async def astructured(self, question):
+        self.structured.append(question)
+        return f"neighborhood of {question}"
+
+    async def aretrieve(self, question):
+        await self.astructured(question)
+        return await super().aretrieve(question)
+
+
+def test_follow_up_is_only_looked_up_once_condensed():
+    history = [("Which house did Elizabeth I belong to?", "House Of Tudor")]
+    retriever = RecordingRetriever()
+    chain = StreamingRAG(retriever, answers("Tudor"), condense_llm=FakeListChatModel(
+        responses=["Who founded the House of Tudor?"]))
+    assert chain.invoke({"question": "Who founded it?", "chat_history": history}) == "Tudor"
+    # No lookup of the raw follow-up runs alongside condensing
+    assert retriever.structured == ["Who founded the House of Tudor?"]
+    assert retriever.questions == ["Who founded the House of Tudor?"]